@@ -0,0 +1,63 @@
+"""Throughput of the Ollama backends against the local fake LLM server.
+
+Each agent gets a full agent prompt over a feed of --posts posts, and its reply goes through
+the same parsing as in a run (engine.events), so prompt size and parse cost are included.
+Run from the repo root:  python -m benchmarks.bench_concurrency
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.bench_group_size import AGENTS_FILE, CURRENT_TIME
+from engine.backends import make_ollama_backend
+from engine.events import events_from_reply
+from engine.fake_llm_server import start_fake_server
+from engine.prompts import render_agent_prompt
+
+
+def make_posts(n=20):
+    return [{"post_id": i, "num_likes": 0, "num_dislikes": 0, "num_comments": 0, "num_shares": 0}
+            for i in range(1, n + 1)]
+
+
+async def run_agents(backend, prompts):
+    """Seconds to get and parse every agent's reply, and the actions parsed."""
+    start = time.perf_counter()
+    tasks = [backend.chat(prompt) for prompt in prompts]
+    actions = 0
+    for finished in asyncio.as_completed(tasks):
+        actions += len(events_from_reply(await finished, 0, 0))
+    return time.perf_counter() - start, actions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=128)
+    parser.add_argument("--posts", type=int, default=20, help="feed size")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake server seconds per request")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--kind", default="async", choices=["async", "executor"])
+    parser.add_argument("--subreddit", default="SecurityCamera")
+    args = parser.parse_args()
+
+    with open(AGENTS_FILE, "r", encoding="utf-8") as f:
+        agents = json.load(f)
+    posts_str = json.dumps(make_posts(args.posts), indent=2)
+    prompts = [render_agent_prompt(agents[i % len(agents)], posts_str, CURRENT_TIME, args.subreddit)
+               for i in range(args.agents)]
+
+    server, url = start_fake_server(latency=args.latency)
+    print(f"Fake server at {url}, latency {args.latency}s, {args.agents} agents, {args.posts} posts, "
+          f"backend={args.kind}")
+    print(f"{'concurrency':>12} {'seconds':>10} {'agents/sec':>12} {'prompt_tok':>11} {'actions':>8}")
+    for limit in args.concurrency:
+        backend = make_ollama_backend("fake", kind=args.kind, host=url, max_concurrency=limit)
+        elapsed, actions = asyncio.run(run_agents(backend, prompts))
+        print(f"{limit:>12} {elapsed:>10.2f} {args.agents / elapsed:>12.1f} "
+              f"{backend.usage['prompt_tokens'] // args.agents:>11} {actions:>8}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Per-class personal feed cost as the corpus grows: full scoring vs. the two-stage FeedPipeline.
+
+For each corpus size, a few timesteps are simulated on synthetic data: actions land on the
+posts (mostly recent ones) through the reducer and every profile class of the online
+agents gets a feed with topic affinity and seen-post filtering:
+- full: FeedRecommender scoring a (classes x posts) matrix
+- pipeline: FeedRecommender with a FeedPipeline (recent, trending, topical and unseen
+  candidate pools, merged and reranked)
+Times are per profile class per timestep (median over timesteps); the pipeline's stages
+are broken down from its telemetry spans.
+
+Run from the repo root:  python -m benchmarks.bench_feed_pipeline
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_agents, synthetic_posts
+from engine.events import ACTION_TYPES, ActionEvent, reduce_timestep
+from engine.profile_classes import profile_class_key
+from engine.telemetry import Telemetry, span, use_telemetry
+from recommendation.fyp import FeedPipeline, FeedRecommender
+from recommendation.post_store import PostStore
+
+START_TIME = datetime(2025, 7, 9, 15, 0, 0)
+STAGES = ("candidates.recent", "candidates.trending", "candidates.topical", "candidates.unseen", "merge", "rerank")
+
+
+def run(posts, agents, args, pipeline):
+    """Median seconds per profile class per timestep, median classes per timestep, and the run's telemetry."""
+    rng = random.Random(args.seed)
+    store = PostStore(posts[:len(posts) - args.steps * args.per_step])
+    recommender = FeedRecommender(store, args.top_k, weight_topic=0.3, exclude_seen=True, agents=agents,
+                                  pipeline=FeedPipeline(store, pool_size=args.pool, span=span) if pipeline else None,
+                                  class_key=profile_class_key)
+    per_class = []
+    class_counts = []
+    with use_telemetry(Telemetry()) as telemetry:
+        for t in range(args.steps):
+            for post in posts[len(store):len(store) + args.per_step]:
+                store.add(post)
+            current_time = datetime.fromisoformat(store.posts[-1]["created_utc"].replace("Z", ""))
+            online = rng.sample(agents, args.online)
+            start = time.perf_counter()
+            feeds = recommender.feeds(online, current_time)
+            classes = len({recommender._class_row(agent) for agent in online})
+            per_class.append((time.perf_counter() - start) / classes)
+            class_counts.append(classes)
+            n = len(store)
+            events = [ActionEvent(t, rng.randrange(len(agents)), store.posts[int(rng.triangular(0, n, n))]["post_id"],
+                                  rng.choice(ACTION_TYPES)) for _ in range(args.actions)]
+            reduce_timestep(store.posts, events, store.index, store)
+    return float(np.median(per_class[1:])), float(np.median(class_counts)), telemetry
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 25000, 50000, 100000])
+    parser.add_argument("--agents", type=int, default=5000)
+    parser.add_argument("--profiles", type=int, default=100)
+    parser.add_argument("--online", type=int, default=500, help="online agents per timestep")
+    parser.add_argument("--steps", type=int, default=6)
+    parser.add_argument("--per-step", type=int, default=200, help="posts released per timestep")
+    parser.add_argument("--actions", type=int, default=2000, help="actions per timestep")
+    parser.add_argument("--span-hours", type=float, default=720)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--pool", type=int, default=200, help="candidates per source")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    agents = synthetic_agents(args.agents, args.profiles, seed=args.seed)
+    print(f"{'posts':>8} {'full_ms':>9} {'pipeline_ms':>12} " + " ".join(f"{s.split('.')[-1]:>9}" for s in STAGES))
+    for size in args.sizes:
+        posts = synthetic_posts(size, START_TIME, args.span_hours, seed=args.seed)
+        full_s, _, _ = run(posts, agents, args, pipeline=False)
+        pipeline_s, classes, telemetry = run(posts, agents, args, pipeline=True)
+        stats = telemetry.summary()
+        stages = " ".join(f"{stats[s]['p50'] * 1000 / classes:>9.3f}" if s in stats else f"{'-':>9}" for s in STAGES)
+        print(f"{size:>8} {full_s * 1000:>9.3f} {pipeline_s * 1000:>12.3f} {stages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Calls, tokens and wall time per timestep for different agent group sizes (G).
+
+G=1 is one call per agent; G=<online agents> is a single call for everyone.
+Run from the repo root:  python -m benchmarks.bench_group_size
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+
+from engine.fake_llm_server import start_fake_server
+from engine.backends import make_ollama_backend
+from engine.events import events_from_reply
+from engine.profile_classes import chunk_agents
+from engine.prompts import render_agent_prompt, render_group_prompt, split_agent_sections
+
+AGENTS_FILE = "agents/agents_SecurityCamera.json"
+POSTS_FILE = "posts/posts_SecurityCamera.json"
+CURRENT_TIME = datetime(2025, 7, 9, 15, 0, 0)
+
+
+async def run_timestep(backend, groups, posts_str, subreddit):
+    async def call(group):
+        if len(group) == 1:
+            reply = await backend.chat(render_agent_prompt(group[0], posts_str, CURRENT_TIME, subreddit))
+            return events_from_reply(reply, group[0]["id"], 0)
+        reply = await backend.chat(render_group_prompt(group, posts_str, CURRENT_TIME, subreddit))
+        events = []
+        for agent, section in zip(group, split_agent_sections(reply, len(group))):
+            events.extend(events_from_reply(section, agent["id"], 0))
+        return events
+
+    events = []
+    start = time.perf_counter()
+    for finished in asyncio.as_completed([call(group) for group in groups]):
+        events.extend(await finished)
+    return time.perf_counter() - start, events
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=320, help="online agents per timestep")
+    parser.add_argument("--group-sizes", type=int, nargs="+", default=[1, 4, 16, 64, 320])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake server seconds per request")
+    parser.add_argument("--tokens-per-sec", type=float, default=400, help="fake server generation speed")
+    parser.add_argument("--subreddit", default="SecurityCamera")
+    args = parser.parse_args()
+
+    with open(AGENTS_FILE, "r", encoding="utf-8") as f:
+        agents = json.load(f)
+    with open(POSTS_FILE, "r", encoding="utf-8") as f:
+        posts = json.load(f)[:20]
+    online_agents = random.Random(0).sample(agents, min(args.agents, len(agents)))
+    posts_str = json.dumps(posts, indent=2)
+
+    server, url = start_fake_server(latency=args.latency, tokens_per_sec=args.tokens_per_sec)
+    print(f"{len(online_agents)} online agents, concurrency {args.concurrency}, "
+          f"fake server latency {args.latency}s + {args.tokens_per_sec} tok/s")
+    print(f"{'G':>5} {'calls':>6} {'prompt_tok':>11} {'compl_tok':>10} {'seconds':>8} {'actions':>8}")
+    for group_size in args.group_sizes:
+        backend = make_ollama_backend("fake", host=url, max_concurrency=args.concurrency)
+        groups = chunk_agents(online_agents, group_size)
+        elapsed, events = asyncio.run(run_timestep(backend, groups, posts_str, args.subreddit))
+        usage = backend.usage
+        print(f"{group_size:>5} {usage['calls']:>6} {usage['prompt_tokens']:>11} "
+              f"{usage['completion_tokens']:>10} {elapsed:>8.2f} {len(events):>8}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
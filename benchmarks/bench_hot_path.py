@@ -0,0 +1,207 @@
+"""Per-stage timings of one simulation timestep at full scale, on synthetic agents and posts.
+
+Stages mirror driver.py: post release, recommend_posts, prompt rendering, reply parsing
+(apply_action_to_post / update_posts_csv_from_llm_output, and the engine's event reducer)
+and output writing. LLM replies come from the fake server's reply generator in-process,
+outside the timed regions, so only the simulation's own work is measured.
+
+Run from the repo root:
+    python -m benchmarks.bench_hot_path --out output/bench/hot_path.json
+    python -m benchmarks.bench_hot_path --compare output/bench/hot_path.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_agents, synthetic_posts
+from engine.events import ActionLog, events_from_reply, reduce_timestep
+from engine.fake_llm_server import generate_reply
+from engine.output_sink import StreamingOutputSink
+from engine.release import ReleaseScheduler
+from engine.prompts import render_agent_prompt
+from posts.analyse_posts import apply_action_to_post, update_posts_csv_from_llm_output
+from recommendation.fyp import recommend_posts
+
+START_TIME = datetime(2025, 7, 9, 15, 0, 0)
+SUBREDDIT = "SecurityCamera"
+AGGREGATE_PROMPT = "You are a decision making body simulating the subreddit.\n"
+
+
+class StageTimer:
+    """Collects wall-clock samples per stage name."""
+
+    def __init__(self):
+        self.samples = {}
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+
+    def summary(self):
+        out = {}
+        for stage, samples in self.samples.items():
+            arr = np.array(samples)
+            out[stage] = {
+                "samples": len(samples),
+                "total_s": float(arr.sum()),
+                "mean_s": float(arr.mean()),
+                "p50_s": float(np.percentile(arr, 50)),
+                "p95_s": float(np.percentile(arr, 95)),
+                "max_s": float(arr.max()),
+            }
+        return out
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    agents = synthetic_agents(args.agents, args.profiles, seed=args.seed)
+    span_hours = args.timesteps * args.timestep_hours
+    post_queue = synthetic_posts(args.posts, START_TIME, span_hours, seed=args.seed)
+    sampler = random.Random(args.seed)
+    reply_rng = random.Random(args.seed)
+    timer = StageTimer()
+    posts, post_index, action_log = [], {}, ActionLog()
+    per_timestep = []
+    with timer("release_index"):
+        releases = ReleaseScheduler(post_queue, START_TIME, timedelta(hours=args.timestep_hours))
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        sink = StreamingOutputSink(os.path.join(tmp, "log.csv"), os.path.join(tmp, "posts.csv"), fsync=args.fsync)
+        for t in range(args.timesteps):
+            current_time = START_TIME + timedelta(hours=t * args.timestep_hours)
+
+            with timer("release"):
+                new_posts = releases.release(t)
+                for p in new_posts:
+                    post_index[p["post_id"]] = len(posts)
+                    posts.append(p)
+
+            online_agents = sampler.sample(agents, max(1, int(args.online_rate * len(agents))))
+            with timer("recommend"):
+                feed = recommend_posts(posts, current_time)
+
+            with timer("render"):
+                posts_str = json.dumps(feed, indent=2)
+                prompts = [render_agent_prompt(a, posts_str, current_time, SUBREDDIT) for a in online_agents]
+
+            replies = [generate_reply(prompt, reply_rng) for prompt in prompts]
+            aggregate_reply = generate_reply(AGGREGATE_PROMPT + posts_str, reply_rng)
+            # the legacy parsers mutate posts in place; give them a copy so every stage sees the same state
+            legacy_posts = [dict(p) for p in posts]
+
+            with timer("parse_apply_action"), contextlib.redirect_stdout(devnull):
+                for reply in replies:
+                    apply_action_to_post(legacy_posts, reply)
+
+            with timer("parse_aggregate"), contextlib.redirect_stdout(devnull):
+                update_posts_csv_from_llm_output(aggregate_reply, legacy_posts)
+
+            with timer("parse_events"), contextlib.redirect_stdout(devnull):
+                batch = []
+                for agent, reply in zip(online_agents, replies):
+                    batch.extend(events_from_reply(reply, agent["id"], t))
+                step_events = action_log.append_batch(t, batch)
+                touched = reduce_timestep(posts, step_events, post_index)
+
+            log_rows = [{"timestep": t, "timestamp": current_time.isoformat(), "agent_id": a["id"],
+                         "username": a["username"], "persona": "", "action_text": reply}
+                        for a, reply in zip(online_agents, replies)]
+            with timer("output"):
+                changed = touched | {p["post_id"] for p in new_posts}
+                sink.write_timestep(t, log_rows, [posts[post_index[i]] for i in sorted(changed, key=post_index.get)])
+                sink.flush()
+
+            per_timestep.append({"timestep": t, "released": len(new_posts), "live_posts": len(posts),
+                                 "online_agents": len(online_agents), "actions": len(step_events)})
+
+        with timer("output_compact"):
+            sink.close()
+
+    return timer.summary(), per_timestep
+
+
+def compare(current, args, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    ignored = {"out", "compare"}
+    differing = sorted(k for k, v in vars(args).items()
+                       if k not in ignored and baseline["meta"]["args"].get(k) != v)
+    if differing:
+        print(f"[!] Baseline was run with different settings: {', '.join(differing)}")
+    print(f"{'stage':>20} {'base mean':>10} {'now mean':>10} {'ratio':>7}")
+    for stage, stats in current.items():
+        base = baseline["stages"].get(stage)
+        if not base:
+            continue
+        ratio = stats["mean_s"] / base["mean_s"] if base["mean_s"] else float("inf")
+        print(f"{stage:>20} {base['mean_s']:>10.4f} {stats['mean_s']:>10.4f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=43000)
+    parser.add_argument("--profiles", type=int, default=100, help="distinct profiles assigned round-robin")
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--timesteps", type=int, default=8)
+    parser.add_argument("--timestep-hours", type=int, default=6)
+    parser.add_argument("--online-rate", type=float, default=0.0075)
+    parser.add_argument("--fsync", action="store_true", help="fsync every timestep, as driver.py does")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stages, per_timestep = run(args)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.agents} agents, {args.posts} posts, {args.timesteps} timesteps ({elapsed:.1f}s)")
+    print(f"{'stage':>20} {'total':>9} {'mean':>9} {'p95':>9} {'max':>9}")
+    for stage, stats in stages.items():
+        print(f"{stage:>20} {stats['total_s']:>9.4f} {stats['mean_s']:>9.4f} "
+              f"{stats['p95_s']:>9.4f} {stats['max_s']:>9.4f}")
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "args": vars(args),
+        },
+        "stages": stages,
+        "timesteps": per_timestep,
+    }
+    if args.compare:
+        compare(stages, args, args.compare)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"📝 Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Memory and speed of per-agent seen-post tracking at full scale: ImpressionStore vs. alternatives.
+
+A run is simulated at the impression level only: posts are released evenly over the
+timesteps, and every timestep a share of the agents comes online and is shown top_k posts,
+mostly recent ones. The same impressions are kept
+- impressions: an ImpressionStore (roaring-style containers over post ordinals)
+- sets: one Python set of post ordinals per agent
+- bitsets: one dense bitset over all posts per agent (computed, not allocated)
+Memory is measured with tracemalloc and build time on a second, untraced build. Membership
+is timed as one timestep of batched filtering (mask() over each online agent's class
+ranking); save/load as one checkpoint.
+
+Run from the repo root:  python -m benchmarks.bench_impressions [--agents 43000 --posts 50000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from recommendation.impressions import ImpressionStore
+
+
+def feeds(args, rng):
+    """Per timestep, (online agent ids, (agents, top_k) ordinals shown to them)."""
+    per_step = args.posts // args.steps
+    for t in range(args.steps):
+        released = (t + 1) * per_step
+        online = rng.choice(args.agents, int(args.online_rate * args.agents), replace=False)
+        recent = released - rng.exponential(args.recent_posts, size=(len(online), args.top_k))
+        yield online, np.clip(recent.astype(np.int64), 0, released - 1)
+
+
+def measure(build):
+    """(result, bytes it holds, seconds to build); timed on a second, untraced build."""
+    tracemalloc.start()
+    held = build()
+    nbytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    start = time.perf_counter()
+    result = build()
+    return result, nbytes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=43000)
+    parser.add_argument("--posts", type=int, default=50000)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--online-rate", type=float, default=0.1)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--recent-posts", type=float, default=2000, help="mean age (in posts) of a shown post")
+    parser.add_argument("--depth", type=int, default=40, help="class ranking length filtered per agent")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    def build_store():
+        store = ImpressionStore()
+        for online, shown in feeds(args, np.random.default_rng(args.seed)):
+            for agent_id, positions in zip(online.tolist(), shown):
+                store.add(agent_id, positions)
+        return store
+
+    def build_sets():
+        sets = {}
+        for online, shown in feeds(args, np.random.default_rng(args.seed)):
+            for agent_id, positions in zip(online.tolist(), shown.tolist()):
+                sets.setdefault(agent_id, set()).update(positions)
+        return sets
+
+    store, store_bytes, store_s = measure(build_store)
+    sets, sets_bytes, sets_s = measure(build_sets)
+    del sets
+    report = store.memory_report()
+    bitset_bytes = args.agents * ((args.posts + 7) // 8)
+    print(f"{args.agents} agents, {args.posts} posts, {args.steps} timesteps: {report['impressions']} impressions "
+          f"({report['impressions'] / report['agents']:.0f} per agent shown anything), "
+          f"{report['array_containers']} array / {report['bitmap_containers']} bitmap containers")
+    print(f"{'':>12} {'MB':>9} {'bytes/imp':>10} {'build_s':>8}")
+    for name, nbytes, seconds in (("impressions", store_bytes, store_s), ("sets", sets_bytes, sets_s),
+                                  ("bitsets", bitset_bytes, None)):
+        print(f"{name:>12} {nbytes / 2**20:>9.1f} {nbytes / report['impressions']:>10.1f} "
+              f"{'-' if seconds is None else f'{seconds:.2f}':>8}")
+
+    rng = random.Random(args.seed)
+    online = rng.sample(range(args.agents), int(args.online_rate * args.agents))
+    ranking = np.arange(args.posts - args.depth, args.posts)
+    start = time.perf_counter()
+    for agent_id in online:
+        store.mask([agent_id], ranking)
+    mask_s = time.perf_counter() - start
+    print(f"membership: {mask_s * 1000:.1f} ms for {len(online)} agents x {args.depth} posts "
+          f"({mask_s / len(online) * 1e6:.1f} us per agent)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "impressions.npz")
+        start = time.perf_counter()
+        store.save(path)
+        save_s = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = ImpressionStore.load(path)
+        load_s = time.perf_counter() - start
+        assert len(loaded) == report["impressions"]
+        print(f"checkpoint: {os.path.getsize(path) / 2**20:.1f} MB, save {save_s:.2f}s, load {load_s:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Exercise the RequestScheduler against a local OpenAI-compatible server that injects 429s.
+
+Run from the repo root:  python -m benchmarks.bench_rate_limiter
+"""
+import argparse
+import time
+
+from openai import OpenAI
+
+from engine.fake_llm_server import start_fake_server
+from engine.rate_limiter import RequestScheduler, estimate_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--error-rate", type=float, default=0.3, help="fraction of requests answered with 429")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--rpm", type=float, default=600)
+    parser.add_argument("--tpm", type=float, default=None)
+    parser.add_argument("--max-retries", type=int, default=6)
+    parser.add_argument("--retry-budget", type=int, default=100)
+    args = parser.parse_args()
+
+    server, url = start_fake_server(latency=0.01, error_rate=args.error_rate, error_status=args.error_status)
+    client = OpenAI(api_key="fake", base_url=f"{url}/v1", max_retries=0)
+    scheduler = RequestScheduler(args.rpm, args.tpm, max_retries=args.max_retries,
+                                 base_delay=0.05, max_delay=1.0, retry_budget=args.retry_budget, seed=0)
+
+    def chat(prompt):
+        response = client.chat.completions.create(
+            model="fake", messages=[{"role": "user", "content": prompt}])
+        return response.choices[0].message.content
+
+    succeeded = 0
+    start = time.perf_counter()
+    for i in range(args.requests):
+        prompt = f"Timestep {i} prompt"
+        try:
+            scheduler.call(chat, prompt, estimated_tokens=estimate_tokens(prompt))
+            succeeded += 1
+        except Exception as e:
+            print(f"❌ Request {i} failed: {e}")
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"{succeeded}/{args.requests} succeeded in {elapsed:.2f}s, server injected {server.errors_sent} errors")
+    for key, value in scheduler.metrics.items():
+        print(f"  {key}: {value:.2f}" if isinstance(value, float) else f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
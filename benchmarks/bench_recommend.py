@@ -0,0 +1,83 @@
+"""recommend_posts vs. PostStore.recommend vs. RankingIndex.recommend at 10k-100k released posts.
+
+For each corpus size, engagement is spread over the posts, then all three are timed on the
+same state: recommend_posts walks the post dicts, PostStore scores its columns in one pass
+and picks the top k with argpartition, RankingIndex walks its two sorted orders until the
+top k are settled. Feeds are checked to be identical. Also timed: building the store (once
+per run), applying a timestep of actions through the reducer, which updates the dicts and
+the store's columns, and the index refresh that re-files the posts those actions touched.
+
+Run from the repo root:  python -m benchmarks.bench_recommend
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_posts
+from engine.events import ACTION_TYPES, ActionEvent, reduce_timestep
+from recommendation.fyp import recommend_posts
+from recommendation.post_store import PostStore
+from recommendation.ranking_index import RankingIndex
+
+START_TIME = datetime(2025, 7, 9, 15, 0, 0)
+
+
+def best_of(repeats, fn):
+    """Best wall time of fn() over repeats runs, and its last result."""
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 25000, 50000, 100000])
+    parser.add_argument("--span-hours", type=float, default=720, help="posts are created over this many hours")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--actions", type=int, default=2000, help="actions per reduced timestep")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    current_time = START_TIME + timedelta(hours=args.span_hours)
+    print(f"{'posts':>8} {'fyp_ms':>9} {'store_ms':>9} {'speedup':>8} {'index_ms':>9} {'build_ms':>9} "
+          f"{'reduce_ms':>10} {'refresh_ms':>11} {'same':>5}")
+    for size in args.sizes:
+        posts = synthetic_posts(size, START_TIME, args.span_hours, seed=args.seed)
+        for post in posts:
+            post["num_likes"] = int(rng.paretovariate(1.5)) - 1
+            post["num_comments"] = int(rng.paretovariate(2)) - 1
+
+        build_s, store = best_of(1, lambda: PostStore(posts))
+        index = RankingIndex(store)
+        fyp_s, feed = best_of(args.repeats, lambda: recommend_posts(posts, current_time, top_k=args.top_k))
+        store_s, store_feed = best_of(args.repeats, lambda: store.recommend(current_time, top_k=args.top_k))
+        index_s, index_feed = best_of(args.repeats, lambda: index.recommend(current_time, top_k=args.top_k))
+        same = [p["post_id"] for p in feed] == [p["post_id"] for p in store_feed] == [p["post_id"] for p in index_feed]
+
+        events = [ActionEvent(0, rng.randrange(1000), posts[int(rng.triangular(0, size, size))]["post_id"],
+                              rng.choice(ACTION_TYPES)) for _ in range(args.actions)]
+        start = time.perf_counter()
+        reduce_timestep(store.posts, events, store.index, store)
+        reduce_s = time.perf_counter() - start
+        start = time.perf_counter()
+        index.refresh()
+        refresh_s = time.perf_counter() - start
+        likes = np.array([p.get("num_likes", 0) for p in posts])
+        same = same and np.array_equal(likes, store.column("num_likes"))
+        same = same and index.recommend(current_time, args.top_k) == store.recommend(current_time, args.top_k)
+
+        print(f"{size:>8} {fyp_s * 1000:>9.2f} {store_s * 1000:>9.2f} {fyp_s / store_s:>7.1f}x {index_s * 1000:>9.2f} "
+              f"{build_s * 1000:>9.1f} {reduce_s * 1000:>10.2f} {refresh_s * 1000:>11.2f} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Throughput of sharded timesteps vs. number of worker processes, on the in-process fake backend.
+
+Every run must merge to exactly the same events as the single-shard run.
+Run from the repo root:  python -m benchmarks.bench_sharding
+"""
+import argparse
+import contextlib
+import os
+import time
+from datetime import datetime
+
+from benchmarks.fixtures import synthetic_agents, synthetic_posts
+from engine.sharding import BackendSpec, ProcessShardExecutor, make_shard_tasks, merge_shard_results, run_shard
+from recommendation.fyp import recommend_posts
+
+CURRENT_TIME = datetime(2025, 7, 9, 15, 0, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=4000, help="online agents in the timestep")
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-mode", default="agent", choices=["agent", "profile", "group"])
+    args = parser.parse_args()
+
+    agents = synthetic_agents(args.agents)
+    posts = synthetic_posts(args.posts, CURRENT_TIME.replace(hour=0), 15)
+    feed = recommend_posts(posts, CURRENT_TIME)
+    spec = BackendSpec("fake", kind="fake")
+
+    print(f"{args.agents} agents, feed of {len(feed)} posts, batch mode {args.batch_mode}, {os.cpu_count()} CPUs")
+    print(f"{'shards':>6} {'seconds':>8} {'agents/s':>9} {'speedup':>8} {'events':>7} {'same':>5}")
+    baseline = None
+    for num_shards in args.shards:
+        tasks = make_shard_tasks(agents, 0, CURRENT_TIME, "SecurityCamera", feed, spec, num_shards,
+                                 batch_mode=args.batch_mode)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if num_shards == 1:
+                start = time.perf_counter()
+                results = [run_shard(task) for task in tasks]
+            else:
+                executor = ProcessShardExecutor(num_shards)
+                start = time.perf_counter()
+                results = executor.run(tasks)
+            elapsed = time.perf_counter() - start
+            if num_shards > 1:
+                executor.close()
+        events, _, _ = merge_shard_results(results)
+        if baseline is None:
+            baseline = (elapsed, events)
+        print(f"{num_shards:>6} {elapsed:>8.2f} {args.agents / elapsed:>9.0f} {baseline[0] / elapsed:>8.2f} "
+              f"{len(events):>7} {str(events == baseline[1]):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Per-call latency and completion tokens: whole replies vs. streamed replies with early cutoff.
+
+The fake server generates at --tokens-per-sec and appends --chatter words of rambling to every
+reply. Streaming stops reading at the end marker (or the close of the JSON object), and with
+--max-actions once an agent has acted that many times and its next action block starts; the
+server then stops generating. Text replies are checked for capped comments that lost their text.
+Run from the repo root:  python -m benchmarks.bench_streaming
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+from benchmarks.bench_group_size import AGENTS_FILE, CURRENT_TIME, POSTS_FILE
+from engine.agent_steps import ask
+from engine.backends import make_ollama_backend
+from engine.fake_llm_server import start_fake_server
+from engine.prompt_builder import make_prompt_builder
+from engine.streaming import BLOCK_START
+from engine.structured_output import ReplyParser
+
+COMMENT_BLOCK = re.compile(r"[^\w\n]*Action[^\w\n]*:\s*comment\b", re.IGNORECASE)
+
+
+def comments_without_text(reply):
+    """Comment blocks in a free-text reply that have no Comment: line."""
+    starts = [m.start() for m in BLOCK_START.finditer(reply)] + [len(reply)]
+    blocks = [reply[a:b] for a, b in zip(starts, starts[1:])]
+    return sum(bool(COMMENT_BLOCK.match(block)) and "Comment:" not in block for block in blocks)
+
+
+async def run_calls(backend, prompts, parser):
+    latencies = []
+    actions = missing = 0
+    for prompt in prompts:
+        start = time.perf_counter()
+        reply = await ask(backend, prompt, parser.schema("agent"), parser.stream())
+        latencies.append(time.perf_counter() - start)
+        actions += sum(action != "ignore" for action, _ in parser.actions(reply))
+        if not parser.structured:
+            missing += comments_without_text(reply)
+    return latencies, actions, missing
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=40)
+    parser.add_argument("--posts", type=int, default=20, help="feed size")
+    parser.add_argument("--tokens-per-sec", type=float, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--chatter", type=int, default=60, help="words of rambling after each reply")
+    parser.add_argument("--rate-scale", type=float, default=10, help="multiplier on agents' activity rates")
+    parser.add_argument("--max-actions", type=int, default=3)
+    parser.add_argument("--structured", action="store_true", help="JSON replies instead of action blocks")
+    parser.add_argument("--subreddit", default="SecurityCamera")
+    args = parser.parse_args()
+
+    with open(AGENTS_FILE, "r", encoding="utf-8") as f:
+        agents = random.Random(0).sample(json.load(f), args.agents)
+    with open(POSTS_FILE, "r", encoding="utf-8") as f:
+        feed = json.load(f)[:args.posts]
+
+    server, url = start_fake_server(latency=args.latency, tokens_per_sec=args.tokens_per_sec,
+                                    rate_scale=args.rate_scale, chatter=args.chatter)
+    print(f"{args.agents} agents, {args.tokens_per_sec} tok/s, {args.chatter} words of chatter, "
+          f"{'JSON' if args.structured else 'text'} replies")
+    print(f"{'mode':>14} {'mean_s':>7} {'p50_s':>7} {'p95_s':>7} {'compl_tok':>10} {'cancelled':>10} {'actions':>8}")
+    modes = [("whole", False, None), ("stream", True, None), ("stream+cap", True, args.max_actions)]
+    for name, stream, max_actions in modes:
+        reply_parser = ReplyParser(args.structured, stream, max_actions)
+        builder = make_prompt_builder(structured=args.structured, end_marker=stream)
+        prompts = [builder.agent(agent, feed, CURRENT_TIME, args.subreddit) for agent in agents]
+        backend = make_ollama_backend("fake", host=url, max_concurrency=1)
+        latencies, actions, missing = asyncio.run(run_calls(backend, prompts, reply_parser))
+        assert not missing, f"{name}: {missing} comment actions were cut before their Comment: line"
+        latencies.sort()
+        print(f"{name:>14} {sum(latencies) / len(latencies):>7.3f} {latencies[len(latencies) // 2]:>7.3f} "
+              f"{latencies[int(0.95 * (len(latencies) - 1))]:>7.3f} {backend.usage['completion_tokens']:>10} "
+              f"{backend.usage['cancelled']:>10} {actions:>8}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
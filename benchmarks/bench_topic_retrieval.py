@@ -0,0 +1,87 @@
+"""Personalized feeds by embedding similarity: full pairwise scoring vs. ANN candidate retrieval.
+
+For each corpus size, posts are embedded once (timed) and thousands of agents (a few hundred
+profile classes) get a feed scored as recommend_posts + WEIGHT_TOPIC * cosine similarity
+of the post to the agent's topic embedding:
+- pairwise: a (classes x posts) similarity matrix and a row-wise top k, as without an index
+- retrieved: FeedRecommender with a TopicRetriever, scoring only each class's nearest posts
+  plus the best posts by the global score
+Recall is the share of the pairwise feeds' posts the retrieved feeds contain.
+
+Without sentence-transformers the posts are embedded as hashed bags of words; without
+pynndescent the retrieval scans every post exactly (and recall is 1).
+
+Run from the repo root:  python -m benchmarks.bench_topic_retrieval [--model all-MiniLM-L6-v2]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_agents, synthetic_posts
+from engine.profile_classes import profile_class_key
+from recommendation.embeddings import EMBEDDING_MODEL, PostEmbedder, TopicRetriever
+from recommendation.fyp import FeedRecommender, rowwise_top_k
+from recommendation.post_store import PostStore
+
+START_TIME = datetime(2025, 7, 9, 15, 0, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 25000, 50000])
+    parser.add_argument("--agents", type=int, default=5000)
+    parser.add_argument("--profiles", type=int, default=300)
+    parser.add_argument("--span-hours", type=float, default=720)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--candidates", type=int, default=200)
+    parser.add_argument("--weight-topic", type=float, default=0.5)
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--cache-dir", default=None, help="embedding cache directory (default: none)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    agents = synthetic_agents(args.agents, args.profiles, seed=args.seed)
+    current_time = START_TIME + timedelta(hours=args.span_hours)
+    embedder = PostEmbedder(args.model)
+    print(f"{'posts':>8} {'embed_s':>8} {'pairwise_ms':>12} {'retrieved_ms':>13} {'speedup':>8} {'recall':>7}")
+    for size in args.sizes:
+        posts = synthetic_posts(size, START_TIME, args.span_hours, seed=args.seed)
+        for post in posts:
+            post["num_likes"] = int(rng.paretovariate(1.5)) - 1
+            post["num_comments"] = int(rng.paretovariate(2)) - 1
+        store = PostStore(posts)
+        retriever = TopicRetriever(store, embedder, args.cache_dir)
+        start = time.perf_counter()
+        retriever.sync()
+        embed_s = time.perf_counter() - start
+
+        recommender = FeedRecommender(store, args.top_k, weight_topic=args.weight_topic, retriever=retriever,
+                                      n_candidates=args.candidates, class_key=profile_class_key)
+        recommender.feeds(agents, current_time)  # embeds the profiles' topics
+        start = time.perf_counter()
+        feeds = recommender.feeds(agents, current_time)
+        retrieved_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = sorted({recommender._class_row(agent) for agent in agents})
+        queries = np.stack([recommender._class_vectors[row] for row in rows])
+        scores = store.scores(current_time)[None, :] + args.weight_topic * (queries @ retriever.index.vectors[:size].T)
+        exact = dict(zip(rows, rowwise_top_k(scores, args.top_k)))
+        pairwise_s = time.perf_counter() - start
+
+        found = total = 0
+        for agent in agents:
+            expected = {store.posts[i]["post_id"] for i in exact[recommender._class_row(agent)].tolist()}
+            found += len(expected & {post["post_id"] for post in feeds[agent["id"]]})
+            total += len(expected)
+        print(f"{size:>8} {embed_s:>8.2f} {pairwise_s * 1000:>12.1f} {retrieved_s * 1000:>13.1f} "
+              f"{pairwise_s / retrieved_s:>7.1f}x {found / total:>7.3f}")
+        retriever.close()
+
+
+if __name__ == "__main__":
+    main()
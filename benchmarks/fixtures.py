@@ -0,0 +1,79 @@
+"""Synthetic agents and posts at arbitrary scale, in the shapes the simulation reads.
+
+Agents follow agents/agent_generator.py: NUM_PROFILES scraped-style profiles assigned
+round-robin, so agents i and i + NUM_PROFILES share everything but id and username.
+Posts follow posts/posts_*.json with created_utc spread over the simulated period.
+"""
+import random
+import string
+from datetime import timedelta
+
+WORDS = ["camera", "battery", "wifi", "doorbell", "night", "vision", "storage", "cloud", "app", "motion",
+         "alert", "install", "wire", "poe", "nvr", "privacy", "neighbor", "police", "package", "thief",
+         "work", "just", "phone", "used", "like", "home", "yard", "garage", "cat", "dog"]
+FLAIRS = [None, "Question", "Discussion", "Recommendation", "Installation"]
+
+
+def synthetic_profiles(num_profiles, rng):
+    profiles = []
+    for _ in range(num_profiles):
+        topics = rng.sample(WORDS, 4)
+        weights = sorted((round(rng.uniform(0.01, 0.06), 4) for _ in topics), reverse=True)
+        profiles.append({
+            "post_freq": None,
+            "topics": dict(zip(topics, weights)),
+            "comment_style": {
+                "avg_length": round(rng.uniform(40, 400), 1),
+                "questions_per_comment": round(rng.uniform(0, 0.5), 2),
+                "exclamations_per_comment": round(rng.uniform(0, 0.3), 2),
+                "avg_sentiment": round(rng.uniform(-0.3, 0.4), 3),
+                "readability": round(rng.uniform(30, 90), 1),
+            },
+            "daily_activity_rate": round(min(1.0, rng.expovariate(1 / 0.15)), 2),
+            "comment_post_ratio": round(rng.uniform(0.5, 1.0), 2),
+        })
+    return profiles
+
+
+def synthetic_agents(num_agents, num_profiles=100, seed=0):
+    rng = random.Random(seed)
+    profiles = synthetic_profiles(num_profiles, rng)
+    agents = []
+    for i in range(num_agents):
+        profile = profiles[i % len(profiles)]
+        agents.append({
+            "id": i,
+            "username": f"user_{i % len(profiles)}_{i}",
+            "role": "user",
+            "post_freq": profile["post_freq"],
+            "topics": dict(profile["topics"]),
+            "comment_style": dict(profile["comment_style"]),
+            "daily_activity_rate": profile["daily_activity_rate"],
+            "comment_post_ratio": profile["comment_post_ratio"],
+        })
+    return agents
+
+
+def synthetic_posts(num_posts, start_time, span_hours, seed=0):
+    """Posts created uniformly over [start_time, start_time + span_hours), in post_id order of creation."""
+    rng = random.Random(seed)
+    offsets = sorted(rng.uniform(0, span_hours * 3600) for _ in range(num_posts))
+    posts = []
+    for i, offset in enumerate(offsets, start=1):
+        created = start_time + timedelta(seconds=int(offset))
+        title = " ".join(rng.choices(WORDS, k=rng.randint(4, 12))).capitalize()
+        slug = "".join(rng.choices(string.ascii_lowercase + string.digits, k=7))
+        posts.append({
+            "post_id": i,
+            "title": title,
+            "author": f"author_{rng.randint(0, 5000)}",
+            "url": f"https://www.reddit.com/r/SecurityCamera/comments/{slug}/{title.lower().replace(' ', '_')[:60]}/",
+            "num_likes": 0,
+            "num_dislikes": 0,
+            "num_comments": 0,
+            "num_shares": 0,
+            "created_utc": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "flair": rng.choice(FLAIRS),
+            "post_text": " ".join(rng.choices(WORDS, k=rng.randint(20, 150))),
+        })
+    return posts
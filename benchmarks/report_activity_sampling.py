@@ -0,0 +1,114 @@
+"""LLM-decided vs. pre-sampled engagement: calls made and engagement rate per impression.
+
+In LLM-decided mode every online agent is prompted and the model chooses whether to act.
+In pre-sampled mode the engine draws Bernoulli(daily_activity_rate) per (agent, post) and
+only agents with a hit are prompted. --rate-scale makes the fake model over- or
+under-engage relative to the profiles, as real models tend to.
+Run from the repo root:  python -m benchmarks.report_activity_sampling
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+
+import numpy as np
+
+from benchmarks.bench_group_size import AGENTS_FILE, CURRENT_TIME, POSTS_FILE
+from engine.activity_sampling import activity_rates, engagement_events, sample_engagements
+from engine.backends import make_ollama_backend
+from engine.events import events_from_reply
+from engine.fake_llm_server import start_fake_server
+from engine.prompts import render_agent_prompt, render_engagement_prompt
+
+
+async def llm_decided(backend, agents, posts, subreddit, t):
+    posts_str = json.dumps(posts, indent=2)
+
+    async def call(agent):
+        reply = await backend.chat(render_agent_prompt(agent, posts_str, CURRENT_TIME, subreddit))
+        return events_from_reply(reply, agent["id"], t)
+
+    return [e for events in await asyncio.gather(*(call(a) for a in agents)) for e in events]
+
+
+async def presampled(backend, agents, posts, subreddit, t, rng):
+    fired = sample_engagements(agents, len(posts), rng)
+
+    async def call(agent, row):
+        fired_posts = [posts[j] for j in np.flatnonzero(row)]
+        posts_str = json.dumps(fired_posts, indent=2)
+        reply = await backend.chat(render_engagement_prompt(agent, posts_str, CURRENT_TIME, subreddit))
+        return engagement_events(reply, agent["id"], [p["post_id"] for p in fired_posts], t)
+
+    calls = [call(a, row) for a, row in zip(agents, fired) if row.any()]
+    return [e for events in await asyncio.gather(*calls) for e in events]
+
+
+def engaged_pairs(events):
+    """(agent, post) pairs with at least one like or comment."""
+    return {(e.agent_id, e.post_id) for e in events if e.action in ("like", "comment")}
+
+
+def z_two_proportions(x1, n1, x2, n2):
+    p = (x1 + x2) / (n1 + n2)
+    se = math.sqrt(p * (1 - p) * (1 / n1 + 1 / n2)) if 0 < p < 1 else float("inf")
+    z = (x1 / n1 - x2 / n2) / se
+    return z, math.erfc(abs(z) / math.sqrt(2))
+
+
+def z_one_proportion(x, n, p0):
+    z = (x / n - p0) / math.sqrt(p0 * (1 - p0) / n)
+    return z, math.erfc(abs(z) / math.sqrt(2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=300, help="online agents per timestep")
+    parser.add_argument("--posts", type=int, default=20, help="feed size")
+    parser.add_argument("--timesteps", type=int, default=5)
+    parser.add_argument("--rate-scale", type=float, default=1.0,
+                        help="fake model engagement relative to daily_activity_rate")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--subreddit", default="SecurityCamera")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(AGENTS_FILE, "r", encoding="utf-8") as f:
+        agents = json.load(f)
+    with open(POSTS_FILE, "r", encoding="utf-8") as f:
+        posts = json.load(f)[:args.posts]
+    picker = random.Random(args.seed)
+    rng = np.random.default_rng(args.seed)
+
+    server, url = start_fake_server(latency=args.latency, rate_scale=args.rate_scale, seed=args.seed)
+    results = {"llm": [0, 0], "presampled": [0, 0]}  # engaged pairs, LLM calls
+    impressions = expected = 0.0
+    for t in range(args.timesteps):
+        online = picker.sample(agents, min(args.agents, len(agents)))
+        impressions += len(online) * len(posts)
+        expected += activity_rates(online).sum() * len(posts)
+        for mode in results:
+            backend = make_ollama_backend("fake", host=url, max_concurrency=args.concurrency)
+            if mode == "llm":
+                events = asyncio.run(llm_decided(backend, online, posts, args.subreddit, t))
+            else:
+                events = asyncio.run(presampled(backend, online, posts, args.subreddit, t, rng))
+            results[mode][0] += len(engaged_pairs(events))
+            results[mode][1] += backend.usage["calls"]
+    server.shutdown()
+
+    p0 = expected / impressions
+    print(f"{args.timesteps} timesteps x {args.agents} agents x {len(posts)} posts, "
+          f"rate scale {args.rate_scale}, expected engagement/impression {p0:.4f}")
+    print(f"{'mode':>11} {'calls':>7} {'engaged':>8} {'rate':>8} {'z vs exp':>9} {'p':>8}")
+    for mode, (engaged, calls) in results.items():
+        z, p = z_one_proportion(engaged, impressions, p0)
+        print(f"{mode:>11} {calls:>7} {engaged:>8} {engaged / impressions:>8.4f} {z:>9.2f} {p:>8.3f}")
+    z, p = z_two_proportions(results["llm"][0], impressions, results["presampled"][0], impressions)
+    print(f"llm vs presampled: z={z:.2f} p={p:.3f}")
+
+
+if __name__ == "__main__":
+    main()
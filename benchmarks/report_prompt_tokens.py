@@ -0,0 +1,106 @@
+"""Tokens per prompt and per-call latency: JSON prompts vs. compact, prefix-first prompts.
+
+Each batch mode forms its calls as engine.agent_steps does: one per agent ("agent"), one per
+profile class of up to --max-agents-per-call agents ("profile", single-agent classes get an
+agent prompt) or one per --group-size agents ("group").
+The fake server charges prompt processing at --prefill-tokens-per-sec, except for the prefix
+shared with the previous prompt (a one-slot KV cache, like Ollama's), so both the shorter
+prompt and the reusable prefix show up in the latency.
+Run from the repo root:  python -m benchmarks.report_prompt_tokens
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from benchmarks.bench_group_size import AGENTS_FILE, CURRENT_TIME, POSTS_FILE
+from engine.backends import make_ollama_backend
+from engine.events import events_from_reply
+from engine.fake_llm_server import start_fake_server
+from engine.profile_classes import chunk_agents, group_by_profile
+from engine.prompt_builder import make_prompt_builder
+from engine.prompts import split_agent_sections
+
+
+def shared_prefix_fraction(prompts):
+    """Mean share of each prompt that repeats the start of the previous one."""
+    shares = [len(os.path.commonprefix([a, b])) / len(b) for a, b in zip(prompts, prompts[1:])]
+    return sum(shares) / len(shares) if shares else 0.0
+
+
+def build_prompts(builder, mode, agents, feed, subreddit, max_agents_per_call, group_size):
+    """(agents of the call, prompt) for every call of one timestep in batch mode."""
+    if mode == "agent":
+        groups = [[agent] for agent in agents]
+    elif mode == "profile":
+        groups = group_by_profile(agents, max_agents_per_call)
+    else:
+        groups = chunk_agents(agents, group_size)
+    calls = []
+    for group in groups:
+        if len(group) == 1:
+            prompt = builder.agent(group[0], feed, CURRENT_TIME, subreddit)
+        elif mode == "profile":
+            prompt = builder.profile_class(group[0], len(group), feed, CURRENT_TIME, subreddit)
+        else:
+            prompt = builder.group(group, feed, CURRENT_TIME, subreddit)
+        calls.append((group, prompt))
+    return calls
+
+
+async def run_calls(backend, calls):
+    latencies = []
+    actions = 0
+    for group, prompt in calls:
+        start = time.perf_counter()
+        reply = await backend.chat(prompt)
+        latencies.append(time.perf_counter() - start)
+        sections = [reply] if len(group) == 1 else split_agent_sections(reply, len(group))
+        actions += sum(len(events_from_reply(section, agent["id"], 0)) for agent, section in zip(group, sections))
+    return latencies, actions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=40)
+    parser.add_argument("--modes", nargs="+", default=["agent", "profile", "group"], help="batch modes")
+    parser.add_argument("--max-agents-per-call", type=int, default=10)
+    parser.add_argument("--group-size", type=int, default=8)
+    parser.add_argument("--posts", type=int, default=20, help="feed size")
+    parser.add_argument("--budget", type=int, default=2000, help="compact prompt token budget")
+    parser.add_argument("--body-chars", type=int, default=280)
+    parser.add_argument("--prefill-tokens-per-sec", type=float, default=2000)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--subreddit", default="SecurityCamera")
+    args = parser.parse_args()
+
+    with open(AGENTS_FILE, "r", encoding="utf-8") as f:
+        agents = random.Random(0).sample(json.load(f), args.agents)
+    with open(POSTS_FILE, "r", encoding="utf-8") as f:
+        feed = json.load(f)[:args.posts]
+
+    server, url = start_fake_server(latency=args.latency, prefill_tokens_per_sec=args.prefill_tokens_per_sec)
+    print(f"{args.agents} agents, feed of {len(feed)} posts, prefill {args.prefill_tokens_per_sec} tok/s, "
+          f"compact budget {args.budget}")
+    print(f"{'mode':>8} {'format':>8} {'calls':>6} {'mean_tok':>9} {'max_tok':>8} {'prefix':>7} {'mean_s':>7} "
+          f"{'p95_s':>7} {'actions':>8}")
+    for mode in args.modes:
+        for prompt_format in ("json", "compact"):
+            builder = make_prompt_builder(prompt_format, args.budget, args.body_chars)
+            calls = build_prompts(builder, mode, agents, feed, args.subreddit, args.max_agents_per_call,
+                                  args.group_size)
+            backend = make_ollama_backend("fake", host=url, max_concurrency=1)
+            latencies, actions = asyncio.run(run_calls(backend, calls))
+            latencies.sort()
+            stats = builder.stats()
+            print(f"{mode:>8} {prompt_format:>8} {len(calls):>6} {stats['mean_tokens']:>9} {stats['max_tokens']:>8} "
+                  f"{shared_prefix_fraction([prompt for _, prompt in calls]):>7.0%} "
+                  f"{sum(latencies) / len(latencies):>7.3f} {latencies[int(0.95 * (len(latencies) - 1))]:>7.3f} "
+                  f"{actions:>8}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,10 @@
+import argparse
 import json
 import os
-import random
-import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime
 
-import pandas as pd
-import ollama  # <-- new import
-from posts.analyse_posts import load_posts, apply_action_to_post
-from recommendation.fyp import recommend_posts
+from engine.simulation import SimulationConfig, simulate
+from engine.telemetry import run_profiled
 
 # ---------- CONFIG ----------
 MODEL_NAME = "llama3"  # <-- Your local Ollama model
@@ -21,130 +18,124 @@ POSTS_OUT_FILE = os.path.join(OUTPUT_DIR, "posts", f"{subreddit}/{MODEL_NAME}/po
 START_TIME = datetime(2025, 7, 9, 15, 0, 0)
 TIMESTEP_HOURS = 6
 NUM_TIMESTEPS = 60
+RELEASE_TIME_SCALE = 1.0  # post time per timestep, in timesteps (>1 replays a long scrape faster)
+REPLAY_SPAN = False  # release the whole post queue, oldest to newest, over NUM_TIMESTEPS
 ONLINE_RATE = 0.0075  # ~0.75% of users online per timestep
+BACKEND_KIND = "async"  # "async" (ollama.AsyncClient) or "executor" (blocking client on a thread pool)
+MAX_CONCURRENCY = 16  # max in-flight LLM requests
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")  # None -> default local Ollama
+SEED = 42  # fixes agent sampling so a cached run replays identically
+CACHE_FILE = os.path.join(OUTPUT_DIR, "cache", "llm_cache.sqlite")
+CACHE_MODE = "readwrite"  # "readwrite", "replay" (offline; a miss is an error) or "off"
+CACHE_MAX_MB = 512
+# How online agents are packed into LLM calls:
+#   "agent"   - one call per agent
+#   "profile" - one call per profile class (agents cloned from the same scraped profile); far fewer
+#               calls and tokens, but the LLM decides for several users at once, so results differ
+#   "group"   - GROUP_SIZE agents per call, from 1 (same as "agent") up to all online agents
+BATCH_MODE = "agent"
+MAX_AGENTS_PER_CALL = 10  # "profile" mode: larger profile classes are split across several calls
+GROUP_SIZE = 8  # "group" mode
+# "llm": every online agent's decisions come from the LLM
+# "surrogate": likes/comments are sampled from the virality classifier x activity rate x topic overlap,
+#              and only LLM_FRACTION of online agents go to the LLM (for real comments and calibration)
+SIMULATION_MODE = "llm"
+LLM_FRACTION = 0.02
+ROUTE_BY_UNCERTAINTY = False  # route the agents most engaged with posts the classifier is unsure about
+VIRALITY_MODEL_DIR = "models/roberta_viral_classifier"
+# "llm" mode only: the engine draws each agent's per-post engagement from daily_activity_rate and
+# calls the LLM just for agents with at least one hit, to write the comment or justify the like
+PRESAMPLE_ACTIVITY = False
+# "json": posts as indented JSON after the profile (original prompts)
+# "compact": a '|' table with truncated bodies, capped at PROMPT_TOKEN_BUDGET, with the instructions and
+#            posts first and the profile last so the backend can reuse the prompt prefix across agents
+PROMPT_FORMAT = "json"
+PROMPT_TOKEN_BUDGET = 2000
+COMPACT_BODY_CHARS = 280
+# Ask for JSON replies constrained to a schema (Ollama `format`) and read them with json.loads; replies
+# that still don't validate fall back to the regex parsers. Parse outcomes are printed at the end of a run.
+STRUCTURED_OUTPUT = False
+# Stream replies and stop generation once an agent has made MAX_ACTIONS_PER_AGENT actions (None = no cap),
+# the reply's end marker arrives or, with STRUCTURED_OUTPUT, its JSON object closes
+STREAM_REPLIES = False
+MAX_ACTIONS_PER_AGENT = None
+# Split each timestep's LLM work across NUM_SHARDS processes (1 = run in this process). With
+# SHARD_QUEUE_ADDRESS ("host:port") shards are instead served on a work queue for workers started
+# anywhere with `python -m engine.sharding worker --address host:port --authkey $SHARD_AUTHKEY`.
+# The queue exchanges pickles: keep SHARD_AUTHKEY secret; it must be set to serve beyond loopback
+NUM_SHARDS = 1
+SHARD_QUEUE_ADDRESS = None
+SHARD_AUTHKEY = os.getenv("SHARD_AUTHKEY")  # None: a random key per run, printed (loopback addresses only)
+# Telemetry: per-stage spans and per-LLM-call records (JSONL), p50/p95/p99 summary at the end.
+# METRICS_PORT serves live Prometheus text at http://127.0.0.1:PORT/metrics (None = off).
+METRICS_FILE = os.path.join(OUTPUT_DIR, "metrics", f"{subreddit}/{MODEL_NAME}_metrics.jsonl")
+METRICS_PORT = None
+# Record every timestep's online agents, feed and LLM replies; rebuild the run's posts and logs
+# from it without an LLM: python -m engine.replay RECORD_FILE --agents AGENTS_FILE --posts POSTS_FILE
+RECORD_FILE = os.path.join(OUTPUT_DIR, "recordings", f"{subreddit}/{MODEL_NAME}_run.jsonl")
+# recommend_posts feed
+TOP_K = 20
+WEIGHT_RECENCY = 0.7
+WEIGHT_POPULARITY = 0.3
+RECENCY_HALF_LIFE_HOURS = 5.0
+# Keep the posts ranked between timesteps and update only the ones actions touched (same feed)
+INCREMENTAL_RANKING = False
+# Personal feeds, computed per profile class: add WEIGHT_TOPIC * topic overlap to the score,
+# and/or leave out posts each agent was already shown (EXCLUDE_SEEN). 0 / False: one shared feed
+WEIGHT_TOPIC = 0.0
+EXCLUDE_SEEN = False
+# With EXCLUDE_SEEN, the posts each agent was shown, saved here at the end of a run and loaded
+# at the start of the next, so a continued run doesn't show them again; None: not kept
+IMPRESSIONS_FILE = None  # e.g. os.path.join(OUTPUT_DIR, "impressions", f"{subreddit}/{MODEL_NAME}.npz")
+# Topic affinity from sentence embeddings (cached in EMBEDDING_CACHE_DIR) instead of keyword overlap,
+# scoring TOPIC_CANDIDATES posts per profile found with an ANN index; None: keyword overlap
+TOPIC_MODEL = None  # e.g. "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_DIR = os.path.join(OUTPUT_DIR, "embeddings")
+TOPIC_CANDIDATES = 200
+# Two-stage feeds: CANDIDATE_POOL posts each from the newest, trending (engagement gained in the
+# last TRENDING_WINDOW_HOURS), topical and not-yet-seen posts, reranked with WEIGHT_TRENDING added
+FEED_PIPELINE = False
+CANDIDATE_POOL = 200
+WEIGHT_TRENDING = 0.3
+TRENDING_WINDOW_HOURS = 24.0
 
 
-# ---------- SETUP ----------
-os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-os.makedirs(os.path.dirname(POSTS_OUT_FILE), exist_ok=True)
-
-with open(POSTS_FILE, "r", encoding="utf-8") as f:
-    post_queue = json.load(f)
-
-with open(AGENTS_FILE, "r", encoding="utf-8") as f:
-    agents = json.load(f)
-
-posts = []
-logs = []
-
-# ---------- LOCAL CHAT FUNCTION ----------
-async def chat_ollama(prompt, model=MODEL_NAME):
-    response = ollama.chat(model=model, messages=[
-        {"role": "system", "content": "You are a helpful Reddit user agent."},
-        {"role": "user", "content": prompt}
-    ])
-    return response["message"]["content"].strip()
-
-async def process_agent(agent, model, posts, current_time, t):
-    try:
-        persona = agent.get("persona", "You are a curious social media user.")
-        agent_profile = {
-            "topics_of_interest": agent.get("topics", []),
-            "comment_style": agent.get("comment_style", "neutral and concise"),
-            "posting_frequency": agent.get("posting_frequency", "occasional"),
-            "daily_activity_rate": agent.get("daily_activity_rate", 0.02),
-        }
-        agent_id = agent["id"]
-        username = agent["username"]
-
-        recommended_posts = recommend_posts(agent, posts, current_time)
-        posts_str = json.dumps(recommended_posts, indent=2)
-
-        prompt = f"""
-{current_time.isoformat()} - Agent browsing environment:
-
-Your user profile:
-- Topics of interest: {', '.join(agent_profile['topics_of_interest'])}
-- Commenting style: {agent_profile['comment_style']}
-- Posting frequency: {agent_profile['posting_frequency']}
-- Daily activity rate: {agent_profile["daily_activity_rate"]}
-You are a Reddit user browsing the r/{subreddit} subreddit.
-
-Your goals are to recognize which posts are likely to go viral, respond realistically, and engage in ways typical of this community.
-
-1. Each post has a field called virality_prediction, with a label (either viral or non-viral). YOUR RESPONSES SHOULD USE THIS AS THE GROUND TRUTH.
-
-2. Don't feel pressured to comment or like on everything. You can ignore posts.
-
-Your probability of reacting is defined by your activity rate (e.g. 0.02 = 2% chance of action per post). Ignore posts that are irrelevant or uninteresting.
-
-3. Your behavior:
-- Be realistic, not overly enthusiastic
-- You may ask clarifying questions
-- Don’t overreact
-
-Posts:
-{posts_str}
-
-🎯 Respond only to posts you decide to act on (optional):
-- Action: [like | comment | ignore]
-- Post_ID: [post id]
-- Reason: [brief explanation]
-- (If comment) Comment: [realistic Reddit-style reply]
-
-ONLY use this format. Do not add anything else.
-"""
-
-        reply = await chat_ollama(prompt, model)
-        updated_posts = apply_action_to_post(posts, reply)
-
-        log_entry = {
-            "timestep": t,
-            "timestamp": current_time.isoformat(),
-            "agent_id": agent_id,
-            "username": username,
-            "persona": persona,
-            "action_text": reply.strip()
-        }
-
-        print(f"🧠 Agent {agent_id} says:\n{reply.strip()}\n")
-        return updated_posts, log_entry
-
-    except Exception as e:
-        print(f"❌ Error for agent {agent_id}: {e}")
-        return posts, None
-
-def get_online_agents(agent_data, rate=ONLINE_RATE):
-    n_total = len(agent_data)
-    n_online = max(1, int(rate * n_total))
-    return random.sample(agent_data, n_online)
-
-# ---------- MAIN SIMULATION LOOP ----------
-async def run_simulation(posts, logs):
-    for t in range(NUM_TIMESTEPS):
-        current_time = START_TIME + timedelta(hours=t * TIMESTEP_HOURS)
-        print(f"\n⏰ Timestep {t} — {current_time}")
-
-        # 1. Post new content scheduled at this time
-        target_prefix = current_time.strftime("%Y-%m-%d")
-        new_posts = [p for p in post_queue if p.get("created_utc", "").startswith(target_prefix)]
-        for p in new_posts:
-            print(f"📢 New post {p['post_id']} published.")
-            posts.append(p)
-
-        # 2. Get online agents and process in parallel
-        online_agents = get_online_agents(agents, ONLINE_RATE)
-        tasks = [process_agent(agent, MODEL_NAME, posts, current_time, t) for agent in online_agents]
-        results = await asyncio.gather(*tasks)
-
-        for updated_posts, log_entry in results:
-            if log_entry:
-                logs.append(log_entry)
-                posts = updated_posts
-
-        pd.DataFrame(logs).to_csv(LOG_FILE, index=False)
-        pd.DataFrame(posts).to_csv(POSTS_OUT_FILE, index=False)
-
 # ---------- RUN ----------
-asyncio.run(run_simulation(posts, logs))
-print("✅ Simulation complete. Logs and posts saved.")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", nargs="?", const=os.path.join(OUTPUT_DIR, "profile.prof"), metavar="FILE",
+                        help="run under cProfile and write the stats to FILE (default output/profile.prof)")
+    args = parser.parse_args()
+
+    with open(POSTS_FILE, "r", encoding="utf-8") as f:
+        post_queue = json.load(f)
+
+    with open(AGENTS_FILE, "r", encoding="utf-8") as f:
+        agents = json.load(f)
+
+    config = SimulationConfig(
+        model_name=MODEL_NAME, subreddit=subreddit, log_file=LOG_FILE, posts_out_file=POSTS_OUT_FILE,
+        start_time=START_TIME, timestep_hours=TIMESTEP_HOURS, num_timesteps=NUM_TIMESTEPS, online_rate=ONLINE_RATE,
+        release_time_scale=RELEASE_TIME_SCALE, replay_span=REPLAY_SPAN,
+        backend_kind=BACKEND_KIND, max_concurrency=MAX_CONCURRENCY, ollama_host=OLLAMA_HOST, seed=SEED,
+        cache_file=CACHE_FILE, cache_mode=CACHE_MODE, cache_max_mb=CACHE_MAX_MB,
+        batch_mode=BATCH_MODE, max_agents_per_call=MAX_AGENTS_PER_CALL, group_size=GROUP_SIZE,
+        simulation_mode=SIMULATION_MODE, llm_fraction=LLM_FRACTION, route_by_uncertainty=ROUTE_BY_UNCERTAINTY,
+        virality_model_dir=VIRALITY_MODEL_DIR, presample_activity=PRESAMPLE_ACTIVITY,
+        prompt_format=PROMPT_FORMAT, prompt_token_budget=PROMPT_TOKEN_BUDGET, compact_body_chars=COMPACT_BODY_CHARS,
+        structured_output=STRUCTURED_OUTPUT, stream_replies=STREAM_REPLIES, max_actions_per_agent=MAX_ACTIONS_PER_AGENT,
+        num_shards=NUM_SHARDS, shard_queue_address=SHARD_QUEUE_ADDRESS, shard_authkey=SHARD_AUTHKEY,
+        metrics_file=METRICS_FILE, metrics_port=METRICS_PORT, record_file=RECORD_FILE,
+        top_k=TOP_K, weight_recency=WEIGHT_RECENCY, weight_popularity=WEIGHT_POPULARITY,
+        recency_half_life_hours=RECENCY_HALF_LIFE_HOURS, incremental_ranking=INCREMENTAL_RANKING,
+        weight_topic=WEIGHT_TOPIC, exclude_seen=EXCLUDE_SEEN, impressions_file=IMPRESSIONS_FILE,
+        topic_model=TOPIC_MODEL,
+        embedding_cache_dir=EMBEDDING_CACHE_DIR, topic_candidates=TOPIC_CANDIDATES,
+        feed_pipeline=FEED_PIPELINE, candidate_pool=CANDIDATE_POOL, weight_trending=WEIGHT_TRENDING,
+        trending_window_hours=TRENDING_WINDOW_HOURS,
+    )
+    if args.profile:
+        run_profiled(args.profile, simulate, config, agents, post_queue)
+    else:
+        simulate(config, agents, post_queue)
+    print("✅ Simulation complete. Logs and posts saved.")
@@ -7,8 +7,14 @@ from datetime import datetime, timedelta
 import pandas as pd
 import google.generativeai as genai
 
-from posts.analyse_posts import load_posts, apply_action_to_post, update_posts_csv_from_llm_output
+from posts.analyse_posts import load_posts, apply_action_to_post, apply_post_counts
 from recommendation.fyp import recommend_posts
+from engine.llm_cache import CacheMiss, ResponseCache, cached_call
+from engine.output_sink import StreamingOutputSink
+from engine.release import ReleaseScheduler
+from engine.prompts import POST_COUNTS_JSON_FORMAT
+from engine.rate_limiter import RequestScheduler, estimate_tokens
+from engine.structured_output import POST_COUNTS_SCHEMA, ReplyParser
 
 # ---------- CONFIG ----------
 # Prefer setting GEMINI_API_KEY in env: export GEMINI_API_KEY="..."
@@ -28,6 +34,15 @@ AGENTS_FILE = "agents/agents.json"
 OUTPUT_DIR = "output"
 LOG_FILE = os.path.join(OUTPUT_DIR, "logs", f"{subreddit}/simulation_log.csv")
 POSTS_OUT_FILE = os.path.join(OUTPUT_DIR, "posts", f"{subreddit}/posts_2.csv")
+CACHE_FILE = os.path.join(OUTPUT_DIR, "cache", "llm_cache.sqlite")
+CACHE_MODE = "readwrite"  # "readwrite", "replay" (offline; a miss is an error) or "off"
+CACHE_MAX_MB = 512
+REQUESTS_PER_MINUTE = 10  # Gemini free tier limits for gemini-2.5-flash
+TOKENS_PER_MINUTE = 250000
+MAX_RETRIES = 5  # per request, on 429 / 5xx
+RETRY_BUDGET = 50  # total retries per run
+SEED = 42  # online-agent sampling and retry jitter
+STRUCTURED_OUTPUT = False  # JSON replies constrained by Gemini's response_schema (regex fallback)
 
 # ---------- SETUP ----------
 
@@ -41,6 +56,7 @@ os.makedirs(os.path.dirname(POSTS_OUT_FILE), exist_ok=True)
 
 with open(POSTS_FILE, "r", encoding="utf-8") as f:
     post_queue = json.load(f)
+releases = ReleaseScheduler(post_queue, START_TIME, timedelta(days=TIMESTEP_DAYS))
 
 with open(AGENTS_FILE, "r", encoding="utf-8") as f:
     agents = json.load(f)
@@ -48,21 +64,57 @@ with open(AGENTS_FILE, "r", encoding="utf-8") as f:
 # Initialize post and log state
 posts = []
 logs = []
+sink = StreamingOutputSink(posts_file=POSTS_OUT_FILE)
+cache = ResponseCache(CACHE_FILE, max_bytes=CACHE_MAX_MB * 1024 * 1024, mode=CACHE_MODE)
+scheduler = RequestScheduler(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE,
+                             max_retries=MAX_RETRIES, retry_budget=RETRY_BUDGET, seed=SEED)
+agent_rng = random.Random(SEED)
 
 def get_online_agents(agent_data, rate=ONLINE_RATE):
     n_total = len(agent_data)
     n_online = max(1, int(rate * n_total))
-    return random.sample(agent_data, n_online)
-model = genai.GenerativeModel(MODEL_NAME)
+    return agent_rng.sample(agent_data, n_online)
+parser = ReplyParser(STRUCTURED_OUTPUT)
+generation_config = None
+if STRUCTURED_OUTPUT:
+    generation_config = {"response_mime_type": "application/json", "response_schema": POST_COUNTS_SCHEMA}
+model = genai.GenerativeModel(MODEL_NAME, generation_config=generation_config)
+response_format = POST_COUNTS_JSON_FORMAT if STRUCTURED_OUTPUT else """Respond in this format:
+
+Timestep 1 (0-6 hours)
+
+Post 96: 10 likes, 8 comments
+
+Post 98: 8 likes, 6 comments
+
+Post 99: 15 likes, 12 comments
+
+Post 95: 1 comment
+
+Post 97: 1 comment
+
+Post 100: 2 comments
+
+Timestep 2 (6-12 hours)
+
+Post 96: 25 likes, 20 comments
+
+Post 98: 18 likes, 15 comments
+
+.....
+
+
+
+ONLY use this format. Do not add anything else."""
 
 # ---------- MAIN SIMULATION LOOP ----------
+failed_timesteps = []  # timesteps whose call still failed after the scheduler's retries
 for t in range(NUM_TIMESTEPS):
     current_time = START_TIME + timedelta(days=t * TIMESTEP_DAYS)
     print(f"\n⏰ Timestep {t} — {current_time}")
 
-    # 1. Post new content scheduled at this time
-    target_prefix = current_time.strftime("%Y-%m-%d")  # matches date and hour (minute can vary)
-    new_posts = [p for p in post_queue if p.get("created_utc", "").startswith(target_prefix)]
+    # 1. Post new content created during this timestep
+    new_posts = releases.release(t)  # created in [current_time, current_time + TIMESTEP_DAYS)
     print(new_posts)
     for p in new_posts:
         print(f"📢 New post {p['post_id']} published.")
@@ -115,47 +167,26 @@ You will simulate 4 timesteps, each being 6 hours. 4 timesteps will add up to be
 Posts:
 {posts_str}
 
-Respond in this format:
-
-Timestep 1 (0-6 hours)
-
-Post 96: 10 likes, 8 comments
-
-Post 98: 8 likes, 6 comments
-
-Post 99: 15 likes, 12 comments
-
-Post 95: 1 comment
-
-Post 97: 1 comment
-
-Post 100: 2 comments
-
-Timestep 2 (6-12 hours)
-
-Post 96: 25 likes, 20 comments
-
-Post 98: 18 likes, 15 comments
-
-.....
-
-
-
-ONLY use this format. Do not add anything else.
+{response_format}
 
 
 
     """
     try:
-        response = model.generate_content(prompt)
-        reply = response.text
+        reply, cache_hit = cached_call(
+            cache, "gemini", MODEL_NAME, {}, prompt,
+            lambda p: scheduler.call(lambda: model.generate_content(p).text, estimated_tokens=estimate_tokens(p)),
+        )
+    except CacheMiss:
+        raise
     except Exception as e:
-        print(f"❌ Error for agent {agent_id}: {e}")
+        print(f"❌ Gemini call failed for timestep {t} after retries, skipping it: {e}")
+        failed_timesteps.append(t)
         continue
     print(reply)
-    posts = update_posts_csv_from_llm_output(reply, posts)
+    posts = apply_post_counts(posts, parser.post_counts(reply))
 #     print(posts)
-    pd.DataFrame(posts).to_csv(POSTS_OUT_FILE, index=False)
+    sink.write_timestep(t, posts=posts)
 
 #
 #     # 2. Each agent observes and acts
@@ -256,6 +287,14 @@ ONLY use this format. Do not add anything else.
 # ---------- SAVE OUTPUT ----------
 
 
+sink.close()
+print(f"🧾 Reply parsing: {parser.stats}")
+print(f"🗄️ LLM cache: {cache.stats()}")
+print(f"🚦 Request scheduler: {scheduler.metrics}")
+cache.close()
+if failed_timesteps:
+    raise SystemExit(f"❌ Simulation incomplete: {len(failed_timesteps)}/{NUM_TIMESTEPS} timesteps failed after retries "
+                     f"and were skipped (t = {failed_timesteps}); their actions are missing from the output.")
 print("✅ Simulation complete. Logs and posts saved.")
 
 
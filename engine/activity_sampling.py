@@ -0,0 +1,35 @@
+import numpy as np
+
+from engine.events import ActionEvent, events_from_actions, events_from_reply
+
+
+def activity_rates(agents, default=0.02):
+    rates = [a.get("daily_activity_rate") for a in agents]
+    return np.clip(np.array([default if r is None else r for r in rates], dtype=float), 0.0, 1.0)
+
+
+def sample_engagements(agents, num_posts, rng):
+    """Bernoulli(daily_activity_rate) draw for every (agent, post) pair, shape (len(agents), num_posts)."""
+    return rng.random((len(agents), num_posts)) < activity_rates(agents)[:, None]
+
+
+def engagement_events(reply, agent_id, fired_post_ids, timestep, parser=None):
+    """Events for an agent's pre-sampled engagements.
+
+    Only posts the engine fired on count, each at most once; a fired post the reply
+    skipped becomes a like, so engagement rates stay those of the draw. parser (a
+    ReplyParser) reads structured replies; without one the regex parser is used.
+    """
+    if parser is None:
+        replied = events_from_reply(reply, agent_id, timestep)
+    else:
+        replied = events_from_actions(parser.actions(reply), agent_id, timestep)
+    events = []
+    remaining = set(fired_post_ids)
+    for event in replied:
+        if event.post_id in remaining and event.action in ("like", "comment"):
+            events.append(event)
+            remaining.discard(event.post_id)
+    events.extend(ActionEvent(timestep, agent_id, post_id, "like")
+                  for post_id in fired_post_ids if post_id in remaining)
+    return events
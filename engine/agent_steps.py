@@ -0,0 +1,192 @@
+import asyncio
+
+from engine.activity_sampling import engagement_events
+from engine.events import events_from_actions
+from engine.llm_cache import CacheMiss
+from engine.profile_classes import chunk_agents_by, group_by_profile
+from engine.prompt_builder import PromptBuilder
+from engine.streaming import read_stream
+from engine.structured_output import ReplyParser
+from engine.telemetry import span
+
+DEFAULT_PROMPTS = PromptBuilder()
+DEFAULT_PARSER = ReplyParser()
+
+
+def make_log_entry(agent, current_time, t, action_text):
+    return {
+        "timestep": t,
+        "timestamp": current_time.isoformat(),
+        "agent_id": agent["id"],
+        "username": agent["username"],
+        "persona": agent.get("persona", "You are a curious social media user."),
+        "action_text": action_text.strip()
+    }
+
+
+async def ask(backend, prompt, schema=None, stream=None):
+    """backend.chat(prompt), constrained to schema when there is one.
+
+    With stream (an ActionStream) the reply is streamed and generation stops as soon as the
+    stream has what it needs.
+    """
+    if stream is not None:
+        return await read_stream(backend, prompt, stream, schema)
+    if schema is None:
+        return await backend.chat(prompt)
+    return await backend.chat(prompt, schema)
+
+
+def agent_reply_results(agent, reply, current_time, t, parser=DEFAULT_PARSER):
+    """(events, log entries) from one agent's reply."""
+    return events_from_actions(parser.actions(reply), agent["id"], t), [make_log_entry(agent, current_time, t, reply)]
+
+
+def group_reply_results(group, reply, current_time, t, parser=DEFAULT_PARSER):
+    """(events, log entries) from a reply speaking for every agent in group."""
+    per_agent, sections = parser.agent_actions(reply, len(group))
+    events = []
+    log_entries = []
+    for agent, actions, section in zip(group, per_agent, sections):
+        events.extend(events_from_actions(actions, agent["id"], t))
+        log_entries.append(make_log_entry(agent, current_time, t, section))
+    return events, log_entries
+
+
+def engagement_reply_results(agent, fired_post_ids, reply, current_time, t, parser=DEFAULT_PARSER):
+    """(events, log entries) from an agent's reply about the posts it was pre-sampled to engage with."""
+    events = engagement_events(reply, agent["id"], fired_post_ids, t, parser)
+    return events, [make_log_entry(agent, current_time, t, reply)]
+
+
+def reply_record(kind, t, agents, reply, post_ids=None):
+    """What engine.replay needs to turn a reply back into (events, log entries)."""
+    record = {"kind": kind, "t": t, "agents": [agent["id"] for agent in agents], "reply": reply}
+    if post_ids is not None:
+        record["posts"] = post_ids
+    return record
+
+
+async def process_agent(agent, backend, feed, current_time, t, subreddit, prompts=DEFAULT_PROMPTS,
+                        parser=DEFAULT_PARSER, replies=None):
+    """One LLM call for one agent; returns (events, log entries).
+
+    replies, if given, is a list the reply is appended to (see reply_record).
+    """
+    try:
+        agent_id = agent["id"]
+        with span("prompt_build", t=t):
+            prompt = prompts.agent(agent, feed, current_time, subreddit)
+
+        with span("llm_call", t=t):
+            reply = await ask(backend, prompt, parser.schema("agent"), parser.stream())
+        with span("parse", t=t):
+            events, log_entries = agent_reply_results(agent, reply, current_time, t, parser)
+        if replies is not None:
+            replies.append(reply_record("agent", t, [agent], reply))
+
+        print(f"🧠 Agent {agent_id} says:\n{reply.strip()}\n")
+        return events, log_entries
+
+    except CacheMiss:
+        raise
+    except Exception as e:
+        print(f"❌ Error for agent {agent.get('id')}: {e}")
+        return [], []
+
+
+async def process_agent_group(group, backend, feed, current_time, t, subreddit, shared_profile=False,
+                              prompts=DEFAULT_PROMPTS, parser=DEFAULT_PARSER, replies=None):
+    """One LLM call for a group of agents; the reply is fanned back out per agent.
+
+    shared_profile=True means every agent in the group is a clone of the same profile.
+    """
+    if len(group) == 1:
+        return await process_agent(group[0], backend, feed, current_time, t, subreddit, prompts, parser, replies)
+    try:
+        with span("prompt_build", t=t):
+            if shared_profile:
+                prompt = prompts.profile_class(group[0], len(group), feed, current_time, subreddit)
+            else:
+                prompt = prompts.group(group, feed, current_time, subreddit)
+
+        with span("llm_call", t=t):
+            reply = await ask(backend, prompt, parser.schema("group"), parser.stream(len(group)))
+        with span("parse", t=t):
+            events, log_entries = group_reply_results(group, reply, current_time, t, parser)
+        if replies is not None:
+            replies.append(reply_record("group", t, group, reply))
+        print(f"🧠 Group of {len(group)} agents ({group[0]['id']}..) says:\n{reply.strip()}\n")
+        return events, log_entries
+
+    except CacheMiss:
+        raise
+    except Exception as e:
+        print(f"❌ Error for agent group starting at {group[0].get('id')}: {e}")
+        return [], []
+
+
+async def process_engagement(agent, fired_posts, backend, current_time, t, subreddit, prompts=DEFAULT_PROMPTS,
+                             parser=DEFAULT_PARSER, replies=None):
+    """LLM call for posts the engine already decided this agent engages with."""
+    try:
+        fired_post_ids = [p["post_id"] for p in fired_posts]
+        with span("prompt_build", t=t):
+            prompt = prompts.engagement(agent, fired_posts, current_time, subreddit)
+        with span("llm_call", t=t):
+            reply = await ask(backend, prompt, parser.schema("agent"), parser.stream(max_actions=len(fired_posts)))
+        with span("parse", t=t):
+            events, log_entries = engagement_reply_results(agent, fired_post_ids, reply, current_time, t, parser)
+        if replies is not None:
+            replies.append(reply_record("engagement", t, [agent], reply, fired_post_ids))
+        print(f"🧠 Agent {agent['id']} engages:\n{reply.strip()}\n")
+        return events, log_entries
+
+    except CacheMiss:
+        raise
+    except Exception as e:
+        print(f"❌ Error for agent {agent.get('id')}: {e}")
+        return [], []
+
+
+def agent_tasks(agents, backend, feed, current_time, t, subreddit, batch_mode="agent",
+                max_agents_per_call=10, group_size=8, fired=None, prompts=DEFAULT_PROMPTS, parser=DEFAULT_PARSER,
+                replies=None, feeds=None):
+    """Coroutines for one timestep's LLM work over agents.
+
+    batch_mode is "agent", "profile" or "group" (see driver.py). fired, if given, holds each
+    agent's pre-sampled feed positions; only agents with a hit are prompted and batch_mode is ignored.
+    parser reads the replies and counts how each was parsed. replies, if given, collects a
+    reply_record for every reply that was parsed (in completion order).
+
+    feeds, if given, maps agent id -> that agent's feed (see recommendation.fyp.FeedRecommender)
+    and overrides feed; "group" mode then only groups agents that share a feed.
+    """
+    def feed_of(agent):
+        return feed if feeds is None else feeds[agent["id"]]
+
+    if fired is not None:
+        return [process_engagement(agent, [feed_of(agent)[j] for j in positions], backend, current_time, t,
+                                   subreddit, prompts, parser, replies)
+                for agent, positions in zip(agents, fired) if len(positions)]
+    if batch_mode == "profile":
+        return [process_agent_group(group, backend, feed_of(group[0]), current_time, t, subreddit, True, prompts,
+                                    parser, replies)
+                for group in group_by_profile(agents, max_agents_per_call)]
+    if batch_mode == "group":
+        return [process_agent_group(group, backend, feed_of(group[0]), current_time, t, subreddit, False, prompts,
+                                    parser, replies)
+                for group in chunk_agents_by(agents, group_size, lambda agent: id(feed_of(agent)))]
+    return [process_agent(agent, backend, feed_of(agent), current_time, t, subreddit, prompts, parser, replies)
+            for agent in agents]
+
+
+async def collect(tasks):
+    """Await tasks as they complete; returns (events, log entries) in completion order."""
+    events = []
+    log_entries = []
+    for finished in asyncio.as_completed(tasks):
+        task_events, task_logs = await finished
+        events.extend(task_events)
+        log_entries.extend(task_logs)
+    return events, log_entries
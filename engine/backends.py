@@ -0,0 +1,207 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ollama
+
+from engine.fake_llm_server import approx_tokens, generate_reply
+from engine.telemetry import current_telemetry
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful Reddit user agent."
+
+
+def new_usage():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cancelled": 0}
+
+
+_call_tokens = threading.local()  # (prompt, completion) of the last response recorded on this thread
+
+
+def record_usage(usage, response):
+    """Accumulate Ollama token counts (prompt_eval_count / eval_count) from a chat response."""
+    prompt_tokens = response.get("prompt_eval_count") or 0
+    completion_tokens = response.get("eval_count") or 0
+    usage["calls"] += 1
+    usage["prompt_tokens"] += prompt_tokens
+    usage["completion_tokens"] += completion_tokens
+    _call_tokens.value = (prompt_tokens, completion_tokens)
+    return prompt_tokens, completion_tokens
+
+
+class AsyncOllamaBackend:
+    """Non-blocking Ollama chat backend with a cap on in-flight requests."""
+
+    def __init__(self, model, host=None, max_concurrency=16, system_prompt=DEFAULT_SYSTEM_PROMPT):
+        self.model = model
+        self.system_prompt = system_prompt
+        self.max_concurrency = max_concurrency
+        self.usage = new_usage()
+        self.client = ollama.AsyncClient(host=host)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def chat(self, prompt, schema=None):
+        """Reply to prompt; with a JSON schema, Ollama constrains the reply to it (`format`)."""
+        queued = time.perf_counter()
+        async with self._semaphore:
+            sent = time.perf_counter()
+            response = await self.client.chat(model=self.model, messages=[
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": prompt}
+            ], **({"format": schema} if schema else {}))
+        tokens = record_usage(self.usage, response)
+        current_telemetry().record_call(time.perf_counter() - queued, sent - queued, None, *tokens)
+        return response["message"]["content"].strip()
+
+    async def chat_stream(self, prompt, schema=None):
+        """Yield the reply as it is generated. Closing the generator early drops the connection,
+        which makes Ollama stop generating; the tokens streamed so far are counted as usage."""
+        queued = time.perf_counter()
+        async with self._semaphore:
+            sent = time.perf_counter()
+            stream = await self.client.chat(model=self.model, messages=[
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": prompt}
+            ], stream=True, **({"format": schema} if schema else {}))
+            pieces = 0
+            first = None
+            tokens = None
+            try:
+                async for chunk in stream:
+                    if first is None:
+                        first = time.perf_counter()
+                    if chunk.get("done"):
+                        tokens = record_usage(self.usage, chunk)
+                    pieces += 1
+                    yield chunk["message"]["content"]
+            finally:
+                if tokens is None:
+                    tokens = (None, pieces)  # Ollama only reports prompt_eval_count at the end
+                    self.usage["calls"] += 1
+                    self.usage["completion_tokens"] += pieces
+                    self.usage["cancelled"] += 1
+                    await stream.aclose()
+                current_telemetry().record_call(time.perf_counter() - queued, sent - queued,
+                                                None if first is None else first - sent, *tokens)
+
+
+class ExecutorBackend:
+    """Runs a blocking chat function on a thread pool so it can be awaited.
+
+    Useful for SDKs without an async client; the pool size is the concurrency limit. A
+    schema, if given, is passed on as chat_fn(prompt, schema). Token counts reach telemetry
+    when chat_fn calls record_usage.
+    """
+
+    def __init__(self, chat_fn, max_concurrency=16):
+        self.chat_fn = chat_fn
+        self.max_concurrency = max_concurrency
+        self.usage = new_usage()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def chat(self, prompt, schema=None):
+        loop = asyncio.get_running_loop()
+        args = (prompt,) if schema is None else (prompt, schema)
+        queued = time.perf_counter()
+        call = {}
+
+        def run():
+            call["sent"] = time.perf_counter()
+            _call_tokens.value = (0, 0)
+            try:
+                return self.chat_fn(*args)
+            finally:
+                call["tokens"] = _call_tokens.value
+
+        try:
+            return await loop.run_in_executor(self._executor, run)
+        finally:
+            if "sent" in call:
+                current_telemetry().record_call(time.perf_counter() - queued, call["sent"] - queued, None,
+                                                *call.get("tokens", (0, 0)))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class FakeBackend:
+    """In-process fake LLM: replies come from the fake server's generator, with no network.
+
+    Same prompt and seed give the same reply as engine.fake_llm_server, so runs are CPU-bound
+    and reproducible.
+    """
+
+    def __init__(self, seed=0, system_prompt=DEFAULT_SYSTEM_PROMPT, **reply_options):
+        self.seed = seed
+        self.system_prompt = system_prompt
+        self.reply_options = reply_options
+        self.usage = new_usage()
+
+    def reply(self, prompt, schema):
+        """(reply, prompt tokens)"""
+        prompt = f"{self.system_prompt}\n{prompt}"
+        prompt_tokens = approx_tokens(prompt)
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += prompt_tokens
+        reply = generate_reply(prompt, random.Random(f"{self.seed}:{prompt}"), structured=schema is not None,
+                               **self.reply_options)
+        return reply, prompt_tokens
+
+    async def chat(self, prompt, schema=None):
+        start = time.perf_counter()
+        reply, prompt_tokens = self.reply(prompt, schema)
+        completion_tokens = approx_tokens(reply)
+        self.usage["completion_tokens"] += completion_tokens
+        current_telemetry().record_call(time.perf_counter() - start, 0.0, None, prompt_tokens, completion_tokens)
+        return reply.strip()
+
+    async def chat_stream(self, prompt, schema=None):
+        """The reply in word-sized pieces, as the fake server streams it; only pieces read are counted."""
+        start = time.perf_counter()
+        reply, prompt_tokens = self.reply(prompt, schema)
+        pieces = re.findall(r"\S+\s*|\s+", reply.strip())
+        read = []
+        first = None
+        try:
+            for piece in pieces:
+                if first is None:
+                    first = time.perf_counter()
+                read.append(piece)
+                yield piece
+        finally:
+            completion_tokens = approx_tokens("".join(read))
+            self.usage["completion_tokens"] += completion_tokens
+            if len(read) < len(pieces):
+                self.usage["cancelled"] += 1
+            current_telemetry().record_call(time.perf_counter() - start, 0.0, None if first is None else first - start,
+                                            prompt_tokens, completion_tokens)
+
+
+def make_ollama_backend(model, kind="async", host=None, max_concurrency=16,
+                        system_prompt=DEFAULT_SYSTEM_PROMPT):
+    """Build an Ollama backend: "async" uses ollama.AsyncClient, "executor" wraps ollama.Client.
+
+    "fake" ignores model and host and answers in-process (see FakeBackend).
+    """
+    if kind == "async":
+        return AsyncOllamaBackend(model, host=host, max_concurrency=max_concurrency,
+                                  system_prompt=system_prompt)
+    if kind == "executor":
+        client = ollama.Client(host=host)
+        backend = ExecutorBackend(None, max_concurrency=max_concurrency)
+
+        def chat(prompt, schema=None):
+            response = client.chat(model=model, messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ], **({"format": schema} if schema else {}))
+            record_usage(backend.usage, response)
+            return response["message"]["content"].strip()
+
+        backend.chat_fn = chat
+        return backend
+    if kind == "fake":
+        return FakeBackend(system_prompt=system_prompt)
+    raise ValueError(f"Unknown backend kind: {kind}")
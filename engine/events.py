@@ -0,0 +1,106 @@
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+from posts.analyse_posts import parse_actions
+
+# Action type -> post counter it increments. Anything else (e.g. "ignore") is not an event.
+ACTION_COUNTERS = {
+    "like": "num_likes",
+    "comment": "num_comments",
+    "share": "num_shares",
+    "dislike": "num_dislikes",
+}
+ACTION_TYPES = tuple(ACTION_COUNTERS)
+
+
+@dataclass(frozen=True)
+class ActionEvent:
+    timestep: int
+    agent_id: int
+    post_id: int
+    action: str
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def events_from_actions(actions, agent_id, timestep):
+    """Typed action events from parsed (action, post_id) pairs."""
+    return [ActionEvent(timestep, agent_id, post_id, action)
+            for action, post_id in actions
+            if action in ACTION_COUNTERS]
+
+
+def events_from_reply(reply, agent_id, timestep):
+    """Turn one agent's LLM reply into typed action events."""
+    return events_from_actions(parse_actions(reply), agent_id, timestep)
+
+
+def event_sort_key(event):
+    return event.timestep, event.agent_id, event.post_id, ACTION_TYPES.index(event.action)
+
+
+class ActionLog:
+    """Append-only log of action events, stored per timestep in a canonical order.
+
+    Batches are sorted on append, so the log (and anything derived from it) does not
+    depend on the order in which agent calls happened to finish.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._timestep_ranges = {}
+
+    def append_batch(self, timestep, events):
+        batch = sorted(events, key=event_sort_key)
+        start = len(self.events)
+        self.events.extend(batch)
+        self._timestep_ranges[timestep] = (start, len(self.events))
+        return batch
+
+    def timestep(self, timestep):
+        start, end = self._timestep_ranges.get(timestep, (0, 0))
+        return self.events[start:end]
+
+    def __len__(self):
+        return len(self.events)
+
+
+def reduce_timestep(posts, events, post_index, store=None):
+    """Apply a timestep's events to posts in one pass.
+
+    post_index maps post_id -> position in posts and is kept up to date by the caller
+    as posts are released, so the cost is O(actions) rather than a scan per action.
+    store, a recommendation.post_store.PostStore over the same posts, gets the same
+    increments on its counter columns. Returns the set of post_ids whose counters changed.
+    """
+    if not events:
+        return set()
+
+    rows = []
+    cols = []
+    for event in events:
+        row = post_index.get(event.post_id)
+        if row is None:
+            print(f"[!] Post {event.post_id} not found.")
+            continue
+        rows.append(row)
+        cols.append(ACTION_TYPES.index(event.action))
+    if not rows:
+        return set()
+
+    codes = np.asarray(rows, dtype=np.int64) * len(ACTION_TYPES) + np.asarray(cols, dtype=np.int64)
+    unique_codes, counts = np.unique(codes, return_counts=True)
+    if store is not None:
+        code_rows, code_cols = np.divmod(unique_codes, len(ACTION_TYPES))
+        store.increment(code_rows, [ACTION_COUNTERS[ACTION_TYPES[col]] for col in code_cols.tolist()], counts)
+
+    touched = set()
+    for code, count in zip(unique_codes.tolist(), counts.tolist()):
+        row, col = divmod(code, len(ACTION_TYPES))
+        post = posts[row]
+        field = ACTION_COUNTERS[ACTION_TYPES[col]]
+        post[field] = post.get(field, 0) + count
+        touched.add(post["post_id"])
+    return touched
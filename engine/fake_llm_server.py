@@ -0,0 +1,328 @@
+"""Local stand-in for Ollama / OpenAI-compatible chat endpoints, for offline load tests.
+
+Speaks POST /api/chat (Ollama) and POST /v1/chat/completions (OpenAI, used by OpenRouter),
+streaming and non-streaming. Replies are generated from the prompt itself:
+
+- per-agent browsing prompts get "- Action: / - Post_ID:" blocks (parsed by apply_action_to_post),
+  one block per agent for group prompts ("Agent 1 to Agent N"), with each post acted on with
+  probability equal to that agent's daily activity rate
+- pre-sampled engagement prompts (ENGAGE_ALL_MARKER) get a like or comment for every post
+- whole-subreddit prompts ("decision making body") get "Post N: X likes, Y comments" lines
+  (parsed by update_posts_csv_from_llm_output)
+
+Requests that ask for structured output (Ollama `format`, OpenAI `response_format`) get the same
+decisions as JSON in the shapes of engine.structured_output. Agent replies end with END_MARKER
+when the prompt asks for it, and `chatter` appends that many words of rambling after the reply,
+as chatty models do (engine.streaming stops reading before it).
+
+Run standalone:  python -m engine.fake_llm_server --port 11434 --latency 0.2 --tokens-per-sec 50
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from engine.prompts import END_INSTRUCTION, END_MARKER, ENGAGE_ALL_MARKER
+
+POST_ID_PATTERN = re.compile(r'"post_id":\s*(\d+)')
+COMPACT_ROW_PATTERN = re.compile(r"^(\d+) \| ", re.MULTILINE)  # render_posts_compact rows
+RATE_PATTERN = re.compile(r"Daily activity rate:\s*([0-9.]+)")
+GROUP_PATTERN = re.compile(r"Agent 1 to Agent (\d+)")
+AGENT_PROFILE_PATTERN = re.compile(r"Agent (\d+) profile:")
+AGGREGATE_MARKERS = ("decision making body", "Timestep 1 (0-6 hours)")
+
+CHATTER = "Let me know if you would like me to go through the other posts in more detail.".split()
+COMMENTS = [
+    "Have you checked whether it supports RTSP? That usually decides it for me.",
+    "I had the same issue, a firmware update fixed it.",
+    "What's your budget? That changes the answer a lot.",
+    "Following, I'm curious too.",
+    "Local storage all the way, no subscriptions.",
+]
+
+
+def approx_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def parse_prompt_posts(prompt):
+    """Posts listed in the prompt as a JSON array after 'Posts:', or as compact table rows
+    (falls back to bare post ids)."""
+    start = prompt.find("[", prompt.find("Posts:"))
+    if start != -1:
+        try:
+            posts, _ = json.JSONDecoder().raw_decode(prompt[start:])
+            if isinstance(posts, list):
+                return [p for p in posts if isinstance(p, dict) and "post_id" in p]
+        except json.JSONDecodeError:
+            pass
+    ids = POST_ID_PATTERN.findall(prompt) or COMPACT_ROW_PATTERN.findall(prompt)
+    return [{"post_id": int(i)} for i in dict.fromkeys(ids)]
+
+
+def agent_rates(prompt, default_rate):
+    """Activity rate of every agent the prompt speaks for, in 'Agent k' order."""
+    rates = [min(1.0, float(r)) for r in RATE_PATTERN.findall(prompt)]
+    group = GROUP_PATTERN.search(prompt)
+    if not group:
+        return [rates[0] if rates else default_rate]
+    n = int(group.group(1))
+    if AGENT_PROFILE_PATTERN.search(prompt) and len(rates) >= n:
+        return rates[:n]  # group prompt: one profile per agent
+    return [rates[0] if rates else default_rate] * n  # profile-class prompt: shared profile
+
+
+def agent_actions(rng, post_ids, rate, comment_fraction):
+    actions = []
+    for post_id in post_ids:
+        if rng.random() >= rate:
+            continue
+        if rng.random() < comment_fraction:
+            actions.append({"action": "comment", "post_id": post_id, "reason": "I have relevant experience.",
+                            "comment": rng.choice(COMMENTS)})
+        else:
+            actions.append({"action": "like", "post_id": post_id, "reason": "Relevant to my interests."})
+    return actions
+
+
+def agent_block(actions):
+    lines = []
+    for a in actions:
+        lines += [f"- Action: {a['action']}", f"- Post_ID: {a['post_id']}", f"- Reason: {a['reason']}"]
+        if "comment" in a:
+            lines.append(f"- Comment: {a['comment']}")
+    return "\n".join(lines)
+
+
+def add_chatter(reply, prompt, chatter=0):
+    if END_INSTRUCTION in prompt:
+        reply = f"{reply}\n{END_MARKER}"
+    if chatter:
+        reply += "\n\n" + " ".join(CHATTER[i % len(CHATTER)] for i in range(chatter))
+    return reply
+
+
+def generate_reply(prompt, rng, default_rate=0.02, rate_scale=1.0, comment_fraction=0.3, structured=False,
+                   chatter=0):
+    posts = parse_prompt_posts(prompt)
+    if any(marker in prompt for marker in AGGREGATE_MARKERS):
+        counts = []
+        for post in posts:
+            likes = post.get("num_likes", 0) + rng.randint(0, 5)
+            comments = post.get("num_comments", 0) + rng.randint(0, 3)
+            counts.append({"post_id": post["post_id"], "likes": likes, "comments": comments})
+        if structured:
+            return json.dumps({"posts": counts})
+        return "Timestep 1 (0-6 hours)\n\n" + "\n\n".join(
+            f"Post {c['post_id']}: {c['likes']} likes, {c['comments']} comments" for c in counts)
+
+    post_ids = [post["post_id"] for post in posts]
+    if ENGAGE_ALL_MARKER in prompt:
+        rates = [1.0]
+    else:
+        rates = [min(1.0, rate * rate_scale) for rate in agent_rates(prompt, default_rate)]
+    if ENGAGE_ALL_MARKER in prompt or not GROUP_PATTERN.search(prompt):
+        actions = agent_actions(rng, post_ids, rates[0], comment_fraction)
+        if structured:
+            return add_chatter(json.dumps({"actions": actions}), "", chatter)
+        reply = agent_block(actions) or ("" if ENGAGE_ALL_MARKER in prompt else "- Action: ignore")
+        return add_chatter(reply, prompt, chatter)
+    per_agent = [agent_actions(rng, post_ids, rate, comment_fraction) for rate in rates]
+    if structured:
+        return add_chatter(json.dumps({"agents": [{"agent": k, "actions": actions}
+                                                  for k, actions in enumerate(per_agent, start=1)]}), "", chatter)
+    return add_chatter("\n\n".join(f"Agent {k}:\n{agent_block(actions)}".rstrip()
+                                    for k, actions in enumerate(per_agent, start=1)), prompt, chatter)
+
+
+def make_handler(config):
+    error_rng = random.Random(config["seed"])
+
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            self.server.requests_served += 1
+            if config["error_rate"] and error_rng.random() < config["error_rate"]:
+                self.server.errors_sent += 1
+                headers = {}
+                if config["retry_after"] is not None:
+                    headers["Retry-After"] = str(config["retry_after"])
+                return self._send_json(config["error_status"],
+                                       {"error": {"message": "injected error", "code": config["error_status"]}},
+                                       headers)
+
+            prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+            rng = random.Random(f"{config['seed']}:{prompt}")  # same prompt -> same reply
+            structured = bool(request.get("format") or request.get("response_format"))
+            reply = generate_reply(prompt, rng, config["default_rate"], config["rate_scale"],
+                                   config["comment_fraction"], structured, config["chatter"])
+            usage = (approx_tokens(prompt), approx_tokens(reply))
+            openai_api = self.path.startswith("/v1/chat/completions")
+            stream = request.get("stream", not openai_api)  # Ollama streams unless told otherwise
+
+            time.sleep(config["latency"] + self.server.prefill_seconds(prompt))
+            if stream:
+                self._stream(request, reply, usage, openai_api)
+            else:
+                if config["tokens_per_sec"]:
+                    time.sleep(usage[1] / config["tokens_per_sec"])
+                self._send_json(200, self._body(request, reply, usage, openai_api))
+
+        def _body(self, request, reply, usage, openai_api):
+            model = request.get("model", "fake")
+            if openai_api:
+                return {
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": 0, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": reply}}],
+                    "usage": {"prompt_tokens": usage[0], "completion_tokens": usage[1],
+                              "total_tokens": sum(usage)},
+                }
+            return {
+                "model": model, "created_at": "2025-07-09T00:00:00Z",
+                "message": {"role": "assistant", "content": reply}, "done": True,
+                "prompt_eval_count": usage[0], "eval_count": usage[1],
+            }
+
+        def _stream(self, request, reply, usage, openai_api):
+            model = request.get("model", "fake")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream" if openai_api else "application/x-ndjson")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            pieces = re.findall(r"\S+\s*|\s+", reply)
+            delay = 1.0 / config["tokens_per_sec"] if config["tokens_per_sec"] else 0
+            try:
+                for piece in pieces:
+                    if delay:
+                        time.sleep(delay)
+                    if openai_api:
+                        chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0,
+                                 "model": model, "choices": [{"index": 0, "delta": {"content": piece},
+                                                              "finish_reason": None}]}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    else:
+                        chunk = {"model": model, "created_at": "2025-07-09T00:00:00Z",
+                                 "message": {"role": "assistant", "content": piece}, "done": False}
+                        self.wfile.write((json.dumps(chunk) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                if openai_api:
+                    done = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                    self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                else:
+                    done = {"model": model, "created_at": "2025-07-09T00:00:00Z",
+                            "message": {"role": "assistant", "content": ""}, "done": True,
+                            "prompt_eval_count": usage[0], "eval_count": usage[1]}
+                    self.wfile.write((json.dumps(done) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                self.server.cancelled_streams += 1  # client stopped reading early
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeLLMHandler
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, config):
+        super().__init__(address, make_handler(config))
+        self.config = config
+        self.requests_served = 0
+        self.errors_sent = 0
+        self.cancelled_streams = 0
+        self.prefix_cached_tokens = 0
+        self._last_prompt = ""
+        self._prefix_lock = threading.Lock()
+
+    def prefill_seconds(self, prompt):
+        """Prompt processing time at prefill_tokens_per_sec, minus the prefix shared with the
+        previous prompt (a one-slot KV cache, as Ollama keeps per model)."""
+        rate = self.config.get("prefill_tokens_per_sec")
+        if not rate:
+            return 0.0
+        with self._prefix_lock:
+            shared = len(os.path.commonprefix([self._last_prompt, prompt]))
+            self._last_prompt = prompt
+        cached = shared // 4
+        self.prefix_cached_tokens += cached
+        return max(0, approx_tokens(prompt) - cached) / rate
+
+
+def start_fake_server(latency=0.2, tokens_per_sec=None, error_rate=0.0, error_status=429, retry_after=None,
+                      default_rate=0.02, rate_scale=1.0, comment_fraction=0.3, seed=0,
+                      prefill_tokens_per_sec=None, chatter=0, host="127.0.0.1", port=0):
+    """Start the fake server on a background thread; returns (server, base_url).
+
+    latency: seconds before the first token; tokens_per_sec: generation speed (None = instant)
+    error_rate / error_status / retry_after: inject failures (e.g. 429 with Retry-After)
+    default_rate: action probability when the prompt carries no activity rate
+    rate_scale: multiplier on each agent's daily_activity_rate
+    prefill_tokens_per_sec: prompt processing speed (None = free); a prefix shared with the
+        previous prompt is not charged again
+    chatter: words of rambling appended to every agent reply
+    """
+    config = {
+        "latency": latency, "tokens_per_sec": tokens_per_sec, "error_rate": error_rate,
+        "error_status": error_status, "retry_after": retry_after, "default_rate": default_rate,
+        "rate_scale": rate_scale, "comment_fraction": comment_fraction, "seed": seed,
+        "prefill_tokens_per_sec": prefill_tokens_per_sec, "chatter": chatter,
+    }
+    server = FakeLLMServer((host, port), config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-sec", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--default-rate", type=float, default=0.02)
+    parser.add_argument("--rate-scale", type=float, default=1.0)
+    parser.add_argument("--comment-fraction", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefill-tokens-per-sec", type=float, default=None)
+    parser.add_argument("--chatter", type=int, default=0)
+    args = parser.parse_args()
+
+    server, url = start_fake_server(args.latency, args.tokens_per_sec, args.error_rate, args.error_status,
+                                    args.retry_after, args.default_rate, args.rate_scale,
+                                    args.comment_fraction, args.seed, args.prefill_tokens_per_sec,
+                                    args.chatter, args.host, args.port)
+    print(f"🤖 Fake LLM server on {url} (Ollama: OLLAMA_HOST={url}, OpenAI: base_url={url}/v1)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from engine.streaming import open_stream
+
+CACHE_MODES = ("readwrite", "replay", "off")
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+def make_key(backend, model, params, prompt):
+    payload = json.dumps({"backend": backend, "model": model, "params": params, "prompt": prompt},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Persistent LLM response cache (SQLite) with size-bounded LRU eviction.
+
+    Modes:
+    - "readwrite": serve hits, call the backend on misses and store the result
+    - "replay": read-only; a miss raises CacheMiss instead of calling the backend
+    - "off": every lookup misses and nothing is stored
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, mode="readwrite"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if mode == "off":
+            return
+        if mode == "replay":
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No response cache to replay at {path}")
+            self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            self._db.commit()
+        self._total_bytes, self._clock = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM responses"
+        ).fetchone()
+
+    def get(self, key):
+        if self._db is None:
+            self.misses += 1
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.mode == "replay":
+                    raise CacheMiss(key)
+                return None
+            self.hits += 1
+            if self.mode == "readwrite":
+                self._clock += 1
+                self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (self._clock, key))
+                self._db.commit()
+            return row[0]
+
+    def put(self, key, response):
+        if self.mode != "readwrite":
+            return
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._clock += 1
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                             (key, response, size, self._clock))
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes:
+            row = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY last_used ASC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self._total_bytes -= row[1]
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes if self._db is not None else 0,
+        }
+
+    def add(self, stats):
+        """Count another cache's lookups (a shard's stats()) as this one's. Shards write the same
+        file, so its size is read back from it."""
+        self.hits += stats.get("hits", 0)
+        self.misses += stats.get("misses", 0)
+        self.evictions += stats.get("evictions", 0)
+        if self._db is not None:
+            with self._lock:
+                self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def cached_call(cache, backend, model, params, prompt, call):
+    """Return the cached reply for this request, or call(prompt) and store it.
+
+    Returns (reply, hit).
+    """
+    key = make_key(backend, model, params, prompt)
+    reply = cache.get(key)
+    if reply is not None:
+        return reply, True
+    reply = call(prompt)
+    cache.put(key, reply)
+    return reply, False
+
+
+class CachedBackend:
+    """Async backend wrapper that serves repeated prompts from a ResponseCache.
+
+    stream_params are the settings that decide where the reader cuts a streamed reply
+    (ReplyParser.cutoff); they key streamed replies only.
+    """
+
+    def __init__(self, backend, cache, backend_name, model, params=None, stream_params=None):
+        self.backend = backend
+        self.cache = cache
+        self.backend_name = backend_name
+        self.model = model
+        self.params = params or {}
+        self.stream_params = stream_params or {}
+
+    async def chat(self, prompt, schema=None):
+        params = self.params if schema is None else {**self.params, "format": schema}
+        key = make_key(self.backend_name, self.model, params, prompt)
+        reply = self.cache.get(key)
+        if reply is not None:
+            return reply
+        reply = await (self.backend.chat(prompt) if schema is None else self.backend.chat(prompt, schema))
+        self.cache.put(key, reply)
+        return reply
+
+    async def chat_stream(self, prompt, schema=None):
+        """Stream a reply, or replay the cached one in a single piece.
+
+        If the reader stops early, the part it read is what gets cached: the reader stops at
+        the same point when the cached reply is replayed. Streamed replies are keyed apart from
+        whole ones, so a cut reply is never served to chat(), and by stream_params, so a reply
+        cut under one action cap is never served to a reader with another.
+        """
+        params = {**self.params, "stream": True, "cutoff": self.stream_params}
+        if schema is not None:
+            params["format"] = schema
+        key = make_key(self.backend_name, self.model, params, prompt)
+        reply = self.cache.get(key)
+        if reply is not None:
+            yield reply
+            return
+        parts = []
+        pieces = open_stream(self.backend, prompt, schema)
+        try:
+            async for piece in pieces:
+                parts.append(piece)
+                yield piece
+        except GeneratorExit:
+            await pieces.aclose()
+            self.cache.put(key, "".join(parts))
+            raise
+        self.cache.put(key, "".join(parts))
@@ -0,0 +1,165 @@
+import json
+import os
+import queue
+import sys
+import threading
+
+import pandas as pd
+
+from engine.events import ACTION_COUNTERS
+from engine.telemetry import current_telemetry
+
+COMMIT_KEY = "_commit"
+COUNTER_FIELDS = tuple(ACTION_COUNTERS.values())
+
+
+def jsonl_path_for(csv_path, suffix=""):
+    return os.path.splitext(csv_path)[0] + suffix + ".jsonl"
+
+
+def read_committed(jsonl_path):
+    """Read the records of every fully committed timestep, dropping any torn tail."""
+    records = []
+    pending = []
+    if not os.path.exists(jsonl_path):
+        return records
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # partially written line from a crash
+            if COMMIT_KEY in record:
+                records.extend(pending)
+                pending = []
+            else:
+                pending.append(record)
+    return records
+
+
+def compact_logs(jsonl_path, csv_path):
+    pd.DataFrame(read_committed(jsonl_path)).to_csv(csv_path, index=False)
+
+
+def compact_posts(jsonl_path, csv_path):
+    """Collapse post deltas to the latest state of each post, in release order."""
+    latest = {}
+    for record in read_committed(jsonl_path):
+        record.pop("timestep", None)
+        latest[record["post_id"]] = record
+    pd.DataFrame(list(latest.values())).to_csv(csv_path, index=False)
+
+
+class StreamingOutputSink:
+    """Append-only simulation output written from a background thread.
+
+    Each timestep appends its new log rows and the rows of posts whose state changed
+    to JSONL files, then a commit marker after flush + fsync. A crash loses at most
+    the timestep in progress. close() compacts the JSONL into the usual CSV outputs.
+    Each timestep's write is timed as a "write" span of telemetry (default: the current one).
+
+    record_file, if given, is a third JSONL (a run recording, see engine.replay) that gets
+    record_header as its committed first line and each timestep's records.
+    """
+
+    def __init__(self, log_file=None, posts_file=None, fsync=True, telemetry=None, record_file=None,
+                 record_header=None):
+        self.log_file = log_file
+        self.posts_file = posts_file
+        self.log_jsonl = jsonl_path_for(log_file) if log_file else None
+        self.posts_jsonl = jsonl_path_for(posts_file, ".deltas") if posts_file else None
+        self.record_file = record_file
+        self.fsync = fsync
+        self.telemetry = telemetry or current_telemetry()
+        self._written_state = {}  # post_id -> counters last written
+        self._queue = queue.Queue()
+        self._error = None
+        self._handles = {}
+        for path in (self.log_jsonl, self.posts_jsonl, self.record_file):
+            if path:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                self._handles[path] = open(path, "w", encoding="utf-8")
+        if record_file and record_header is not None:
+            self._append(record_file, None, [record_header])
+        self._thread = threading.Thread(target=self._run, name="output-sink", daemon=True)
+        self._thread.start()
+
+    def write_timestep(self, t, log_rows=(), posts=(), records=()):
+        """Queue one timestep of output. Returns immediately.
+
+        posts are the posts that may have changed (passing all of them is fine); only
+        those that are new or whose counters differ from the last write are appended.
+        Rows are copied here so the caller may keep mutating its posts. records go to
+        record_file as they are and must not be mutated afterwards.
+        """
+        self._raise_writer_error()
+        post_rows = []
+        if self.posts_jsonl:
+            for post in posts:
+                state = tuple(post.get(field, 0) for field in COUNTER_FIELDS)
+                if self._written_state.get(post["post_id"]) != state:
+                    self._written_state[post["post_id"]] = state
+                    post_rows.append(dict(post, timestep=t))
+        self._queue.put((t, [dict(row) for row in log_rows], post_rows, list(records)))
+
+    def flush(self):
+        """Block until everything queued so far is on disk."""
+        self._queue.join()
+        self._raise_writer_error()
+
+    def close(self, compact=True):
+        self._queue.put(None)
+        self._thread.join()
+        for handle in self._handles.values():
+            handle.close()
+        self._raise_writer_error()
+        if compact:
+            self.compact()
+
+    def compact(self):
+        if self.log_jsonl:
+            compact_logs(self.log_jsonl, self.log_file)
+        if self.posts_jsonl:
+            compact_posts(self.posts_jsonl, self.posts_file)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    t, log_rows, post_rows, records = item
+                    with self.telemetry.span("write", t=t):
+                        self._append(self.log_jsonl, t, log_rows)
+                        self._append(self.posts_jsonl, t, post_rows)
+                        self._append(self.record_file, t, records)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _append(self, path, t, rows):
+        if not path:
+            return
+        handle = self._handles[path]
+        for row in rows:
+            handle.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        handle.flush()
+        if self.fsync:
+            os.fsync(handle.fileno())
+        handle.write(json.dumps({COMMIT_KEY: t}) + "\n")
+        handle.flush()
+
+    def _raise_writer_error(self):
+        if self._error is not None:
+            raise RuntimeError(f"Output writer failed: {self._error}") from self._error
+
+
+if __name__ == "__main__":
+    # Rebuild the CSVs from the JSONL of an interrupted run:
+    #   python -m engine.output_sink output/logs/.../simulation_log.csv output/posts/.../posts.csv
+    log_csv, posts_csv = sys.argv[1], sys.argv[2]
+    compact_logs(jsonl_path_for(log_csv), log_csv)
+    compact_posts(jsonl_path_for(posts_csv, ".deltas"), posts_csv)
+    print(f"✅ Compacted into {log_csv} and {posts_csv}")
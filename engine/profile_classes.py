@@ -0,0 +1,44 @@
+import hashlib
+import json
+
+# Fields that differ between clones of the same scraped profile (see agents/agent_generator.py)
+PER_AGENT_FIELDS = ("id", "username")
+
+
+def profile_class_key(agent):
+    """Stable key shared by all agents generated from the same profile."""
+    profile = {k: v for k, v in agent.items() if k not in PER_AGENT_FIELDS}
+    payload = json.dumps(profile, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def group_by_profile(agents, max_group_size=None):
+    """Group agents into profile classes, in order of first appearance.
+
+    Classes larger than max_group_size are split into consecutive chunks so a single
+    prompt never has to speak for too many agents.
+    """
+    classes = {}
+    for agent in agents:
+        classes.setdefault(profile_class_key(agent), []).append(agent)
+
+    groups = []
+    for members in classes.values():
+        size = max_group_size or len(members)
+        for start in range(0, len(members), size):
+            groups.append(members[start:start + size])
+    return groups
+
+
+def chunk_agents(agents, group_size):
+    """Split agents into consecutive groups of group_size (the last may be smaller)."""
+    group_size = max(1, group_size or len(agents))
+    return [agents[start:start + group_size] for start in range(0, len(agents), group_size)]
+
+
+def chunk_agents_by(agents, group_size, key):
+    """chunk_agents within each set of agents with the same key(agent), sets in order of first appearance."""
+    buckets = {}
+    for agent in agents:
+        buckets.setdefault(key(agent), []).append(agent)
+    return [chunk for members in buckets.values() for chunk in chunk_agents(members, group_size)]
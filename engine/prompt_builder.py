@@ -0,0 +1,154 @@
+import json
+
+from engine.prompts import (END_INSTRUCTION, render_agent_prompt, render_class_prompt, render_compact_agent_prompt,
+                            render_compact_class_prompt, render_compact_group_prompt, render_engagement_prompt,
+                            render_group_prompt, render_posts_compact)
+from engine.rate_limiter import estimate_tokens
+
+PROMPT_FORMATS = ("json", "compact")
+
+
+class PromptBuilder:
+    """Renders every prompt kind the agent steps send, and keeps token statistics.
+
+    This base class embeds the feed as indented JSON (the original driver.py format); the
+    serialized feed is reused for every agent of a timestep. structured=True asks for JSON
+    replies (see engine.structured_output) instead of action blocks; end_marker=True asks
+    free-text replies to end with END_MARKER (see engine.streaming).
+    """
+
+    def __init__(self, count_tokens=estimate_tokens, structured=False, end_marker=False):
+        self.count_tokens = count_tokens
+        self.structured = structured
+        self.end_marker = end_marker and not structured
+        self.prompts = 0
+        self.tokens = 0
+        self.max_tokens = 0
+        self._feed = None
+        self._posts_str = None
+
+    def posts_str(self, feed):
+        if feed is not self._feed:
+            self._feed, self._posts_str = feed, json.dumps(feed, indent=2)
+        return self._posts_str
+
+    def finish(self, prompt):
+        return f"{prompt}{END_INSTRUCTION}\n" if self.end_marker else prompt
+
+    def record(self, prompt):
+        tokens = self.count_tokens(prompt)
+        self.prompts += 1
+        self.tokens += tokens
+        self.max_tokens = max(self.max_tokens, tokens)
+        return prompt
+
+    def agent(self, agent, feed, current_time, subreddit):
+        return self.record(self.finish(render_agent_prompt(agent, self.posts_str(feed), current_time, subreddit,
+                                                           self.structured)))
+
+    def profile_class(self, agent, num_agents, feed, current_time, subreddit):
+        return self.record(self.finish(render_class_prompt(agent, num_agents, self.posts_str(feed), current_time,
+                                                           subreddit, self.structured)))
+
+    def group(self, agents, feed, current_time, subreddit):
+        return self.record(self.finish(render_group_prompt(agents, self.posts_str(feed), current_time, subreddit,
+                                                           self.structured)))
+
+    def engagement(self, agent, posts, current_time, subreddit):
+        return self.record(self.finish(render_engagement_prompt(agent, json.dumps(posts, indent=2), current_time,
+                                                                subreddit, self.structured)))
+
+    def stats(self):
+        return {"prompts": self.prompts, "tokens": self.tokens, "max_tokens": self.max_tokens,
+                "mean_tokens": round(self.tokens / self.prompts, 1) if self.prompts else 0.0}
+
+
+class CompactPromptBuilder(PromptBuilder):
+    """Token-budgeted prompts with a compact post table, shared prefix first and profiles last.
+
+    The post table for a feed is fitted once per prompt kind to token_budget minus
+    profile_reserve, by halving body excerpts and then dropping the lowest-ranked posts, so
+    every call of a kind in a timestep gets a byte-identical prefix: the instructions and the
+    table. Class and group prompts share the same instructions. A prompt whose profiles
+    outgrow the reserve gets its own, smaller table (counted in `refits`) rather than
+    exceeding the budget.
+    """
+
+    def __init__(self, token_budget=2000, body_chars=280, profile_reserve=150, count_tokens=estimate_tokens,
+                 structured=False, end_marker=False):
+        super().__init__(count_tokens, structured, end_marker)
+        self.token_budget = token_budget
+        self.body_chars = body_chars
+        self.profile_reserve = profile_reserve
+        self.refits = 0
+        self.dropped_posts = 0
+        self._blocks = {}  # (id(feed), prompt kind) -> (feed, block); feed kept so its id isn't reused
+
+    def fit_posts(self, posts, budget):
+        """Largest compact table of posts (in rank order) that fits in budget tokens."""
+        body_chars = self.body_chars
+        while True:
+            block = render_posts_compact(posts, body_chars)
+            if self.count_tokens(block) <= budget or not posts:
+                return block, posts
+            if body_chars > 20:
+                body_chars //= 2
+            elif body_chars:
+                body_chars = 0
+            else:
+                posts = posts[:-1]
+
+    def budgeted(self, kind, render, feed, shared=True):
+        """render(posts_block) fitted to the budget.
+
+        With shared=True the table is fitted once per (feed, prompt kind), leaving profile_reserve
+        tokens of slack for prompts whose profiles render longer than the first one's.
+        """
+        cached = self._blocks.get((id(feed), kind)) if shared else None
+        if cached is None or cached[0] is not feed:
+            reserve = self.profile_reserve if shared else 0
+            overhead = self.count_tokens(self.finish(render("")))
+            block, kept = self.fit_posts(feed, max(0, self.token_budget - overhead - reserve))
+            self.dropped_posts += len(feed) - len(kept)
+            cached = (feed, block)
+            if shared:
+                if len(self._blocks) > 64:
+                    self._blocks.clear()
+                self._blocks[(id(feed), kind)] = cached
+        prompt = self.finish(render(cached[1]))
+        if self.count_tokens(prompt) > self.token_budget:
+            self.refits += 1
+            overhead = self.count_tokens(self.finish(render("")))
+            block, _ = self.fit_posts(feed, max(0, self.token_budget - overhead))
+            prompt = self.finish(render(block))
+        return self.record(prompt)
+
+    def agent(self, agent, feed, current_time, subreddit):
+        return self.budgeted("agent", lambda block: render_compact_agent_prompt(agent, block, current_time,
+                                                                                subreddit, self.structured), feed)
+
+    def profile_class(self, agent, num_agents, feed, current_time, subreddit):
+        return self.budgeted("class", lambda block: render_compact_class_prompt(agent, num_agents, block, current_time,
+                                                                                subreddit, self.structured), feed)
+
+    def group(self, agents, feed, current_time, subreddit):
+        return self.budgeted("group", lambda block: render_compact_group_prompt(agents, block, current_time,
+                                                                                subreddit, self.structured), feed)
+
+    def engagement(self, agent, posts, current_time, subreddit):
+        return self.budgeted("engagement", lambda block: render_engagement_prompt(agent, block, current_time,
+                                                                                  subreddit, self.structured),
+                             posts, shared=False)
+
+    def stats(self):
+        return {**super().stats(), "budget": self.token_budget, "refits": self.refits,
+                "dropped_posts": self.dropped_posts}
+
+
+def make_prompt_builder(prompt_format="json", token_budget=2000, body_chars=280, structured=False,
+                        end_marker=False):
+    if prompt_format == "json":
+        return PromptBuilder(structured=structured, end_marker=end_marker)
+    if prompt_format == "compact":
+        return CompactPromptBuilder(token_budget, body_chars, structured=structured, end_marker=end_marker)
+    raise ValueError(f"Unknown prompt format: {prompt_format}")
@@ -0,0 +1,328 @@
+import re
+
+AGENT_HEADER = re.compile(r"^[\s*#\-]*Agent\s+(\d+)\s*\**\s*[:\-]?\**", re.IGNORECASE | re.MULTILINE)
+
+
+def agent_profile(agent):
+    return {
+        "topics_of_interest": agent.get("topics", []),
+        "comment_style": agent.get("comment_style", "neutral and concise"),
+        "posting_frequency": agent.get("posting_frequency", "occasional"),
+        "daily_activity_rate": agent.get("daily_activity_rate", 0.02),
+    }
+
+
+def render_profile(profile):
+    return f"""- Topics of interest: {', '.join(profile['topics_of_interest'])}
+- Commenting style: {profile['comment_style']}
+- Posting frequency: {profile['posting_frequency']}
+- Daily activity rate: {profile["daily_activity_rate"]}"""
+
+
+ACTION_LINES = """- Action: [like | comment | ignore]
+- Post_ID: [post id]
+- Reason: [brief explanation]
+- (If comment) Comment: [realistic Reddit-style reply]"""
+
+JSON_ACTIONS = ('{"actions": [{"action": "like" | "comment" | "ignore", "post_id": <post id>, '
+                '"reason": "<brief explanation>", "comment": "<realistic Reddit-style reply, if comment>"}]}')
+
+
+def respond_format(structured=False):
+    """Response instructions for a single agent: action blocks, or a JSON object (engine.structured_output)."""
+    if structured:
+        return f"""🎯 Respond with a JSON object listing only the posts you decide to act on (the list may be empty):
+{JSON_ACTIONS}
+
+ONLY output this JSON object. Do not add anything else."""
+    return f"""🎯 Respond only to posts you decide to act on (optional):
+{ACTION_LINES}
+
+ONLY use this format. Do not add anything else."""
+
+
+def respond_group_format(num_agents, structured=False):
+    if structured:
+        return f"""🎯 Respond with a JSON object with one entry per user, Agent 1 to Agent {num_agents}, listing only the posts that user decides to act on (a list may be empty):
+{{"agents": [{{"agent": 1, "actions": [{{"action": "like" | "comment" | "ignore", "post_id": <post id>, "reason": "<brief explanation>", "comment": "<realistic Reddit-style reply, if comment>"}}]}}]}}
+
+ONLY output this JSON object. Do not add anything else."""
+    return f"""🎯 Respond with one block per user, Agent 1 to Agent {num_agents}. Start each block with "Agent <number>:" and list only the posts that user decides to act on (a block may be empty):
+Agent 1:
+{ACTION_LINES}
+
+ONLY use this format. Do not add anything else."""
+
+
+def respond_engagement_format(structured=False):
+    if structured:
+        return """🎯 Respond with a JSON object with one action for EVERY post above:
+{"actions": [{"action": "like" | "comment", "post_id": <post id>, "reason": "<brief explanation>", "comment": "<realistic Reddit-style reply, if comment>"}]}
+
+ONLY output this JSON object. Do not add anything else."""
+    return """🎯 Respond once for EVERY post above:
+- Action: [like | comment]
+- Post_ID: [post id]
+- Reason: [brief explanation]
+- (If comment) Comment: [realistic Reddit-style reply]
+
+ONLY use this format. Do not add anything else."""
+
+
+# Streamed free-text replies are asked to end with this line, so generation can stop right there
+END_MARKER = "<END>"
+END_INSTRUCTION = f"When you are done, end your reply with the line {END_MARKER}"
+
+
+# Response instructions for the whole-subreddit prompts in driver2.py / driver3.py with structured output on
+POST_COUNTS_JSON_FORMAT = """Respond with a JSON object giving each post's total likes and comments after the simulated timesteps:
+{"posts": [{"post_id": <post id>, "likes": <total likes>, "comments": <total comments>}]}
+
+ONLY output this JSON object. Do not add anything else."""
+
+
+def render_agent_prompt(agent, posts_str, current_time, subreddit, structured=False):
+    """Single-agent browsing prompt (the original driver.py prompt)."""
+    return f"""
+{current_time.isoformat()} - Agent browsing environment:
+
+Your user profile:
+{render_profile(agent_profile(agent))}
+You are a Reddit user browsing the r/{subreddit} subreddit.
+
+Your goals are to recognize which posts are likely to go viral, respond realistically, and engage in ways typical of this community.
+
+1. Each post has a field called virality_prediction, with a label (either viral or non-viral). YOUR RESPONSES SHOULD USE THIS AS THE GROUND TRUTH.
+
+2. Don't feel pressured to comment or like on everything. You can ignore posts.
+
+Your probability of reacting is defined by your activity rate (e.g. 0.02 = 2% chance of action per post). Ignore posts that are irrelevant or uninteresting.
+
+3. Your behavior:
+- Be realistic, not overly enthusiastic
+- You may ask clarifying questions
+- Don’t overreact
+
+Posts:
+{posts_str}
+
+{respond_format(structured)}
+"""
+
+
+def render_class_prompt(agent, num_agents, posts_str, current_time, subreddit, structured=False):
+    """One prompt standing in for num_agents users that share agent's profile."""
+    return f"""
+{current_time.isoformat()} - Agent browsing environment:
+
+You are simulating {num_agents} different Reddit users who all share this user profile:
+{render_profile(agent_profile(agent))}
+They are browsing the r/{subreddit} subreddit independently of each other.
+
+Your goals are to recognize which posts are likely to go viral, have each user respond realistically, and engage in ways typical of this community.
+
+1. Each post has a field called virality_prediction, with a label (either viral or non-viral). YOUR RESPONSES SHOULD USE THIS AS THE GROUND TRUTH.
+
+2. Don't feel pressured to comment or like on everything. Users can ignore posts.
+
+Each user's probability of reacting is defined by the activity rate (e.g. 0.02 = 2% chance of action per post), decided separately for every user. Users will not all react to the same posts.
+
+3. Their behavior:
+- Be realistic, not overly enthusiastic
+- They may ask clarifying questions
+- Don’t overreact
+
+Posts:
+{posts_str}
+
+{respond_group_format(num_agents, structured)}
+"""
+
+
+def render_group_prompt(agents, posts_str, current_time, subreddit, structured=False):
+    """One prompt for a group of agents with (possibly) different profiles."""
+    profiles = "\n\n".join(
+        f"Agent {k} profile:\n{render_profile(agent_profile(agent))}"
+        for k, agent in enumerate(agents, start=1)
+    )
+    return f"""
+{current_time.isoformat()} - Agent browsing environment:
+
+You are simulating {len(agents)} different Reddit users browsing the r/{subreddit} subreddit independently of each other. Their profiles:
+
+{profiles}
+
+Your goals are to recognize which posts are likely to go viral, have each user respond realistically according to their own profile, and engage in ways typical of this community.
+
+1. Each post has a field called virality_prediction, with a label (either viral or non-viral). YOUR RESPONSES SHOULD USE THIS AS THE GROUND TRUTH.
+
+2. Don't feel pressured to comment or like on everything. Users can ignore posts.
+
+Each user's probability of reacting is defined by their own activity rate (e.g. 0.02 = 2% chance of action per post). Ignore posts that are irrelevant or uninteresting to that user.
+
+3. Their behavior:
+- Be realistic, not overly enthusiastic
+- They may ask clarifying questions
+- Don’t overreact
+
+Posts:
+{posts_str}
+
+{respond_group_format(len(agents), structured)}
+"""
+
+
+ENGAGE_ALL_MARKER = "You have already decided to engage with every post below."
+
+
+def render_engagement_prompt(agent, posts_str, current_time, subreddit, structured=False):
+    """Prompt for posts the engine has already decided this agent reacts to; the LLM only writes the reaction."""
+    profile = agent_profile(agent)
+    return f"""
+{current_time.isoformat()} - Agent browsing environment:
+
+Your user profile:
+- Topics of interest: {', '.join(profile['topics_of_interest'])}
+- Commenting style: {profile['comment_style']}
+You are a Reddit user browsing the r/{subreddit} subreddit.
+
+{ENGAGE_ALL_MARKER} For each post, either like it or write a comment, in a way typical of this community.
+
+1. Each post has a field called virality_prediction, with a label (either viral or non-viral). YOUR RESPONSES SHOULD USE THIS AS THE GROUND TRUTH.
+
+2. Your behavior:
+- Be realistic, not overly enthusiastic
+- You may ask clarifying questions
+- Don’t overreact
+
+Posts:
+{posts_str}
+
+{respond_engagement_format(structured)}
+"""
+
+
+def split_agent_sections(reply, num_agents):
+    """Split a multi-agent reply into per-agent text, indexed 0..num_agents-1.
+
+    Text before the first "Agent <k>:" header and headers outside 1..num_agents are
+    dropped; agents without a block get an empty string.
+    """
+    sections = [""] * num_agents
+    headers = list(AGENT_HEADER.finditer(reply))
+    for i, match in enumerate(headers):
+        k = int(match.group(1))
+        if not 1 <= k <= num_agents:
+            continue
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(reply)
+        sections[k - 1] += reply[match.end():end].strip()
+    return sections
+
+
+COMPACT_COLUMNS = ("post_id", "title", "flair", "likes", "comments", "virality", "excerpt")
+
+
+def compact_cell(value, limit=None):
+    text = " ".join(str(value if value is not None else "").replace("|", "/").split())
+    if limit is not None and len(text) > limit:
+        text = text[:max(0, limit - 1)].rstrip() + "…" if limit else ""
+    return text
+
+
+def render_posts_compact(posts, body_chars=280, title_chars=120):
+    """One '|'-separated row per post, bodies cut to body_chars (0 drops them); far smaller than indented JSON."""
+    rows = [" | ".join(COMPACT_COLUMNS)]
+    for post in posts:
+        rows.append(" | ".join([
+            str(post["post_id"]),
+            compact_cell(post.get("title"), title_chars),
+            compact_cell(post.get("flair")),
+            str(post.get("num_likes", 0)),
+            str(post.get("num_comments", 0)),
+            compact_cell(post.get("virality_prediction", "unknown")),
+            compact_cell(post.get("post_text"), body_chars),
+        ]))
+    return "\n".join(rows)
+
+
+def render_compact_agent_prompt(agent, posts_block, current_time, subreddit, structured=False):
+    """Single-agent prompt with everything shared by a timestep's agents first and the profile last.
+
+    Backends that cache the KV state of a prompt prefix (Ollama, vLLM, llama.cpp) then only
+    process the profile for each new agent.
+    """
+    return f"""You are a Reddit user browsing the r/{subreddit} subreddit.
+
+Your goals are to recognize which posts are likely to go viral, respond realistically, and engage in ways typical of this community.
+
+1. Each post has a virality label (viral or non-viral). YOUR RESPONSES SHOULD USE THIS AS THE GROUND TRUTH.
+
+2. Don't feel pressured to comment or like on everything. You can ignore posts.
+
+Your probability of reacting is defined by your activity rate (e.g. 0.02 = 2% chance of action per post). Ignore posts that are irrelevant or uninteresting.
+
+3. Your behavior:
+- Be realistic, not overly enthusiastic
+- You may ask clarifying questions
+- Don’t overreact
+
+{respond_format(structured)}
+
+{current_time.isoformat()} - Posts (one per line, excerpts truncated):
+{posts_block}
+
+Your user profile:
+{render_profile(agent_profile(agent))}
+"""
+
+
+def compact_users_preamble(subreddit):
+    """Instructions shared by every compact multi-user prompt (class and group), whatever its users."""
+    return f"""You are simulating several different Reddit users browsing the r/{subreddit} subreddit independently of each other.
+
+Your goals are to recognize which posts are likely to go viral, have each user respond realistically according to their profile, and engage in ways typical of this community.
+
+1. Each post has a virality label (viral or non-viral). YOUR RESPONSES SHOULD USE THIS AS THE GROUND TRUTH.
+
+2. Don't feel pressured to comment or like on everything. Users can ignore posts.
+
+Each user's probability of reacting is defined by their activity rate (e.g. 0.02 = 2% chance of action per post), decided separately for every user. Ignore posts that are irrelevant or uninteresting to that user.
+
+3. Their behavior:
+- Be realistic, not overly enthusiastic
+- They may ask clarifying questions
+- Don’t overreact"""
+
+
+def render_compact_class_prompt(agent, num_agents, posts_block, current_time, subreddit, structured=False):
+    """Profile-class prompt laid out like render_compact_agent_prompt: instructions and posts first,
+    then the shared profile, the number of users and the reply format (which depends on it)."""
+    return f"""{compact_users_preamble(subreddit)}
+
+{current_time.isoformat()} - Posts (one per line, excerpts truncated):
+{posts_block}
+
+The {num_agents} users all share this user profile (they will not all react to the same posts):
+{render_profile(agent_profile(agent))}
+
+{respond_group_format(num_agents, structured)}
+"""
+
+
+def render_compact_group_prompt(agents, posts_block, current_time, subreddit, structured=False):
+    """Group prompt laid out like render_compact_agent_prompt: instructions and posts first, profiles last."""
+    profiles = "\n\n".join(
+        f"Agent {k} profile:\n{render_profile(agent_profile(agent))}"
+        for k, agent in enumerate(agents, start=1)
+    )
+    return f"""{compact_users_preamble(subreddit)}
+
+{current_time.isoformat()} - Posts (one per line, excerpts truncated):
+{posts_block}
+
+The {len(agents)} users' profiles:
+
+{profiles}
+
+{respond_group_format(len(agents), structured)}
+"""
@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+
+RETRYABLE_STATUS = {429} | set(range(500, 600))
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) for budgeting requests."""
+    return max(1, len(text) // 4)
+
+
+def status_code_of(exc):
+    """Best-effort HTTP status of an SDK/HTTP exception (OpenAI, google-api-core, httpx, urllib)."""
+    for attr in ("status_code", "code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return int(value)
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return int(value) if isinstance(value, int) else None
+
+
+def retry_after_of(exc):
+    """Seconds from a Retry-After header on the exception, if any."""
+    headers = getattr(exc, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudgetExceeded(RuntimeError):
+    pass
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_minute, holding up to capacity."""
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def reserve(self, amount):
+        """Take amount tokens (going into debt if needed); returns seconds to wait before using them."""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= min(amount, self.capacity)
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RequestScheduler:
+    """Paces calls to a remote LLM API and retries rate-limit / server errors.
+
+    - requests_per_minute / tokens_per_minute: token buckets that every call draws from
+    - 429 and 5xx responses are retried with exponential backoff and full jitter
+      (or the server's Retry-After, if longer), up to max_retries per call
+    - retry_budget caps retries across the whole run so a dead endpoint fails fast
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_retries=5,
+                 base_delay=1.0, max_delay=60.0, retry_budget=100, seed=None, sleep=time.sleep):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.metrics = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+            "throttled_seconds": 0.0,
+            "backoff_seconds": 0.0,
+        }
+
+    def call(self, fn, *args, estimated_tokens=0, **kwargs):
+        attempt = 0
+        while True:
+            self._throttle(estimated_tokens)
+            self.metrics["requests"] += 1
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                status = status_code_of(e)
+                if status not in RETRYABLE_STATUS:
+                    self.metrics["failures"] += 1
+                    raise
+                self.metrics["rate_limited" if status == 429 else "server_errors"] += 1
+                if attempt >= self.max_retries:
+                    self.metrics["failures"] += 1
+                    raise
+                with self._lock:
+                    if self.retry_budget is not None and self.metrics["retries"] >= self.retry_budget:
+                        self.metrics["failures"] += 1
+                        raise RetryBudgetExceeded(f"Retry budget of {self.retry_budget} used up") from e
+                    self.metrics["retries"] += 1
+                delay = self._backoff(attempt, retry_after_of(e))
+                print(f"⏳ HTTP {status}, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                self.metrics["backoff_seconds"] += delay
+                self.sleep(delay)
+                attempt += 1
+
+    def _throttle(self, estimated_tokens):
+        with self._lock:
+            wait = 0.0
+            if self.request_bucket:
+                wait = max(wait, self.request_bucket.reserve(1))
+            if self.token_bucket and estimated_tokens:
+                wait = max(wait, self.token_bucket.reserve(estimated_tokens))
+            self.metrics["throttled_seconds"] += wait
+        if wait > 0:
+            self.sleep(wait)
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
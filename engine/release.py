@@ -0,0 +1,73 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+
+def parse_created_utc(value):
+    """created_utc ("2025-08-11T00:12:36Z") as a naive UTC datetime, or None if missing/invalid."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "")).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+
+class ReleaseScheduler:
+    """Publishes posts from a queue in created_utc order, one timestep window at a time.
+
+    Timestep t releases exactly the posts created in [data_start + t*Δ*time_scale,
+    data_start + (t+1)*Δ*time_scale), where Δ is the timestep length. created_utc is parsed
+    once up front and the posts kept sorted, so each step costs O(log n + released).
+
+    time_scale > 1 replays a long scrape in fewer timesteps (e.g. a month of posts over
+    60 six-hour steps); see ReleaseScheduler.spanning. Posts created before data_start, or
+    without a valid created_utc, are never released.
+    """
+
+    def __init__(self, post_queue, data_start, timestep, time_scale=1.0):
+        self.data_start = data_start
+        self.timestep = timestep
+        self.time_scale = time_scale
+        timed = []
+        self.unscheduled = []
+        for i, post in enumerate(post_queue):
+            created = parse_created_utc(post.get("created_utc"))
+            if created is None:
+                self.unscheduled.append(post)
+            else:
+                timed.append((created, i, post))
+        timed.sort(key=lambda item: (item[0], item[1]))
+        self._times = [created for created, _, _ in timed]
+        self._posts = [post for _, _, post in timed]
+        self._next = 0
+
+    @classmethod
+    def spanning(cls, post_queue, timestep, num_timesteps):
+        """A scheduler whose num_timesteps windows cover the whole queue, from its first post to its last."""
+        times = [t for t in (parse_created_utc(p.get("created_utc")) for p in post_queue) if t is not None]
+        if not times:
+            return cls(post_queue, datetime.min, timestep)
+        span = max(times) - min(times)
+        time_scale = max(1.0, span / (timestep * num_timesteps) * (1 + 1e-9))
+        return cls(post_queue, min(times), timestep, time_scale)
+
+    def window(self, t):
+        """[start, end) in post time covered by timestep t."""
+        step = self.timestep * self.time_scale
+        return self.data_start + step * t, self.data_start + step * (t + 1)
+
+    def release(self, t):
+        """Posts created in timestep t's window, oldest first. Windows must be asked for in order."""
+        start, end = self.window(t)
+        if self._next < len(self._times) and self._times[self._next] < start:
+            self._next = bisect_left(self._times, start, self._next)
+        released = []
+        while self._next < len(self._times) and self._times[self._next] < end:
+            released.append(self._posts[self._next])
+            self._next += 1
+        return released
+
+    def pending(self):
+        """Number of dated posts neither released nor skipped yet."""
+        return len(self._times) - self._next
+
@@ -0,0 +1,148 @@
+"""Rebuild a recorded run's posts and logs from its recording, with no LLM calls.
+
+A run with SimulationConfig.record_file writes, per timestep, the posts it released, the
+online agents, their feed, any surrogate events and every LLM reply that was parsed (see
+Simulation.step). Replaying re-parses those replies with today's parsers and re-applies the
+events with today's reducer, so a parser or reducer change can be compared against the
+original run (or another replay) at disk speed:
+
+    python -m engine.replay output/recordings/SecurityCamera/llama3_run.jsonl \\
+        --agents agents/agents.json --posts posts/posts.json --until 20 --out-dir output/replay
+
+Only committed timesteps are replayed, so the recording of a crashed run works too.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+from engine.agent_steps import agent_reply_results, engagement_reply_results, group_reply_results
+from engine.events import ActionEvent, ActionLog, reduce_timestep
+from engine.output_sink import StreamingOutputSink, read_committed
+from engine.simulation import surrogate_log_entries
+from engine.structured_output import ReplyParser
+
+
+def read_recording(path):
+    """(run header, {t: [records]}) from a recording, committed timesteps only."""
+    header = None
+    timesteps = {}
+    for record in read_committed(path):
+        if record.get("kind") == "run":
+            header = record
+        else:
+            timesteps.setdefault(record["t"], []).append(record)
+    if header is None:
+        raise ValueError(f"{path} is not a run recording (no header)")
+    return header, timesteps
+
+
+def reply_results(record, agents_by_id, current_time, parser):
+    """(events, log entries) for a recorded reply, as the original call produced them."""
+    agents = [agents_by_id[agent_id] for agent_id in record["agents"]]
+    t = record["t"]
+    if record["kind"] == "engagement":
+        return engagement_reply_results(agents[0], record["posts"], record["reply"], current_time, t, parser)
+    if record["kind"] == "group":
+        return group_reply_results(agents, record["reply"], current_time, t, parser)
+    return agent_reply_results(agents[0], record["reply"], current_time, t, parser)
+
+
+class Replay:
+    """Posts, logs and action log of a recorded run, rebuilt one timestep at a time.
+
+    agents and post_queue must be the ones the run was started with. parser defaults to one
+    with the run's structured_output setting.
+    """
+
+    def __init__(self, recording_file, agents, post_queue, parser=None):
+        self.header, self.timesteps = read_recording(recording_file)
+        self.config = self.header["config"]
+        if (len(agents), len(post_queue)) != (self.header["num_agents"], self.header["num_posts"]):
+            raise ValueError(f"Recording was made with {self.header['num_agents']} agents and "
+                             f"{self.header['num_posts']} posts, got {len(agents)} and {len(post_queue)}")
+        self.agents_by_id = {agent["id"]: agent for agent in agents}
+        self.queue_by_id = {post["post_id"]: post for post in post_queue}
+        self.parser = parser or ReplyParser(self.config["structured_output"])
+        self.posts = []
+        self.post_index = {}
+        self.logs = []
+        self.action_log = ActionLog()
+
+    def step(self, t, sink=None):
+        records = self.timesteps.get(t, [])
+        timestep = next((r for r in records if r["kind"] == "timestep"), None)
+        if timestep is None:
+            raise ValueError(f"Timestep {t} is not in the recording")
+        current_time = datetime.fromisoformat(timestep["time"])
+
+        new_posts = [dict(self.queue_by_id[post_id]) for post_id in timestep["released"]]
+        for post in new_posts:
+            self.post_index[post["post_id"]] = len(self.posts)
+            self.posts.append(post)
+
+        batch = []
+        step_logs = []
+        for record in records:
+            if record["kind"] == "surrogate":
+                events = [ActionEvent(t, agent_id, post_id, action) for agent_id, post_id, action in record["events"]]
+                batch.extend(events)
+                step_logs.extend(surrogate_log_entries(self.agents_by_id, events, current_time, t))
+            elif record["kind"] != "timestep":
+                try:
+                    events, log_entries = reply_results(record, self.agents_by_id, current_time, self.parser)
+                except Exception as e:  # the run would have dropped this reply too
+                    print(f"❌ Error replaying reply for agents {record['agents']}: {e}")
+                    continue
+                batch.extend(events)
+                step_logs.extend(log_entries)
+
+        step_events = self.action_log.append_batch(t, batch)
+        touched = reduce_timestep(self.posts, step_events, self.post_index)
+        step_logs.sort(key=lambda entry: entry["agent_id"])
+        self.logs.extend(step_logs)
+        if sink:
+            changed_ids = touched | {p["post_id"] for p in new_posts}
+            sink.write_timestep(t, step_logs, [self.posts[self.post_index[i]]
+                                               for i in sorted(changed_ids, key=self.post_index.get)])
+
+    def run(self, until=None, log_file=None, posts_out_file=None):
+        """Replay timesteps 0..until (default: every recorded one); returns self.
+
+        With log_file / posts_out_file the outputs are written as the run wrote them.
+        """
+        last = max(self.timesteps, default=-1) if until is None else until
+        sink = StreamingOutputSink(log_file, posts_out_file, fsync=False) if log_file or posts_out_file else None
+        try:
+            for t in range(last + 1):
+                self.step(t, sink)
+        finally:
+            if sink:
+                sink.close()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild a recorded run's posts and logs without an LLM.")
+    parser.add_argument("recording", help="record_file of the run")
+    parser.add_argument("--agents", required=True, help="agents JSON the run was started with")
+    parser.add_argument("--posts", required=True, help="post queue JSON the run was started with")
+    parser.add_argument("--until", type=int, help="last timestep to replay (default: all recorded)")
+    parser.add_argument("--out-dir", default=os.path.join("output", "replay"))
+    args = parser.parse_args()
+
+    with open(args.agents, "r", encoding="utf-8") as f:
+        agents = json.load(f)
+    with open(args.posts, "r", encoding="utf-8") as f:
+        post_queue = json.load(f)
+
+    start = time.perf_counter()
+    replay = Replay(args.recording, agents, post_queue)
+    replay.run(args.until, os.path.join(args.out_dir, "simulation_log.csv"), os.path.join(args.out_dir, "posts.csv"))
+    print(f"✅ Replayed {len(replay.action_log)} actions over {len(replay.posts)} posts in "
+          f"{time.perf_counter() - start:.2f}s; parsing: {replay.parser.stats}. Written to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Partition a timestep's online agents across processes (or machines) and merge the results.
+
+Each shard gets a read-only snapshot of the timestep's feed and runs the same per-agent work
+as the in-process loop (prompt rendering, the LLM call, reply parsing) on its own event loop
+and backend. Results are merged in shard order and events are put in canonical order, so the
+outcome does not depend on which shard finishes first or how many shards there are.
+
+Two executors:
+- ProcessShardExecutor: a local process pool
+- QueueShardExecutor: serves tasks on a TCP work queue that any number of workers drain,
+  on this machine or others:  python -m engine.sharding worker --address HOST:PORT --authkey KEY
+
+The work queue exchanges pickles, so whoever holds its authkey can run code on the driver
+and the workers. Without an explicit key, one is generated per run (and printed for the
+workers), and the queue only listens on a loopback address.
+"""
+import argparse
+import asyncio
+import ipaddress
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from multiprocessing.managers import BaseManager
+
+from engine.agent_steps import agent_tasks, collect
+from engine.backends import DEFAULT_SYSTEM_PROMPT, make_ollama_backend, new_usage
+from engine.events import event_sort_key
+from engine.llm_cache import CachedBackend, ResponseCache
+from engine.profile_classes import chunk_agents_by, profile_class_key
+from engine.prompt_builder import PromptBuilder
+from engine.structured_output import ReplyParser
+from engine.telemetry import Telemetry, use_telemetry
+
+
+@dataclass(frozen=True)
+class BackendSpec:
+    """Picklable recipe for the backend (and response cache) each shard builds for itself."""
+    model: str
+    kind: str = "async"
+    host: str = None
+    max_concurrency: int = 16
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT
+    cache_file: str = None
+    cache_mode: str = "off"
+    cache_max_bytes: int = 512 * 1024 * 1024
+    stream_params: dict = None  # see CachedBackend
+
+    def build(self):
+        backend = make_ollama_backend(self.model, kind=self.kind, host=self.host,
+                                      max_concurrency=self.max_concurrency, system_prompt=self.system_prompt)
+        if self.cache_mode == "off" or not self.cache_file:
+            return backend, None
+        cache = ResponseCache(self.cache_file, max_bytes=self.cache_max_bytes, mode=self.cache_mode)
+        return CachedBackend(backend, cache, "ollama", self.model, params={"system": self.system_prompt},
+                             stream_params=self.stream_params), cache
+
+
+@dataclass(frozen=True)
+class ShardTask:
+    shard: int
+    t: int
+    current_time: datetime
+    subreddit: str
+    agents: list
+    feed: list  # snapshot of the posts every agent sees this timestep; shards must not mutate it
+    backend: BackendSpec
+    batch_mode: str = "agent"
+    max_agents_per_call: int = 10
+    group_size: int = 8
+    fired: list = None  # per agent, pre-sampled feed positions (PRESAMPLE_ACTIVITY)
+    prompts: PromptBuilder = None  # None: the original JSON prompts
+    parser: ReplyParser = None  # reply settings (structured, streamed); None: free text, parsed by regex
+    record_replies: bool = False  # send every parsed reply back (for the run recording)
+    feeds: dict = None  # agent id -> personal feed, overriding feed (see agent_tasks)
+
+
+@dataclass
+class ShardResult:
+    shard: int
+    events: list
+    log_entries: list
+    usage: dict
+    seconds: float
+    cache_stats: dict = field(default_factory=dict)
+    parse_stats: dict = field(default_factory=dict)
+    telemetry: list = field(default_factory=list)  # span and LLM call records, for the driver's Telemetry
+    replies: list = field(default_factory=list)  # reply records, if the task asked for them
+
+
+def batch_units(agents, batch_mode="agent", group_size=8, fired=None, feeds=None):
+    """Index lists of agents that must share a shard for it to form the same LLM calls as an unsharded run.
+
+    Whole profile classes stay together in "profile" mode and whole chunks in "group" mode
+    (chunked within agents sharing a feed when feeds are given, as agent_tasks does);
+    otherwise (including pre-sampled engagement) every agent is its own unit.
+    """
+    if fired is not None or batch_mode not in ("profile", "group"):
+        return [[i] for i in range(len(agents))]
+    if batch_mode == "profile":
+        classes = {}
+        for i, agent in enumerate(agents):
+            classes.setdefault(profile_class_key(agent), []).append(i)
+        return list(classes.values())
+    return chunk_agents_by(list(range(len(agents))), group_size,
+                           lambda i: None if feeds is None else id(feeds[agents[i]["id"]]))
+
+
+def shard_agents(units, num_shards):
+    """Deal units to at most num_shards shards, each unit to the least-loaded shard so far.
+
+    Returns the agent indices of each non-empty shard, in unit order.
+    """
+    shards = [[] for _ in range(num_shards)]
+    for unit in units:
+        min(shards, key=len).extend(unit)
+    return [shard for shard in shards if shard]
+
+
+def make_shard_tasks(agents, t, current_time, subreddit, feed, backend, num_shards, fired=None,
+                     batch_mode="agent", max_agents_per_call=10, group_size=8, prompts=None, parser=None,
+                     record_replies=False, feeds=None):
+    """One ShardTask per shard; fired (aligned with agents) and feeds are split alongside."""
+    units = batch_units(agents, batch_mode, group_size, fired, feeds)
+    tasks = []
+    for shard, indices in enumerate(shard_agents(units, num_shards)):
+        shard_agent_list = [agents[i] for i in indices]
+        shard_feeds = None if feeds is None else {a["id"]: feeds[a["id"]] for a in shard_agent_list}
+        tasks.append(ShardTask(shard, t, current_time, subreddit, shard_agent_list, feed, backend,
+                               batch_mode, max_agents_per_call, group_size,
+                               None if fired is None else [fired[i] for i in indices], prompts, parser,
+                               record_replies, shard_feeds))
+    return tasks
+
+
+async def _run_shard(task):
+    backend, cache = task.backend.build()
+    parser = task.parser.fresh() if task.parser else ReplyParser()
+    replies = [] if task.record_replies else None
+    try:
+        coroutines = agent_tasks(task.agents, backend, task.feed, task.current_time, task.t, task.subreddit,
+                                 task.batch_mode, task.max_agents_per_call, task.group_size, task.fired,
+                                 task.prompts or PromptBuilder(), parser, replies, task.feeds)
+        events, log_entries = await collect(coroutines)
+        usage = getattr(backend, "backend", backend).usage  # unwrap CachedBackend
+        return events, log_entries, dict(usage), cache.stats() if cache else {}, parser.stats, replies or []
+    finally:
+        if cache:
+            cache.close()
+
+
+def run_shard(task):
+    """Worker entry point: all LLM work for one shard of one timestep."""
+    start = time.perf_counter()
+    with use_telemetry(Telemetry(keep_records=True)) as telemetry:
+        events, log_entries, usage, cache_stats, parse_stats, replies = asyncio.run(_run_shard(task))
+    for record in telemetry.records:
+        record["shard"] = task.shard
+    return ShardResult(task.shard, events, log_entries, usage, time.perf_counter() - start, cache_stats,
+                       parse_stats, telemetry.records, replies)
+
+
+def merge_shard_results(results):
+    """Combine shard results into (events, log entries, usage) independent of completion order."""
+    events = []
+    log_entries = []
+    usage = new_usage()
+    for result in sorted(results, key=lambda r: r.shard):
+        events.extend(result.events)
+        log_entries.extend(result.log_entries)
+        for key in usage:
+            usage[key] += result.usage.get(key, 0)
+    events.sort(key=event_sort_key)
+    log_entries.sort(key=lambda entry: entry["agent_id"])
+    return events, log_entries, usage
+
+
+class ProcessShardExecutor:
+    """Runs shard tasks on a local process pool.
+
+    Workers are forked where the platform allows it, so a script-style driver is not re-run
+    in every worker; create the executor before starting other threads (it forks right away).
+    """
+
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        self._pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=context)
+        self._pool.submit(int).result()  # start the workers now
+
+    def run(self, tasks):
+        return list(self._pool.map(run_shard, tasks))
+
+    def close(self):
+        self._pool.shutdown()
+
+
+class _QueueManager(BaseManager):
+    pass
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:  # a hostname (or "" for every interface): may be reachable from elsewhere
+        return False
+
+
+class QueueShardExecutor:
+    """Serves shard tasks on a TCP work queue; workers started with `python -m engine.sharding worker`.
+
+    Tasks are handed to whichever worker asks first; results are matched back by shard, so
+    the merged timestep is the same however many workers there are. authkey None: a random
+    key, for a loopback address only.
+    """
+
+    def __init__(self, address, authkey=None, num_workers=0):
+        host, _ = parse_address(address)
+        generated = not authkey
+        if generated:
+            if not is_loopback(host):
+                raise ValueError(f"Refusing to serve the shard work queue on {address} without an explicit "
+                                 f"authkey (set SHARD_AUTHKEY); anyone who can reach it could run code here.")
+            authkey = secrets.token_hex(16)
+        self.num_workers = num_workers
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        _QueueManager.register("tasks", callable=lambda: self._tasks)
+        _QueueManager.register("results", callable=lambda: self._results)
+        self._manager = _QueueManager(address=parse_address(address), authkey=authkey.encode())
+        self._server = self._manager.get_server()
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"📡 Shard work queue listening on {address}")
+        if generated:
+            print(f"🔑 Workers: python -m engine.sharding worker --address {address} --authkey {authkey}")
+
+    def run(self, tasks):
+        for task in tasks:
+            self._tasks.put(task)
+        return [self._results.get() for _ in tasks]
+
+    def close(self):
+        for _ in range(self.num_workers):
+            self._tasks.put(None)  # tells a worker to exit
+        time.sleep(0.5)  # let workers collect their stop signal before the server goes away
+
+
+def work(address, authkey):
+    """Worker loop: take shard tasks from the queue at address until told to stop."""
+    _QueueManager.register("tasks")
+    _QueueManager.register("results")
+    manager = _QueueManager(address=parse_address(address), authkey=authkey.encode())
+    manager.connect()
+    tasks, results = manager.tasks(), manager.results()
+    print(f"👷 Connected to {address}")
+    while True:
+        try:
+            task = tasks.get()
+        except (EOFError, ConnectionError):
+            print("👋 Work queue closed.")
+            break
+        if task is None:
+            break
+        result = run_shard(task)
+        print(f"✅ Timestep {task.t} shard {task.shard}: {len(task.agents)} agents in {result.seconds:.2f}s")
+        results.put(result)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="drain shard tasks from a driver's work queue")
+    worker.add_argument("--address", required=True, help="HOST:PORT the driver serves on")
+    worker.add_argument("--authkey", default=os.getenv("SHARD_AUTHKEY"), required=not os.getenv("SHARD_AUTHKEY"),
+                        help="the driver's key (default: $SHARD_AUTHKEY)")
+    args = parser.parse_args()
+    work(args.address, args.authkey)
+
+
+if __name__ == "__main__":
+    # Run from the imported module so results pickle as engine.sharding.ShardResult, not __main__'s
+    from engine.sharding import main as module_main
+    module_main()
@@ -0,0 +1,369 @@
+import asyncio
+import os
+import random
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from engine.activity_sampling import sample_engagements
+from engine.agent_steps import agent_tasks, collect, make_log_entry
+from engine.backends import DEFAULT_SYSTEM_PROMPT, make_ollama_backend, new_usage
+from engine.events import ActionLog, reduce_timestep
+from engine.llm_cache import CachedBackend, ResponseCache
+from engine.output_sink import StreamingOutputSink
+from engine.profile_classes import profile_class_key
+from engine.prompt_builder import make_prompt_builder
+from engine.release import ReleaseScheduler
+from engine.sharding import (BackendSpec, ProcessShardExecutor, QueueShardExecutor, make_shard_tasks,
+                             merge_shard_results)
+from engine.structured_output import ReplyParser
+from engine.surrogate import SurrogateEngagementModel, ViralityScorer, surrogate_action_text
+from engine.telemetry import Telemetry, span, use_telemetry
+from recommendation.embeddings import EMBEDDING_CACHE_DIR, PostEmbedder, TopicRetriever
+from recommendation.fyp import FeedPipeline, FeedRecommender
+from recommendation.impressions import ImpressionStore
+from recommendation.post_store import PostStore
+
+
+@dataclass
+class SimulationConfig:
+    """Everything a run of the simulation loop depends on; see driver.py for what each knob does."""
+    model_name: str = "llama3"
+    subreddit: str = "SecurityCamera"
+    log_file: str = None
+    posts_out_file: str = None
+    start_time: datetime = datetime(2025, 7, 9, 15, 0, 0)
+    timestep_hours: float = 6
+    num_timesteps: int = 60
+    # Post release: each timestep publishes the posts created in its window of post time. With
+    # release_time_scale > 1 a window covers that many timesteps' worth of post time; replay_span
+    # picks the scale (and start) so the whole queue is released over num_timesteps.
+    release_time_scale: float = 1.0
+    replay_span: bool = False
+    online_rate: float = 0.0075
+    backend_kind: str = "async"
+    max_concurrency: int = 16
+    ollama_host: str = None
+    seed: int = 42
+    cache_file: str = None
+    cache_mode: str = "readwrite"
+    cache_max_mb: int = 512
+    batch_mode: str = "agent"
+    max_agents_per_call: int = 10
+    group_size: int = 8
+    simulation_mode: str = "llm"
+    llm_fraction: float = 0.02
+    route_by_uncertainty: bool = False
+    virality_model_dir: str = "models/roberta_viral_classifier"
+    presample_activity: bool = False
+    prompt_format: str = "json"
+    prompt_token_budget: int = 2000
+    compact_body_chars: int = 280
+    structured_output: bool = False
+    stream_replies: bool = False
+    max_actions_per_agent: int = None
+    num_shards: int = 1
+    shard_queue_address: str = None
+    shard_authkey: str = None  # None: a random key, printed for the workers (loopback addresses only)
+    metrics_file: str = None
+    metrics_port: int = None
+    record_file: str = None
+    # recommend_posts parameters
+    top_k: int = 20
+    weight_recency: float = 0.7
+    weight_popularity: float = 0.3
+    recency_half_life_hours: float = 5.0
+    incremental_ranking: bool = False  # global feed from a RankingIndex instead of rescoring every post
+    # personal feeds (FeedRecommender): topic affinity weight, and dropping posts already shown
+    weight_topic: float = 0.0
+    exclude_seen: bool = False
+    impressions_file: str = None  # posts each agent was shown (.npz): loaded if present, saved on close
+    topic_model: str = None  # sentence-transformers model for topic similarity; None: keyword overlap
+    embedding_cache_dir: str = EMBEDDING_CACHE_DIR
+    topic_candidates: int = 200  # posts scored per profile class with topic_model
+    # two-stage feeds (FeedPipeline): bounded candidate pools per source, reranked
+    feed_pipeline: bool = False
+    candidate_pool: int = 200  # posts per candidate source
+    weight_trending: float = 0.3
+    trending_window_hours: float = 24.0
+
+    @classmethod
+    def field_names(cls):
+        return [f.name for f in fields(cls)]
+
+    def to_dict(self):
+        d = asdict(self)
+        d["start_time"] = self.start_time.isoformat()
+        return d
+
+
+def surrogate_log_entries(agents_by_id, events, current_time, t):
+    """One log entry per agent with surrogate events, describing what it did."""
+    by_agent = {}
+    for event in events:
+        by_agent.setdefault(event.agent_id, []).append(event)
+    return [make_log_entry(agents_by_id[agent_id], current_time, t, surrogate_action_text(agent_events))
+            for agent_id, agent_events in by_agent.items()]
+
+
+class Simulation:
+    """One run of the timestep loop over a fixed set of agents and a post queue.
+
+    Agents are only read. Released posts are updated in place, so each run needs its own
+    post_queue; forked runs (see engine.sweep) get one copy-on-write.
+
+    All randomness comes from two generators seeded with config.seed: agent_rng picks the
+    online agents, rng drives the surrogate and pre-sampled activity. With config.record_file,
+    every timestep's online agents, feed and parsed replies are recorded so that
+    engine.replay can rebuild the run's posts and logs without an LLM.
+    """
+
+    def __init__(self, config, agents, post_queue):
+        self.config = config
+        self.agents = agents
+        self.post_queue = post_queue
+        self.post_store = PostStore()  # released posts, with counters as columns for recommend()
+        self.posts = self.post_store.posts
+        self.logs = []
+        self.action_log = ActionLog()
+        self.post_index = self.post_store.index  # post_id -> position in posts
+        retriever = None
+        if config.topic_model:
+            retriever = TopicRetriever(self.post_store, PostEmbedder(config.topic_model), config.embedding_cache_dir)
+        pipeline = None
+        if config.feed_pipeline:
+            pipeline = FeedPipeline(self.post_store, weight_trending=config.weight_trending,
+                                    pool_size=config.candidate_pool, trending_window_hours=config.trending_window_hours,
+                                    span=span)
+        impressions = None
+        if config.exclude_seen and config.impressions_file and os.path.exists(config.impressions_file):
+            impressions = ImpressionStore.load(config.impressions_file)
+        self.recommender = FeedRecommender(self.post_store, config.top_k, config.weight_recency,
+                                           config.weight_popularity, config.recency_half_life_hours,
+                                           config.weight_topic, config.exclude_seen,
+                                           agents if config.weight_topic else (), config.incremental_ranking,
+                                           retriever, config.topic_candidates, pipeline, impressions,
+                                           profile_class_key)
+        timestep = timedelta(hours=config.timestep_hours)
+        if config.replay_span:
+            self.releases = ReleaseScheduler.spanning(post_queue, timestep, config.num_timesteps)
+        else:
+            self.releases = ReleaseScheduler(post_queue, config.start_time, timestep, config.release_time_scale)
+        self.agent_rng = random.Random(config.seed)
+        self.rng = np.random.default_rng(config.seed)
+        self.surrogate = SurrogateEngagementModel(ViralityScorer(config.virality_model_dir))
+        self.shard_usage = new_usage()
+        self.prompts = make_prompt_builder(config.prompt_format, config.prompt_token_budget, config.compact_body_chars,
+                                           config.structured_output, end_marker=config.stream_replies)
+        self.parser = ReplyParser(config.structured_output, config.stream_replies, config.max_actions_per_agent)
+        self.telemetry = Telemetry(config.metrics_file)
+
+        for path in (config.log_file, config.posts_out_file):
+            if path:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if config.shard_queue_address:
+            self.shard_executor = QueueShardExecutor(config.shard_queue_address, config.shard_authkey,
+                                                     num_workers=config.num_shards)
+        elif config.num_shards > 1:
+            self.shard_executor = ProcessShardExecutor(config.num_shards)
+        else:
+            self.shard_executor = None
+        if config.metrics_port is not None:  # its server thread starts after the shard workers are forked
+            self.telemetry.serve(config.metrics_port)
+        self.sink = StreamingOutputSink(config.log_file, config.posts_out_file, telemetry=self.telemetry,
+                                        record_file=config.record_file, record_header=self.run_header())
+
+        cache_mode = config.cache_mode if config.cache_file else "off"
+        self.cache = ResponseCache(config.cache_file, max_bytes=config.cache_max_mb * 1024 * 1024, mode=cache_mode)
+        self.backend = CachedBackend(
+            make_ollama_backend(config.model_name, kind=config.backend_kind, host=config.ollama_host,
+                                max_concurrency=config.max_concurrency),
+            self.cache, "ollama", config.model_name, params={"system": DEFAULT_SYSTEM_PROMPT},
+            stream_params=self.parser.cutoff,
+        )
+        self.backend_spec = BackendSpec(config.model_name, config.backend_kind, config.ollama_host,
+                                        config.max_concurrency, DEFAULT_SYSTEM_PROMPT, config.cache_file,
+                                        cache_mode, config.cache_max_mb * 1024 * 1024, self.parser.cutoff)
+
+    def run_header(self):
+        """Run metadata, the first line of a recording."""
+        c = self.config
+        return {"kind": "run", "config": c.to_dict(), "seeds": {"online_agents": c.seed, "numpy": c.seed},
+                "num_agents": len(self.agents), "num_posts": len(self.post_queue),
+                "recorded_at": datetime.now().isoformat(timespec="seconds")}
+
+    def get_online_agents(self):
+        n_online = max(1, int(self.config.online_rate * len(self.agents)))
+        return self.agent_rng.sample(self.agents, n_online)
+
+    def recommend(self, current_time, agents=None):
+        """(feed, feeds): the global feed and None, or with personal feeds, the posts of all of the
+        agents' feeds (in release order) and {agent id: feed}."""
+        if agents is None or not self.recommender.personalized:
+            return self.recommender.feed(current_time), None
+        feeds = self.recommender.feeds(agents, current_time)
+        positions = sorted({self.post_index[p["post_id"]] for feed in feeds.values() for p in feed})
+        return [self.posts[i] for i in positions], feeds
+
+    def surrogate_step(self, online_agents, feed, current_time, t, feeds=None):
+        """Split online agents into LLM-routed and surrogate ones and sample the surrogate decisions.
+
+        With feeds (personal feeds over the posts in feed), agents only act on their own feed's posts.
+        """
+        if not feed:
+            return online_agents, [], [], {}
+        c = self.config
+        base = self.surrogate.base_probabilities(online_agents, feed)
+        if feeds is not None:
+            column = {p["post_id"]: j for j, p in enumerate(feed)}
+            in_feed = np.zeros(base.shape, dtype=bool)
+            for i, agent in enumerate(online_agents):
+                in_feed[i, [column[p["post_id"]] for p in feeds[agent["id"]]]] = True
+            base = base * in_feed
+        routed = self.surrogate.route(online_agents, feed, c.llm_fraction, self.rng, c.route_by_uncertainty)
+        surrogate_agents = [a for a, r in zip(online_agents, routed) if not r]
+        events = self.surrogate.sample(surrogate_agents, feed, self.rng, t, base[~routed])
+
+        log_entries = surrogate_log_entries({a["id"]: a for a in surrogate_agents}, events, current_time, t)
+        llm_agents = [a for a, r in zip(online_agents, routed) if r]
+        llm_base = {a["id"]: row for a, row in zip(llm_agents, base[routed])}
+        print(f"🎲 Surrogate: {len(surrogate_agents)} agents, {len(events)} actions; "
+              f"{len(llm_agents)} agents routed to the LLM; scales {self.surrogate.scales}")
+        return llm_agents, events, log_entries, llm_base
+
+    async def step(self, t):
+        with self.telemetry.span("timestep", t=t):
+            await self._step(t)
+
+    async def _step(self, t):
+        c = self.config
+        current_time = c.start_time + timedelta(hours=t * c.timestep_hours)
+        print(f"\n⏰ Timestep {t} — {current_time}")
+
+        # 1. Post new content created during this timestep's window
+        with self.telemetry.span("release", t=t):
+            post_time, _ = self.releases.window(t)  # same as current_time unless replaying compressed
+            new_posts = self.releases.release(t)
+            for p in new_posts:
+                print(f"📢 New post {p['post_id']} published.")
+                self.post_store.add(p)
+        if self.recommender.retriever:
+            with self.telemetry.span("embed", t=t):
+                self.recommender.retriever.sync()  # each post is embedded (or read from the cache) once
+
+        # 2. Get online agents and process concurrently (bounded by max_concurrency, and across
+        #    num_shards processes when sharded); each reply is parsed into action events as it arrives
+        online_agents = self.get_online_agents()
+        online_ids = [a["id"] for a in online_agents]
+        with self.telemetry.span("recommend", t=t):
+            feed, feeds = self.recommend(post_time, online_agents)
+        batch = []
+        step_logs = []
+        surrogate_events = []
+        replies = [] if c.record_file else None
+        if c.simulation_mode == "surrogate":
+            online_agents, surrogate_events, surrogate_logs, llm_base = \
+                self.surrogate_step(online_agents, feed, current_time, t, feeds)
+            batch.extend(surrogate_events)
+            step_logs.extend(surrogate_logs)
+        fired = None
+        if c.presample_activity and c.simulation_mode == "llm":
+            lengths = [len(feed if feeds is None else feeds[a["id"]]) for a in online_agents]
+            draws = sample_engagements(online_agents, max(lengths, default=0), self.rng)
+            fired = [np.flatnonzero(row[:n]).tolist() for row, n in zip(draws, lengths)]
+            print(f"🎲 {sum(map(bool, fired))}/{len(online_agents)} online agents engage this timestep")
+        if self.shard_executor:
+            shard_tasks = make_shard_tasks(online_agents, t, current_time, c.subreddit, feed, self.backend_spec,
+                                           c.num_shards, fired, batch_mode=c.batch_mode,
+                                           max_agents_per_call=c.max_agents_per_call, group_size=c.group_size,
+                                           prompts=self.prompts, parser=self.parser,
+                                           record_replies=replies is not None, feeds=feeds)
+            results = await asyncio.to_thread(self.shard_executor.run, shard_tasks)
+            llm_events, llm_logs, usage = merge_shard_results(results)
+            for key in self.shard_usage:
+                self.shard_usage[key] += usage[key]
+            for result in results:
+                self.parser.add(result.parse_stats)
+                self.cache.add(result.cache_stats)
+                self.telemetry.extend(result.telemetry)
+                if replies is not None:
+                    replies.extend(result.replies)
+        else:
+            llm_events, llm_logs = await collect(agent_tasks(online_agents, self.backend, feed, current_time, t,
+                                                             c.subreddit, c.batch_mode, c.max_agents_per_call,
+                                                             c.group_size, fired, self.prompts, self.parser,
+                                                             replies, feeds))
+        batch.extend(llm_events)
+        step_logs.extend(llm_logs)
+
+        if c.simulation_mode == "surrogate" and llm_logs and feed:
+            # calibrate surrogate rates against the agents whose LLM call succeeded
+            answered = [llm_base[entry["agent_id"]] for entry in llm_logs]
+            feed_ids = {p["post_id"] for p in feed}
+            self.surrogate.observe(np.array(answered), [e for e in llm_events if e.post_id in feed_ids])
+
+        # 3. Apply the whole timestep's actions at once, independent of completion order
+        with self.telemetry.span("apply", t=t):
+            step_events = self.action_log.append_batch(t, batch)
+            touched = reduce_timestep(self.posts, step_events, self.post_index, self.post_store)
+        step_logs.sort(key=lambda entry: entry["agent_id"])
+        self.logs.extend(step_logs)
+
+        # 4. Append only this timestep's log rows and changed posts (written in the background)
+        changed_ids = touched | {p["post_id"] for p in new_posts}
+        records = []
+        if replies is not None:
+            records.append({"kind": "timestep", "t": t, "time": current_time.isoformat(),
+                            "released": [p["post_id"] for p in new_posts], "online": online_ids,
+                            "feed": [p["post_id"] for p in feed]})
+            if feeds is not None:
+                records[-1]["feeds"] = {agent_id: [p["post_id"] for p in agent_feed]
+                                        for agent_id, agent_feed in feeds.items()}
+            if surrogate_events:
+                records.append({"kind": "surrogate", "t": t,
+                                "events": [[e.agent_id, e.post_id, e.action] for e in surrogate_events]})
+            records.extend(sorted(replies, key=lambda record: record["agents"]))
+        self.sink.write_timestep(t, step_logs, [self.posts[self.post_index[i]]
+                                                for i in sorted(changed_ids, key=self.post_index.get)], records)
+
+    async def run(self):
+        with use_telemetry(self.telemetry):  # LLM calls, prompt building and parsing report here
+            for t in range(self.config.num_timesteps):
+                await self.step(t)
+
+    def usage(self):
+        usage = dict(self.backend.backend.usage)
+        for key in usage:
+            usage[key] += self.shard_usage.get(key, 0)
+        return usage
+
+    def close(self):
+        self.sink.close()
+        if self.shard_executor:
+            self.shard_executor.close()
+            print(f"🧮 LLM usage across shards: {self.shard_usage}")
+        if not self.shard_executor:
+            print(f"📏 Prompt tokens: {self.prompts.stats()}")
+        print(f"🧾 Reply parsing: {self.parser.stats}")
+        print(f"🗄️ LLM cache{' (all shards)' if self.shard_executor else ''}: {self.cache.stats()}")
+        self.cache.close()
+        if self.recommender.retriever:
+            self.recommender.retriever.close()
+        if self.recommender.impressions is not None and self.config.impressions_file:
+            self.recommender.impressions.save(self.config.impressions_file)
+            report = self.recommender.impressions.memory_report()
+            print(f"👁️ Impressions: {report['impressions']} for {report['agents']} agents, "
+                  f"{report['total_bytes'] / 2**20:.1f} MB -> {self.config.impressions_file}")
+        self.telemetry.print_summary()
+        self.telemetry.close()
+
+
+def simulate(config, agents, post_queue):
+    """Run the whole simulation; returns the Simulation with its final posts, logs and usage."""
+    simulation = Simulation(config, agents, post_queue)
+    try:
+        asyncio.run(simulation.run())
+    finally:
+        simulation.close()
+    return simulation
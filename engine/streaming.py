@@ -0,0 +1,161 @@
+"""Read agent replies as they stream in and stop generation once nothing more is needed.
+
+An ActionStream counts action blocks while tokens arrive. The stream ends when:
+- the agent (or group) has emitted its maximum number of actions, and the next action block
+  starts (so the last action keeps its Reason: and Comment: lines)
+- the end marker the prompt asks for appears
+- in structured mode, the top-level JSON object closes
+
+The consumer then closes the backend's stream. For Ollama this drops the HTTP connection,
+which aborts generation, so a rambling tail costs neither time nor tokens. The text read up
+to the cutoff is the reply: it is what gets parsed, logged and cached, so a cached or
+non-streaming replay of the same reply gives the same events.
+"""
+import json
+import re
+
+# Same shape as parse_actions, but only counted once the post id can't grow any more
+STREAM_ACTION = re.compile(r"Action:\s*(\w+).*?Post[_ ]ID:\s*(\d+)(?=\D)", re.IGNORECASE | re.DOTALL)
+FINAL_ACTION = re.compile(r"Action:\s*(\w+).*?Post[_ ]ID:\s*(\d+)", re.IGNORECASE | re.DOTALL)
+# The line an action block starts on, e.g. "- Action: like" or "**Action:** like"
+BLOCK_START = re.compile(r"^[^\w\n]*Action[^\w\n]*:", re.IGNORECASE | re.MULTILINE)
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class ActionStream:
+    """Incremental reader for one streamed reply; feed() pieces until it returns True, then finish().
+
+    max_actions counts actions other than "ignore" (None: no cap). A free-text reply that reaches
+    it is cut where the next action block starts, a JSON reply once the capping action closes.
+    end_marker is only used for free-text replies. With stats (a ReplyParser's), replies cut by
+    the action cap are counted under "capped".
+    """
+
+    def __init__(self, structured=False, max_actions=None, end_marker=None, stats=None):
+        self.structured = structured
+        self.max_actions = max_actions
+        self.end_marker = None if structured else end_marker
+        self.stats = stats
+        self.buffer = ""
+        self.actions = 0
+        self.done = False
+        self.capped = False
+        self._full = False  # max_actions reached; text: cut at the next action block
+        self._end = None  # reply ends here (exclusive) once done
+        self._closers = ""  # appended so a JSON reply cut mid-object still parses
+        self._pos = 0  # text: where the next action block is searched from
+        self._stack = []  # structured: (bracket, position) of open JSON containers
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, piece):
+        """Add the next piece of the reply; True once the rest of it isn't needed."""
+        if self.done:
+            return True
+        start = len(self.buffer)
+        self.buffer += piece
+        if self.structured:
+            self._scan_json(start)
+            return self.done
+        limit = len(self.buffer)
+        if self.end_marker:
+            marker = self.buffer.find(self.end_marker, max(0, start - len(self.end_marker) + 1))
+            if marker != -1:
+                limit = marker
+        for match in STREAM_ACTION.finditer(self.buffer, self._pos, limit):
+            if self._full:
+                break
+            self._pos = match.end()
+            self._count(match.group(1))
+        if self._full:
+            following = BLOCK_START.search(self.buffer, self._pos, limit)
+            if following:
+                self.capped = True
+                self._stop(following.start())
+                return True
+        if limit < len(self.buffer):
+            self._stop(limit)
+        return self.done
+
+    def _count(self, action):
+        if action.lower() != "ignore":
+            self.actions += 1
+            if self.max_actions is not None and self.actions >= self.max_actions:
+                self._full = True
+                if self.structured:
+                    self.capped = True
+                    self._stop(self._pos)
+        return self.done
+
+    def _stop(self, end):
+        self.done = True
+        self._end = end
+
+    def _scan_json(self, start):
+        for i in range(start, len(self.buffer)):
+            char = self.buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._stack:
+                self._in_string = True
+            elif char in CLOSERS:
+                self._stack.append((char, i))
+            elif char in "}]" and self._stack:
+                _, opened = self._stack.pop()
+                if not self._stack:
+                    self._stop(i + 1)  # the whole reply object is in; anything after it is chatter
+                    return
+                if char == "}" and self._stack[-1][0] == "[" and self._is_action(self.buffer[opened:i + 1]):
+                    self._pos = i + 1
+                    if self._count("action"):
+                        self._closers = "".join(CLOSERS[b] for b, _ in reversed(self._stack))
+                        return
+
+    @staticmethod
+    def _is_action(text):
+        try:
+            item = json.loads(text)
+        except ValueError:
+            return False
+        return (isinstance(item, dict) and "post_id" in item
+                and str(item.get("action", "ignore")).lower() != "ignore")
+
+    def finish(self):
+        """The reply up to the cutoff (or all of it, if the stream ran out first)."""
+        if not self.done and not self.structured and not self._full:
+            match = FINAL_ACTION.search(self.buffer, self._pos)
+            if match and match.end() == len(self.buffer):  # a block whose post id ends the reply
+                self._pos = match.end()
+                self._count(match.group(1))
+        text = self.buffer if self._end is None else self.buffer[:self._end] + self._closers
+        if self.stats is not None and self.capped:
+            self.stats["capped"] += 1
+        return text
+
+
+async def _whole_reply(backend, prompt, schema):
+    yield await (backend.chat(prompt) if schema is None else backend.chat(prompt, schema))
+
+
+def open_stream(backend, prompt, schema=None):
+    """Async iterator over reply pieces; backends without chat_stream yield the whole reply at once."""
+    if not hasattr(backend, "chat_stream"):
+        return _whole_reply(backend, prompt, schema)
+    return backend.chat_stream(prompt) if schema is None else backend.chat_stream(prompt, schema)
+
+
+async def read_stream(backend, prompt, stream, schema=None):
+    """Stream the reply into stream (an ActionStream) and cancel generation as soon as it is done."""
+    pieces = open_stream(backend, prompt, schema)
+    try:
+        async for piece in pieces:
+            if stream.feed(piece):
+                break
+    finally:
+        await pieces.aclose()
+    return stream.finish()
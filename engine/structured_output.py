@@ -0,0 +1,232 @@
+"""JSON replies constrained by a schema, with the regex parsers as a fallback.
+
+With structured output on, prompts ask for JSON and each backend is handed the matching
+schema (Ollama `format`, Gemini `response_schema`, OpenAI `response_format`), so a reply can
+be read with json.loads instead of regexes. A reply that still isn't valid (a backend without
+constrained decoding, a truncated reply) falls back to the regex parsers. ReplyParser counts
+which path every reply took and how many replies lost their actions.
+"""
+import json
+import re
+
+from engine.prompts import END_MARKER, split_agent_sections
+from engine.streaming import ActionStream
+from posts.analyse_posts import parse_actions, parse_post_counts
+
+ACTION_NAMES = ("like", "comment", "share", "dislike", "ignore")
+
+_ACTION_ITEM = {
+    "type": "object",
+    "properties": {
+        "action": {"type": "string", "enum": ["like", "comment", "ignore"]},
+        "post_id": {"type": "integer"},
+        "reason": {"type": "string"},
+        "comment": {"type": "string"},
+    },
+    "required": ["action", "post_id"],
+}
+
+ACTION_SCHEMA = {
+    "type": "object",
+    "properties": {"actions": {"type": "array", "items": _ACTION_ITEM}},
+    "required": ["actions"],
+}
+
+GROUP_ACTION_SCHEMA = {
+    "type": "object",
+    "properties": {"agents": {"type": "array", "items": {
+        "type": "object",
+        "properties": {"agent": {"type": "integer"}, "actions": {"type": "array", "items": _ACTION_ITEM}},
+        "required": ["agent", "actions"],
+    }}},
+    "required": ["agents"],
+}
+
+POST_COUNTS_SCHEMA = {
+    "type": "object",
+    "properties": {"posts": {"type": "array", "items": {
+        "type": "object",
+        "properties": {"post_id": {"type": "integer"}, "likes": {"type": "integer"},
+                       "comments": {"type": "integer"}},
+        "required": ["post_id", "likes", "comments"],
+    }}},
+    "required": ["posts"],
+}
+
+# An action the reply names but the regex may not have picked up, e.g. "**Action:** Like"
+MENTIONED_ACTION = re.compile(r"Action\W*(like|comment|share|dislike)\b", re.IGNORECASE)
+MENTIONED_POST_COUNT = re.compile(r"Post\W*\d+\W*\d+\s*(likes?|comments?)", re.IGNORECASE)
+
+
+class SchemaError(ValueError):
+    """The reply is JSON but not of the requested shape."""
+
+
+def openai_response_format(name, schema):
+    """OpenAI / OpenRouter `response_format` for a JSON schema."""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+
+
+def load_json_reply(reply):
+    """The JSON object in reply: the whole text, or the first object after a preamble or code fence.
+
+    Raises ValueError if there is none.
+    """
+    try:
+        return json.loads(reply)
+    except ValueError:
+        pass
+    decoder = json.JSONDecoder()
+    start = reply.find("{")
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(reply, start)
+            if isinstance(value, dict):
+                return value
+        except ValueError:
+            pass
+        start = reply.find("{", start + 1)
+    raise ValueError("no JSON object in reply")
+
+
+def _as_int(value):
+    if isinstance(value, bool):
+        raise SchemaError(f"not an integer: {value!r}")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    raise SchemaError(f"not an integer: {value!r}")
+
+
+def _list_field(obj, name):
+    if not isinstance(obj, dict) or not isinstance(obj.get(name), list):
+        raise SchemaError(f"expected an object with a '{name}' list")
+    return obj[name]
+
+
+def validate_actions(items):
+    """[(action, post_id)] from an "actions" list; items of the wrong shape are skipped."""
+    actions = []
+    for item in items:
+        if not isinstance(item, dict) or str(item.get("action", "")).lower() not in ACTION_NAMES:
+            continue
+        try:
+            actions.append((item["action"].lower(), _as_int(item.get("post_id"))))
+        except SchemaError:
+            continue
+    return actions
+
+
+class ReplyParser:
+    """Parses agent and aggregate replies, JSON first when structured, and counts the outcome.
+
+    stats: replies seen; json (valid structured replies); regex (read by the regex parsers,
+    which in structured mode means the JSON was unusable); failed (replies that name actions
+    or post counts none of the parsers could extract); capped (streamed replies cut off at
+    max_actions_per_agent, see engine.streaming).
+    """
+
+    def __init__(self, structured=False, stream=False, max_actions_per_agent=None):
+        self.structured = structured
+        self.streaming = stream
+        self.max_actions_per_agent = max_actions_per_agent
+        self.stats = new_parse_stats()
+
+    def fresh(self):
+        """A parser with the same settings and zeroed stats (e.g. for a shard worker)."""
+        return ReplyParser(self.structured, self.streaming, self.max_actions_per_agent)
+
+    def stream(self, num_agents=1, max_actions=None):
+        """An ActionStream for one reply speaking for num_agents agents, or None when not streaming.
+
+        max_actions overrides the per-agent cap (e.g. one action per pre-sampled post).
+        """
+        if not self.streaming:
+            return None
+        if max_actions is None and self.max_actions_per_agent is not None:
+            max_actions = self.max_actions_per_agent * num_agents
+        return ActionStream(self.structured, max_actions, END_MARKER, self.stats)
+
+    @property
+    def cutoff(self):
+        """What decides where a streamed reply is cut besides its prompt and schema (part of the
+        cache key of streamed replies, see CachedBackend.chat_stream)."""
+        return {"end_marker": END_MARKER, "max_actions_per_agent": self.max_actions_per_agent}
+
+    def schema(self, kind):
+        """Schema to constrain a reply to, or None in free-text mode. kind: "agent", "group" or "post_counts"."""
+        if not self.structured:
+            return None
+        return {"agent": ACTION_SCHEMA, "group": GROUP_ACTION_SCHEMA, "post_counts": POST_COUNTS_SCHEMA}[kind]
+
+    def _structured(self, reply, read):
+        if not self.structured:
+            return None
+        try:
+            value = read(load_json_reply(reply))
+        except ValueError:  # includes SchemaError
+            return None
+        self.stats["replies"] += 1
+        self.stats["json"] += 1
+        return value
+
+    def _fallback(self, reply, value, mentioned):
+        self.stats["replies"] += 1
+        self.stats["regex"] += 1
+        if not value and mentioned.search(reply):
+            self.stats["failed"] += 1
+        return value
+
+    def actions(self, reply):
+        """[(action, post_id)] for a single agent's reply."""
+        value = self._structured(reply, lambda obj: validate_actions(_list_field(obj, "actions")))
+        if value is not None:
+            return value
+        return self._fallback(reply, parse_actions(reply), MENTIONED_ACTION)
+
+    def agent_actions(self, reply, num_agents):
+        """Per agent (index 0..num_agents-1), [(action, post_id)] from a group reply, and the
+        reply text to log for each agent."""
+        def read(obj):
+            per_agent = [[] for _ in range(num_agents)]
+            texts = [[] for _ in range(num_agents)]
+            for block in _list_field(obj, "agents"):
+                k = _as_int(block.get("agent")) if isinstance(block, dict) else 0
+                if 1 <= k <= num_agents:
+                    per_agent[k - 1].extend(validate_actions(_list_field(block, "actions")))
+                    texts[k - 1].append(json.dumps(block["actions"], ensure_ascii=False))
+            return per_agent, ["\n".join(t) for t in texts]
+
+        value = self._structured(reply, read)
+        if value is not None:
+            return value
+        sections = split_agent_sections(reply, num_agents)
+        per_agent = [parse_actions(section) for section in sections]
+        self._fallback(reply, any(per_agent), MENTIONED_ACTION)
+        return per_agent, sections
+
+    def post_counts(self, reply):
+        """[(post_id, likes, comments)] from an aggregate ("decision making body") reply."""
+        def read(obj):
+            counts = []
+            for item in _list_field(obj, "posts"):
+                try:
+                    counts.append((_as_int(item.get("post_id")), _as_int(item.get("likes", 0)),
+                                   _as_int(item.get("comments", 0))))
+                except (SchemaError, AttributeError):
+                    continue
+            return counts
+
+        value = self._structured(reply, read)
+        if value is not None:
+            return value
+        return self._fallback(reply, parse_post_counts(reply), MENTIONED_POST_COUNT)
+
+    def add(self, stats):
+        for key in self.stats:
+            self.stats[key] += stats.get(key, 0)
+
+
+def new_parse_stats():
+    return {"replies": 0, "json": 0, "regex": 0, "failed": 0, "capped": 0}
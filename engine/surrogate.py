@@ -0,0 +1,192 @@
+import os
+
+import numpy as np
+
+from engine.events import ActionEvent
+from engine.profile_classes import profile_class_key
+from recommendation.text import WORD_PATTERN, post_text
+
+VIRALITY_MODEL_DIR = "models/roberta_viral_classifier"  # written by train/roberta_train.py
+MAX_LENGTH = 256
+# Fallback when the classifier isn't available: labels from train/virality_marking_gemini.py
+LABEL_PROBABILITIES = {"very viral": 0.9, "viral": 0.7, "non-viral": 0.3, "not viral": 0.3, "very not viral": 0.1}
+
+
+class ViralityScorer:
+    """P(viral) per post from the fine-tuned RoBERTa classifier, computed once per post.
+
+    Falls back to the post's virality_prediction label (or `default`) when the model
+    directory or transformers/torch are missing.
+    """
+
+    def __init__(self, model_dir=VIRALITY_MODEL_DIR, batch_size=32, default=0.5):
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.default = default
+        self.cache = {}  # post_id -> probability
+        self._model = None
+        self._tokenizer = None
+        self._loaded = False
+
+    def scores(self, posts):
+        missing = [p for p in posts if p["post_id"] not in self.cache]
+        if missing:
+            for post, prob in zip(missing, self._score(missing)):
+                self.cache[post["post_id"]] = float(prob)
+        return np.array([self.cache[p["post_id"]] for p in posts], dtype=float)
+
+    def _score(self, posts):
+        self._load()
+        if self._model is None:
+            return [self._label_probability(p) for p in posts]
+
+        import torch
+        texts = [post_text(p) for p in posts]
+        probs = []
+        with torch.no_grad():
+            for start in range(0, len(texts), self.batch_size):
+                encodings = self._tokenizer(texts[start:start + self.batch_size], truncation=True, padding=True,
+                                            max_length=MAX_LENGTH, return_tensors="pt")
+                logits = self._model(**encodings).logits
+                probs.extend(torch.softmax(logits, dim=1)[:, 1].tolist())
+        return probs
+
+    def _label_probability(self, post):
+        label = post.get("virality_prediction")
+        if isinstance(label, dict):
+            label = label.get("prediction") or label.get("label")
+        return LABEL_PROBABILITIES.get(str(label).strip().lower(), self.default) if label else self.default
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.isdir(self.model_dir):
+            print(f"[!] No virality classifier at {self.model_dir}, using virality_prediction labels.")
+            return
+        try:
+            from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        except ImportError:
+            print("[!] transformers not installed, using virality_prediction labels.")
+            return
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        self._model = AutoModelForSequenceClassification.from_pretrained(self.model_dir)
+        self._model.eval()
+
+
+class SurrogateEngagementModel:
+    """Cheap per-(agent, post) like/comment probabilities for mixed-fidelity runs.
+
+    p = scale * P(viral | post) * daily_activity_rate * (topic_floor + (1 - topic_floor) * topic_overlap)
+
+    with separate scales for likes and comments. Topic overlap is the share of an
+    agent's topic weight whose keywords appear in the post, computed per profile class
+    so 43k agents cost no more than their ~100 distinct profiles.
+
+    The scales are calibrated online against the agents routed to the LLM each
+    timestep, so surrogate totals track what the full-LLM mode would produce.
+    """
+
+    def __init__(self, scorer=None, like_scale=1.0, comment_scale=0.4, topic_floor=0.1, calibration_prior=20.0):
+        self.scorer = scorer or ViralityScorer()
+        self.topic_floor = topic_floor
+        self.calibration_prior = calibration_prior
+        self.initial_scales = {"like": like_scale, "comment": comment_scale}
+        self.scales = dict(self.initial_scales)
+        self._observed = {"like": 0.0, "comment": 0.0}
+        self._expected = {"like": 0.0, "comment": 0.0}
+        self._post_words = {}  # post_id -> set of words
+        self._class_index = {}  # profile class key -> row
+        self._agent_rows = {}  # agent id -> profile class row
+        self._class_topics = []  # row -> {keyword: weight}
+
+    def base_probabilities(self, agents, posts):
+        """Unscaled engagement probability matrix, shape (len(agents), len(posts))."""
+        virality = self.scorer.scores(posts)
+        rates = np.clip(np.array([a.get("daily_activity_rate") or 0.0 for a in agents], dtype=float), 0.0, 1.0)
+        classes = np.array([self._class_row(a) for a in agents], dtype=np.int64)
+        overlap = self._class_overlap(posts)[classes]
+        topic = self.topic_floor + (1.0 - self.topic_floor) * overlap
+        return virality[None, :] * rates[:, None] * topic
+
+    def uncertainty(self, posts):
+        """1 at P(viral)=0.5, 0 when the classifier is certain."""
+        return 1.0 - np.abs(2.0 * self.scorer.scores(posts) - 1.0)
+
+    def route(self, agents, posts, llm_fraction, rng, by_uncertainty=False):
+        """Pick which agents go to the LLM; returns a boolean mask over agents.
+
+        With llm_fraction > 0 at least one agent is routed, so small online sets still calibrate.
+        """
+        n_llm = int(round(llm_fraction * len(agents)))
+        if llm_fraction > 0:
+            n_llm = min(max(1, n_llm), len(agents))
+        mask = np.zeros(len(agents), dtype=bool)
+        if n_llm <= 0:
+            return mask
+        if by_uncertainty:
+            # agents most likely to engage with the posts the classifier is least sure about
+            weight = self.base_probabilities(agents, posts) @ self.uncertainty(posts)
+            order = np.argsort(-weight, kind="stable")
+        else:
+            order = rng.permutation(len(agents))
+        mask[order[:n_llm]] = True
+        return mask
+
+    def sample(self, agents, posts, rng, timestep, base=None):
+        """Draw like/comment events for agents on posts."""
+        if base is None:
+            base = self.base_probabilities(agents, posts)
+        events = []
+        for action in ("like", "comment"):
+            fired = rng.random(base.shape) < np.clip(base * self.scales[action], 0.0, 1.0)
+            for a, p in zip(*np.nonzero(fired)):
+                events.append(ActionEvent(timestep, agents[a]["id"], posts[p]["post_id"], action))
+        return events
+
+    def observe(self, base, llm_events):
+        """Calibrate scales from LLM-routed agents' base probabilities and their real events."""
+        expected = float(base.sum())
+        for action in ("like", "comment"):
+            self._expected[action] += expected
+            self._observed[action] += sum(1 for e in llm_events if e.action == action)
+            prior = self.calibration_prior
+            self.scales[action] = (self._observed[action] + prior * self.initial_scales[action]) \
+                / (self._expected[action] + prior)
+
+    def _class_row(self, agent):
+        row = self._agent_rows.get(agent["id"])
+        if row is not None:
+            return row
+        key = profile_class_key(agent)
+        row = self._class_index.get(key)
+        if row is None:
+            row = self._class_index[key] = len(self._class_topics)
+            topics = agent.get("topics") or {}
+            if not isinstance(topics, dict):
+                topics = {k: 1.0 for k in topics}
+            self._class_topics.append({k.lower(): float(w) for k, w in topics.items()})
+        self._agent_rows[agent["id"]] = row
+        return row
+
+    def _class_overlap(self, posts):
+        overlap = np.zeros((len(self._class_topics), len(posts)))
+        words = [self._words(p) for p in posts]
+        for row, topics in enumerate(self._class_topics):
+            total = sum(topics.values())
+            if total <= 0:
+                continue
+            for col, post_words in enumerate(words):
+                overlap[row, col] = sum(w for k, w in topics.items() if k in post_words) / total
+        return overlap
+
+    def _words(self, post):
+        words = self._post_words.get(post["post_id"])
+        if words is None:
+            words = self._post_words[post["post_id"]] = set(WORD_PATTERN.findall(post_text(post).lower()))
+        return words
+
+
+def surrogate_action_text(events):
+    """Log text for surrogate decisions, in the same format agents reply in."""
+    return "\n".join(f"- Action: {e.action}\n- Post_ID: {e.post_id}\n- Reason: surrogate" for e in events)
@@ -0,0 +1,228 @@
+"""Run many simulation configs concurrently and rank them against a validation scrape.
+
+A sweep spec (JSON) names the data, the fixed settings and either a grid or a random search
+over SimulationConfig fields:
+
+    {
+      "name": "recency_vs_rate",
+      "agents_file": "agents/agents_SecurityCamera.json",
+      "posts_file": "posts/posts_SecurityCamera.json",
+      "validation_file": "validation/validation_SecurityCamera.csv",
+      "workers": 4,
+      "base": {"subreddit": "SecurityCamera", "start_time": "2025-07-09T15:00:00", "num_timesteps": 20},
+      "grid": {"online_rate": [0.005, 0.01], "weight_recency": [0.5, 0.7, 0.9]}
+    }
+
+or, instead of "grid":
+
+      "random": {"num_runs": 16, "seed": 0, "params": {
+          "online_rate": {"loguniform": [0.001, 0.05]},
+          "recency_half_life_hours": {"uniform": [1, 24]},
+          "model_name": {"choice": ["llama3", "mistral"]}}}
+
+Agents and posts are loaded once and shared copy-on-write with forked workers. Each run
+writes its config, logs, posts and stdout under <output_dir>/<name>/run_NNN/, and
+summary.csv ranks runs by validation error (lower is better).
+
+Run from the repo root:  python -m engine.sweep sweep.json
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from engine.simulation import SimulationConfig, simulate
+
+SUMMARY_FIELDS = ["rank", "run", "error", "rmse_log_likes", "rmse_log_comments", "spearman_score", "matched",
+                  "calls", "parse_failures", "seconds", "status"]
+
+# Loaded once in the parent; forked workers read them without copying
+_AGENTS = None
+_POST_QUEUE = None
+
+
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def sample_param(rng, dist):
+    (kind, args), = dist.items()
+    if kind == "uniform":
+        return rng.uniform(*args)
+    if kind == "loguniform":
+        return math.exp(rng.uniform(math.log(args[0]), math.log(args[1])))
+    if kind == "randint":
+        return rng.randint(*args)
+    if kind == "choice":
+        return rng.choice(args)
+    raise ValueError(f"Unknown distribution: {kind}")
+
+
+def expand_random(spec):
+    rng = random.Random(spec.get("seed", 0))
+    return [{name: sample_param(rng, dist) for name, dist in spec["params"].items()}
+            for _ in range(spec["num_runs"])]
+
+
+def expand_spec(spec):
+    """Parameter overrides for every run of the sweep."""
+    if "grid" in spec:
+        overrides = expand_grid(spec["grid"])
+    elif "random" in spec:
+        overrides = expand_random(spec["random"])
+    else:
+        overrides = [{}]
+    known = set(SimulationConfig.field_names())
+    for params in [spec.get("base", {})] + overrides:
+        unknown = set(params) - known
+        if unknown:
+            raise ValueError(f"Unknown simulation settings: {', '.join(sorted(unknown))}")
+    return overrides
+
+
+def make_config(base, overrides, run_dir):
+    settings = {**base, **overrides}
+    if isinstance(settings.get("start_time"), str):
+        settings["start_time"] = datetime.fromisoformat(settings["start_time"])
+    settings.setdefault("cache_file", None)  # runs don't share a response cache unless the spec asks for one
+    settings["log_file"] = os.path.join(run_dir, "simulation_log.csv")
+    settings["posts_out_file"] = os.path.join(run_dir, "posts.csv")
+    settings["metrics_file"] = os.path.join(run_dir, "metrics.jsonl")
+    settings["metrics_port"] = None  # parallel runs would fight over one port
+    settings["embedding_cache_dir"] = None  # an embedding cache takes one writer at a time
+    if settings.get("record_file"):
+        settings["record_file"] = os.path.join(run_dir, "recording.jsonl")
+    if settings.get("impressions_file"):
+        settings["impressions_file"] = os.path.join(run_dir, "impressions.npz")
+    return SimulationConfig(**settings)
+
+
+def validation_error(posts_csv, validation_csv, urls=None):
+    """Compare simulated engagement to a validation scrape, joined on post url.
+
+    Posts the simulation never released count as zero engagement. error is the mean of the
+    RMSEs of log1p(likes) and log1p(comments).
+    """
+    validation = pd.read_csv(validation_csv)
+    if urls is not None:
+        validation = validation[validation["url"].isin(urls)]
+    if os.path.exists(posts_csv) and os.path.getsize(posts_csv):
+        simulated = pd.read_csv(posts_csv)[["url", "num_likes", "num_comments"]].drop_duplicates("url", keep="last")
+    else:
+        simulated = pd.DataFrame(columns=["url", "num_likes", "num_comments"])
+    joined = validation[["url", "num_likes", "num_comments"]].merge(simulated, on="url", how="left",
+                                                                     suffixes=("_real", "_sim")).fillna(0)
+    if joined.empty:
+        return {"error": float("inf"), "rmse_log_likes": None, "rmse_log_comments": None,
+                "spearman_score": None, "matched": 0}
+
+    def rmse(column):
+        diff = np.log1p(joined[f"{column}_sim"].astype(float)) - np.log1p(joined[f"{column}_real"].astype(float))
+        return float(np.sqrt(np.mean(diff ** 2)))
+
+    real_score = joined["num_likes_real"] + joined["num_comments_real"]
+    sim_score = joined["num_likes_sim"] + joined["num_comments_sim"]
+    spearman = real_score.rank().corr(sim_score.rank())
+    likes, comments = rmse("num_likes"), rmse("num_comments")
+    return {"error": (likes + comments) / 2, "rmse_log_likes": likes, "rmse_log_comments": comments,
+            "spearman_score": None if pd.isna(spearman) else float(spearman), "matched": len(joined)}
+
+
+def run_one(index, config, validation_file):
+    """Worker: one simulation with its own copy of post state, stdout captured to the run directory."""
+    run_dir = os.path.dirname(config.log_file)
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config.to_dict(), f, indent=2)
+
+    result = {"run": index, "status": "ok"}
+    start = time.perf_counter()
+    with open(os.path.join(run_dir, "stdout.log"), "w", encoding="utf-8") as out, contextlib.redirect_stdout(out):
+        try:
+            post_queue = [dict(p) for p in _POST_QUEUE]  # released posts are mutated in place
+            simulation = simulate(config, _AGENTS, post_queue)
+            result["calls"] = simulation.usage()["calls"]
+            result["parse_failures"] = simulation.parser.stats["failed"]
+        except Exception as e:
+            traceback.print_exc(file=out)
+            result["status"] = f"failed: {e}"
+    result["seconds"] = round(time.perf_counter() - start, 2)
+    if validation_file:
+        result.update(validation_error(config.posts_out_file, validation_file, {p["url"] for p in _POST_QUEUE}))
+    return result
+
+
+def write_summary(results, overrides, path):
+    ranked = sorted(results, key=lambda r: (r["status"] != "ok", r.get("error", float("inf")), r["run"]))
+    param_names = sorted({name for params in overrides for name in params})
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS + param_names, extrasaction="ignore")
+        writer.writeheader()
+        for rank, result in enumerate(ranked, start=1):
+            writer.writerow({**result, **overrides[result["run"]], "rank": rank})
+    return ranked, param_names
+
+
+def run_sweep(spec, workers=None):
+    global _AGENTS, _POST_QUEUE
+    with open(spec["agents_file"], "r", encoding="utf-8") as f:
+        _AGENTS = json.load(f)
+    with open(spec["posts_file"], "r", encoding="utf-8") as f:
+        _POST_QUEUE = json.load(f)
+
+    overrides = expand_spec(spec)
+    sweep_dir = os.path.join(spec.get("output_dir", os.path.join("output", "sweeps")), spec.get("name", "sweep"))
+    os.makedirs(sweep_dir, exist_ok=True)
+    with open(os.path.join(sweep_dir, "spec.json"), "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=2)
+    configs = [make_config(spec.get("base", {}), params, os.path.join(sweep_dir, f"run_{i:03d}"))
+               for i, params in enumerate(overrides)]
+
+    workers = workers or spec.get("workers") or os.cpu_count()
+    print(f"🧪 Sweep '{spec.get('name', 'sweep')}': {len(configs)} runs on {workers} workers -> {sweep_dir}")
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(run_one, i, config, spec.get("validation_file")) for i, config in enumerate(configs)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"✅ run_{result['run']:03d} {result['status']} in {result['seconds']}s, "
+                  f"error {result.get('error', float('nan')):.4f}")
+
+    ranked, param_names = write_summary(results, overrides, os.path.join(sweep_dir, "summary.csv"))
+    print(f"\n{'rank':>4} {'run':>8} {'error':>8} {'spearman':>9}  " + "  ".join(param_names))
+    for rank, result in enumerate(ranked, start=1):
+        spearman = result.get("spearman_score")
+        params = "  ".join(f"{overrides[result['run']][n]!r}" for n in param_names)
+        print(f"{rank:>4} {'run_%03d' % result['run']:>8} {result.get('error', float('nan')):>8.4f} "
+              f"{'-' if spearman is None else f'{spearman:.3f}':>9}  {params}")
+    print(f"📝 Summary written to {os.path.join(sweep_dir, 'summary.csv')}")
+    return ranked
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("spec", help="sweep spec JSON")
+    parser.add_argument("--workers", type=int, help="concurrent runs (default: spec 'workers' or CPU count)")
+    args = parser.parse_args()
+    with open(args.spec, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    run_sweep(spec, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Where a run's time goes: stage spans, per-call LLM metrics and their percentiles.
+
+Spans time the stages of a timestep (release, recommend, prompt_build, llm_call, parse,
+apply, write). LLM backends report one record per call: queue wait, time to first token,
+total latency, prompt and completion tokens. Every record can be appended to a JSONL
+metrics file and served as Prometheus text on a local port. At the end of a run, summary()
+gives p50/p95/p99 per stage and token throughput.
+
+The active Telemetry is kept in a context variable, so code on the run's event loop (and in
+asyncio.to_thread) reports to it without being handed it; see use_telemetry().
+"""
+import contextlib
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+STAGES = ("release", "embed", "recommend", "prompt_build", "llm_call", "parse", "apply", "write", "timestep")
+CALL_METRICS = ("queue_wait", "ttft", "latency")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Telemetry:
+    """Collects span and LLM call records; thread-safe.
+
+    metrics_file: JSONL file every record is appended to (None: in memory only).
+    keep_records: also keep the raw records (shard workers send them back to the driver).
+    """
+
+    def __init__(self, metrics_file=None, keep_records=False):
+        self.samples = {}  # stage or "llm.<metric>" -> list of values
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.calls = 0
+        self.records = [] if keep_records else None
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._file = None
+        self._server = None
+        if metrics_file:
+            os.makedirs(os.path.dirname(metrics_file) or ".", exist_ok=True)
+            self._file = open(metrics_file, "w", encoding="utf-8")
+
+    @contextlib.contextmanager
+    def span(self, stage, **labels):
+        """Time the enclosed block as one sample of stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add({"kind": "span", "stage": stage, "seconds": time.perf_counter() - start, **labels})
+
+    def record_call(self, latency, queue_wait=0.0, ttft=None, prompt_tokens=0, completion_tokens=0, **labels):
+        """One LLM request. latency includes queue_wait; ttft (from the request being sent) is None
+        when the reply wasn't streamed."""
+        self.add({"kind": "llm_call", "queue_wait": queue_wait, "ttft": ttft, "latency": latency,
+                  "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, **labels})
+
+    def add(self, record):
+        record.setdefault("time", time.time())
+        with self._lock:
+            if record["kind"] == "span":
+                self.samples.setdefault(record["stage"], []).append(record["seconds"])
+            else:
+                self.calls += 1
+                self.tokens["prompt"] += record.get("prompt_tokens") or 0
+                self.tokens["completion"] += record.get("completion_tokens") or 0
+                for metric in CALL_METRICS:
+                    if record.get(metric) is not None:
+                        self.samples.setdefault(f"llm.{metric}", []).append(record[metric])
+            if self.records is not None:
+                self.records.append(record)
+            if self._file:
+                self._file.write(json.dumps(record, default=str) + "\n")
+
+    def extend(self, records):
+        """Add records collected elsewhere (e.g. by a shard worker)."""
+        for record in records:
+            self.add(dict(record))
+
+    def summary(self):
+        """{name: {count, total, p50, p95, p99}} for every stage and LLM call metric, plus throughput."""
+        with self._lock:
+            samples = {name: np.asarray(values, dtype=float) for name, values in self.samples.items()}
+            tokens = dict(self.tokens)
+            calls = self.calls
+        elapsed = time.perf_counter() - self.started
+        stats = {}
+        for name, values in samples.items():
+            p50, p95, p99 = np.quantile(values, QUANTILES)
+            stats[name] = {"count": len(values), "total": float(values.sum()),
+                           "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+        stats["throughput"] = {"calls": calls, "seconds": elapsed, "prompt_tokens": tokens["prompt"],
+                               "completion_tokens": tokens["completion"],
+                               "prompt_tokens_per_sec": tokens["prompt"] / elapsed if elapsed else 0.0,
+                               "completion_tokens_per_sec": tokens["completion"] / elapsed if elapsed else 0.0}
+        return stats
+
+    def print_summary(self):
+        stats = self.summary()
+        throughput = stats.pop("throughput")
+        order = [s for s in STAGES if s in stats] + sorted(n for n in stats if n not in STAGES)
+        print(f"\n⏱️ {'stage':<20} {'count':>7} {'total_s':>9} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9}")
+        for name in order:
+            s = stats[name]
+            print(f"   {name:<20} {s['count']:>7} {s['total']:>9.2f} {s['p50'] * 1000:>9.1f} "
+                  f"{s['p95'] * 1000:>9.1f} {s['p99'] * 1000:>9.1f}")
+        print(f"   {throughput['calls']} LLM calls, {throughput['prompt_tokens_per_sec']:.0f} prompt and "
+              f"{throughput['completion_tokens_per_sec']:.1f} completion tokens/s over {throughput['seconds']:.1f}s")
+
+    def prometheus_text(self):
+        """The current metrics in the Prometheus text exposition format."""
+        stats = self.summary()
+        throughput = stats.pop("throughput")
+        lines = ["# HELP oasis_stage_seconds Time spent in each simulation stage.",
+                 "# TYPE oasis_stage_seconds summary"]
+        call_lines = ["# HELP oasis_llm_call_seconds Queue wait, time to first token and latency of LLM calls.",
+                      "# TYPE oasis_llm_call_seconds summary"]
+        for name, s in sorted(stats.items()):
+            if name.startswith("llm."):
+                metric, labels = "oasis_llm_call_seconds", f'metric="{name[4:]}"'
+                out = call_lines
+            else:
+                metric, labels = "oasis_stage_seconds", f'stage="{name}"'
+                out = lines
+            for q, key in zip(QUANTILES, ("p50", "p95", "p99")):
+                out.append(f'{metric}{{{labels},quantile="{q}"}} {s[key]}')
+            out.append(f"{metric}_sum{{{labels}}} {s['total']}")
+            out.append(f"{metric}_count{{{labels}}} {s['count']}")
+        lines += call_lines
+        lines += ["# HELP oasis_llm_calls_total LLM requests made.", "# TYPE oasis_llm_calls_total counter",
+                  f"oasis_llm_calls_total {throughput['calls']}",
+                  "# HELP oasis_llm_tokens_total Tokens sent to and generated by the LLM.",
+                  "# TYPE oasis_llm_tokens_total counter",
+                  f'oasis_llm_tokens_total{{kind="prompt"}} {throughput["prompt_tokens"]}',
+                  f'oasis_llm_tokens_total{{kind="completion"}} {throughput["completion_tokens"]}',
+                  "# HELP oasis_llm_tokens_per_second Token throughput since the run started.",
+                  "# TYPE oasis_llm_tokens_per_second gauge",
+                  f'oasis_llm_tokens_per_second{{kind="prompt"}} {throughput["prompt_tokens_per_sec"]}',
+                  f'oasis_llm_tokens_per_second{{kind="completion"}} {throughput["completion_tokens_per_sec"]}']
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve prometheus_text() at http://host:port/metrics on a background thread."""
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"📈 Metrics on http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server.server_address[1]
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class NullTelemetry(Telemetry):
+    """Discards every record; what current_telemetry() returns outside a run."""
+
+    def add(self, record):
+        pass
+
+
+_current = contextvars.ContextVar("telemetry", default=None)
+_fallback = NullTelemetry()
+
+
+def current_telemetry():
+    return _current.get() or _fallback
+
+
+@contextlib.contextmanager
+def use_telemetry(telemetry):
+    """Make telemetry the one current_telemetry() returns within the block (and tasks started in it)."""
+    token = _current.set(telemetry)
+    try:
+        yield telemetry
+    finally:
+        _current.reset(token)
+
+
+def span(stage, **labels):
+    """current_telemetry().span(stage, **labels)"""
+    return current_telemetry().span(stage, **labels)
+
+
+def run_profiled(path, fn, *args, **kwargs):
+    """fn(*args, **kwargs) under cProfile; stats are dumped to path and the top entries printed."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        profiler.dump_stats(path)
+        print(f"\n🔬 Profile written to {path} (open with `python -m pstats {path}` or snakeviz)")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
@@ -2,19 +2,23 @@ import json
 import re
 import pandas as pd
 
-def update_posts_csv_from_llm_output(response_text, posts, output_path=None):
-
+def parse_post_counts(response_text):
+    """Parse an aggregate LLM response into a list of (post_id, likes, comments)."""
     pattern = r"Post\s+(\d+):\s*(?:(\d+)\s+likes?,\s*)?(?:(\d+)\s+comments?)?"
     matches = re.findall(pattern, response_text)
+    return [(int(post_id), int(likes) if likes else 0, int(comments) if comments else 0)
+            for post_id, likes, comments in matches]
 
-    if not matches:
+def update_posts_csv_from_llm_output(response_text, posts, output_path=None):
+    return apply_post_counts(posts, parse_post_counts(response_text))
+
+def apply_post_counts(posts, counts):
+    """Set each post's likes and comments to the counts parsed from an aggregate response."""
+    if not counts:
        print("[!] No valid updates found in response.")
        return posts
 
-    for post_id_str, likes_str, comments_str in matches:
-       post_id = int(post_id_str)
-       likes = int(likes_str) if likes_str else 0
-       comments = int(comments_str) if comments_str else 0
+    for post_id, likes, comments in counts:
        # Find and update the post
        updated = False
        for post in posts:
@@ -32,18 +36,21 @@ def update_posts_csv_from_llm_output(response_text, posts, output_path=None):
 
     return posts
 
-def apply_action_to_post(posts, response_text):
-    """Parse LLM response and apply the action to the relevant post."""
+def parse_actions(response_text):
+    """Parse LLM response into a list of (action, post_id) pairs."""
     pattern = r"Action:\s*(\w+).*?Post[_ ]ID:\s*(\d+)"
     matches = re.findall(pattern, response_text, re.IGNORECASE | re.DOTALL)
+    return [(action.lower(), int(post_id)) for action, post_id in matches]
+
+def apply_action_to_post(posts, response_text):
+    """Parse LLM response and apply the action to the relevant post."""
+    matches = parse_actions(response_text)
 
     if not matches:
         print("[!] No valid action found.")
         return posts
 
     for action, post_id in matches:
-        action = action.lower()
-        post_id = int(post_id)
 
         # Find and update the post
         updated = False
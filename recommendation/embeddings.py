@@ -0,0 +1,274 @@
+"""Post and topic embeddings for the For-You feed, with an on-disk cache and ANN retrieval.
+
+- PostEmbedder: sentence-transformers on CPU; hashed bags of words if it isn't installed
+- EmbeddingCache: post_id -> vector for one model, as a memory-mapped float32 matrix on disk,
+  so a post is embedded once across runs
+- TopicIndex: nearest posts to a query vector; a pynndescent graph over the posts indexed
+  so far plus an exact scan of the posts released since, rebuilt as that tail grows
+- TopicRetriever: the three over a PostStore; embeds newly released posts, embeds each
+  profile's topics once (the weighted mean of its keywords' embeddings) and retrieves a
+  bounded pool of topical candidates per profile
+
+Vectors are L2-normalized, so cosine similarity is a dot product.
+"""
+import os
+import re
+import zlib
+
+import numpy as np
+
+from recommendation.text import WORD_PATTERN, post_text
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_DIR = os.path.join("output", "embeddings")
+HASHING_DIM = 256
+
+
+def unit_rows(vectors):
+    """vectors (float32) with every non-zero row scaled to length 1."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class PostEmbedder:
+    """Text -> unit vectors with a sentence-transformers model, loaded on first use.
+
+    Falls back to hashed bags of words (HASHING_DIM buckets, signed) when
+    sentence-transformers is missing; key names what the vectors came from, for the cache.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=64, device="cpu"):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.device = device
+        self._model = None
+        self._loaded = False
+
+    @property
+    def key(self):
+        self._load()
+        return self.model_name if self._model is not None else f"hashing-{HASHING_DIM}"
+
+    @property
+    def dim(self):
+        self._load()
+        return self._model.get_sentence_embedding_dimension() if self._model is not None else HASHING_DIM
+
+    def encode(self, texts):
+        self._load()
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        if self._model is None:
+            return unit_rows([self._hashed(text) for text in texts])
+        return unit_rows(self._model.encode(list(texts), batch_size=self.batch_size, show_progress_bar=False,
+                                            convert_to_numpy=True))
+
+    @staticmethod
+    def _hashed(text):
+        vector = np.zeros(HASHING_DIM, dtype=np.float32)
+        for word in WORD_PATTERN.findall(text.lower()):
+            h = zlib.crc32(word.encode())
+            vector[h % HASHING_DIM] += 1.0 if h & 0x80000000 else -1.0
+        return vector
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            print("[!] sentence-transformers not installed, embedding posts as hashed bags of words.")
+            return
+        self._model = SentenceTransformer(self.model_name, device=self.device)
+
+
+class EmbeddingCache:
+    """post_id -> vector for one embedding model, on disk under directory/<model key>/.
+
+    vectors.f32 is a float32 matrix, memory-mapped and grown by doubling; ids.txt lists the
+    post_id of each row. Vectors are flushed before their ids are appended, so a row is only
+    ever read back once it is complete. One writer per directory at a time.
+    """
+
+    def __init__(self, directory, model_key, dim, capacity=1024):
+        self.dim = dim
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9._-]+", "_", model_key))
+        os.makedirs(self.directory, exist_ok=True)
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._ids_path = os.path.join(self.directory, "ids.txt")
+        self.rows = {}  # str(post_id) -> row
+        if os.path.exists(self._ids_path):
+            with open(self._ids_path, "r+", encoding="utf-8") as f:
+                text = f.read()
+                complete = text[:text.rfind("\n") + 1]
+                if len(complete) < len(text):  # an unterminated last line is a torn write
+                    f.seek(len(complete.encode()))
+                    f.truncate()
+            self.rows = {post_id: row for row, post_id in enumerate(complete.split("\n")[:-1])}
+        self._ids = open(self._ids_path, "a", encoding="utf-8")
+        stored = os.path.getsize(self._vectors_path) // (4 * dim) if os.path.exists(self._vectors_path) else 0
+        self._capacity = max(capacity, stored, len(self.rows))
+        self._vectors = self._map(self._capacity)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, post_id):
+        return str(post_id) in self.rows
+
+    def _map(self, capacity):
+        mode = "r+" if os.path.exists(self._vectors_path) else "w+"
+        return np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+
+    def get(self, post_ids):
+        """Vectors of post_ids (all must be cached), one row each."""
+        return np.array(self._vectors[[self.rows[str(post_id)] for post_id in post_ids]])
+
+    def put(self, post_ids, vectors):
+        new = [(str(post_id), vector) for post_id, vector in zip(post_ids, vectors) if str(post_id) not in self.rows]
+        if not new:
+            return
+        start = len(self.rows)
+        if start + len(new) > self._capacity:
+            while self._capacity < start + len(new):
+                self._capacity *= 2
+            self._vectors.flush()
+            self._vectors = self._map(self._capacity)
+        self._vectors[start:start + len(new)] = np.stack([vector for _, vector in new])
+        self._vectors.flush()
+        for post_id, _ in new:
+            self.rows[post_id] = len(self.rows)
+        self._ids.write("".join(f"{post_id}\n" for post_id, _ in new))
+        self._ids.flush()
+
+    def close(self):
+        self._vectors.flush()
+        self._ids.close()
+
+
+class TopicIndex:
+    """Nearest unit vectors (by cosine similarity) among those added, by position.
+
+    Positions below `built` are searched with a pynndescent graph, the rest exactly; the
+    graph is rebuilt once the exact tail is more than rebuild_fraction of it. Until
+    exact_below vectors (or without pynndescent) every search is exact.
+    """
+
+    def __init__(self, dim, n_neighbors=30, rebuild_fraction=0.25, exact_below=5000, seed=0):
+        self.n_neighbors = n_neighbors
+        self.rebuild_fraction = rebuild_fraction
+        self.exact_below = exact_below
+        self.seed = seed
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.built = 0  # vectors covered by the graph
+        self._count = 0
+        self._graph = None
+        self._nndescent = None
+
+    def __len__(self):
+        return self._count
+
+    def add(self, vectors):
+        n = self._count + len(vectors)
+        if n > len(self.vectors):
+            grown = np.empty((max(n, 2 * len(self.vectors), 1024), self.vectors.shape[1]), dtype=np.float32)
+            grown[:self._count] = self.vectors[:self._count]
+            self.vectors = grown
+        self.vectors[self._count:n] = vectors
+        self._count = n
+
+    def _maybe_build(self):
+        tail = self._count - self.built
+        if self._count < self.exact_below or tail <= self.rebuild_fraction * self.built:
+            return
+        if self._nndescent is None:
+            try:
+                from pynndescent import NNDescent
+            except ImportError:
+                print("[!] pynndescent not installed, topical retrieval scans every post.")
+                self._nndescent = False
+                return
+            self._nndescent = NNDescent
+        if self._nndescent:
+            self._graph = self._nndescent(self.vectors[:self._count], metric="cosine", n_neighbors=self.n_neighbors,
+                                          random_state=self.seed, low_memory=True)
+            self._graph.prepare()
+            self.built = self._count
+
+    def query(self, queries, k):
+        """Positions of the (about) k nearest vectors to each query row, nearest first."""
+        self._maybe_build()
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(k, self._count)
+        if k <= 0:
+            return [np.empty(0, dtype=np.int64) for _ in queries]
+        start = self.built if self._graph is not None else 0
+        tail = queries @ self.vectors[start:self._count].T  # exact part: (queries, tail posts)
+        if start == 0:
+            results = []
+            for sims in tail:
+                nearest = np.argpartition(-sims, k - 1)[:k]
+                results.append(nearest[np.argsort(-sims[nearest], kind="stable")])
+            return results
+        indices, distances = self._graph.query(queries, k=min(k, start))
+        results = []
+        for q, sims in enumerate(tail):
+            positions = np.concatenate([indices[q].astype(np.int64), start + np.arange(len(sims))])
+            all_sims = np.concatenate([1.0 - distances[q], sims])
+            order = np.argsort(-all_sims, kind="stable")[:k]
+            results.append(positions[order])
+        return results
+
+
+class TopicRetriever:
+    """Embeddings of a PostStore's posts and of profile topics, and topical candidates per profile.
+
+    cache_dir (None: no disk cache) keeps post vectors across runs, keyed by post_id and model.
+    """
+
+    def __init__(self, store, embedder=None, cache_dir=EMBEDDING_CACHE_DIR, index=None):
+        self.store = store
+        self.embedder = embedder or PostEmbedder()
+        self.cache = EmbeddingCache(cache_dir, self.embedder.key, self.embedder.dim) if cache_dir else None
+        self.index = index or TopicIndex(self.embedder.dim)
+        self._keywords = {}  # keyword -> unit vector
+
+    def sync(self):
+        """Embed (or load from the cache) the posts released since the last call."""
+        posts = self.store.posts[len(self.index):]
+        if not posts:
+            return
+        ids = [post["post_id"] for post in posts]
+        missing = [post for post in posts if self.cache is None or post["post_id"] not in self.cache]
+        vectors = self.embedder.encode([post_text(post) for post in missing])
+        if self.cache is None:
+            self.index.add(vectors)
+            return
+        self.cache.put([post["post_id"] for post in missing], vectors)
+        self.index.add(self.cache.get(ids))
+
+    def topic_vector(self, topics):
+        """Unit vector of a {keyword: weight} topics dict: its keywords' embeddings, weighted."""
+        keywords = [k for k, w in topics.items() if w > 0]
+        if not keywords:
+            return np.zeros(self.embedder.dim, dtype=np.float32)
+        new = [k for k in keywords if k not in self._keywords]
+        for keyword, vector in zip(new, self.embedder.encode(new)):
+            self._keywords[keyword] = vector
+        weights = np.array([topics[k] for k in keywords], dtype=np.float32)
+        return unit_rows((weights @ np.stack([self._keywords[k] for k in keywords]))[None, :])[0]
+
+    def candidates(self, queries, k):
+        """Positions of the (about) k posts most similar to each query vector."""
+        self.sync()
+        return self.index.query(queries, k)
+
+    def similarities(self, query, positions):
+        """Cosine similarity of query to the posts at positions."""
+        return self.index.vectors[positions] @ query
+
+    def close(self):
+        if self.cache:
+            self.cache.close()
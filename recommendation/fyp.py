@@ -1,6 +1,13 @@
+from collections import deque
+import contextlib
 from datetime import datetime
 import numpy as np
 import string
+
+from recommendation.impressions import ImpressionStore
+from recommendation.post_store import epoch_micros, top_k_indices
+from recommendation.ranking_index import RankingIndex
+from recommendation.text import WORD_PATTERN, post_text
 def recommend_posts(
         posts,
         timestep_time,
@@ -57,3 +64,451 @@ def recommend_posts(
     # Sort and return top_k posts
     recommendations.sort(key=lambda x: x[1], reverse=True)
     return [p for p, s in recommendations[:top_k]]
+
+
+def rowwise_top_k(scores, k):
+    """Per row of scores, the indices of the k highest finite scores, highest first (ties: lower index)."""
+    rows, n = scores.shape
+    k = min(k, n)
+    if k <= 0 or rows == 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(rows)]
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(scores, part, axis=1)
+    top = np.take_along_axis(part, np.lexsort((part, -values), axis=-1), axis=1)
+    finite = np.isfinite(np.take_along_axis(scores, top, axis=1))
+    return [row[keep] for row, keep in zip(top, finite)]
+
+
+def pop_scores(store, positions):
+    """recommend_posts' weighted engagement (before log1p) of the posts at positions."""
+    counters = store.counters
+    return (counters["num_likes"][positions] * 2 + counters["num_comments"][positions] * 1.5
+            + counters["num_shares"][positions] * 2.5)
+
+
+def pool_normalize(arr, epsilon=1e-8):
+    """Scale arr to [0, 1] over a candidate pool; all zeros if it is (nearly) constant."""
+    if len(arr) == 0 or arr.max() - arr.min() < epsilon:
+        return np.zeros(len(arr))
+    return (arr - arr.min()) / (arr.max() - arr.min())
+
+
+class RecentSource:
+    """The size newest posts by creation time, from a creation order merged as posts are released."""
+    name = "recent"
+
+    def __init__(self, store, size=200):
+        self.store = store
+        self.size = size
+        self.created = np.empty(0, dtype=np.int64)  # creation times, ascending
+        self.order = np.empty(0, dtype=np.int64)  # the post at each of them
+
+    def refresh(self, timestep_time):
+        count, n = len(self.order), len(self.store)
+        if n > count:
+            added = np.arange(count, n, dtype=np.int64)
+            created = self.store.created[added]
+            order = np.argsort(created, kind="stable")
+            slots = np.searchsorted(self.created, created[order], side="right")
+            self.created = np.insert(self.created, slots, created[order])
+            self.order = np.insert(self.order, slots, added[order])
+
+    def candidates(self, recommender, rows):
+        pool = self.order[-self.size:]
+        return [pool] * len(rows)
+
+
+class TrendingSource:
+    """The size posts that gained the most engagement (recommend_posts' weighting) in the last window_hours.
+
+    Gains are read from the store's counter changes at each refresh and kept per post for
+    as long as they are in the window, so a refresh costs the posts engaged with, not the corpus.
+    """
+    name = "trending"
+
+    def __init__(self, store, size=200, window_hours=24.0):
+        self.store = store
+        self.size = size
+        self.window_hours = window_hours
+        self._changed = store.track_changes()
+        self._pop = np.zeros(0)  # engagement per position at the last refresh
+        self._history = deque()  # (time, positions, gains) per refresh, oldest first
+        self.gains = {}  # position -> engagement gained within the window
+
+    def refresh(self, timestep_time):
+        now = epoch_micros(timestep_time)
+        count, n = len(self._pop), len(self.store)
+        changed = np.fromiter(self._changed, dtype=np.int64)
+        self._changed.clear()
+        changed = changed[changed < count]  # released since the last refresh: their engagement so far is the baseline
+        if n > count:
+            self._pop = np.concatenate([self._pop, pop_scores(self.store, np.arange(count, n))])
+        if len(changed):
+            current = pop_scores(self.store, changed)
+            gains = current - self._pop[changed]
+            self._pop[changed] = current
+            gained = gains > 0
+            positions, gains = changed[gained].tolist(), gains[gained].tolist()
+            self._history.append((now, positions, gains))
+            for i, gain in zip(positions, gains):
+                self.gains[i] = self.gains.get(i, 0.0) + gain
+        horizon = now - self.window_hours * 3600e6
+        while self._history and self._history[0][0] <= horizon:
+            _, positions, gains = self._history.popleft()
+            for i, gain in zip(positions, gains):
+                remaining = self.gains[i] - gain
+                if remaining > 1e-9:
+                    self.gains[i] = remaining
+                else:
+                    del self.gains[i]
+
+    def velocity(self, positions):
+        """Engagement gained per hour over the window, for the posts at positions."""
+        return np.array([self.gains.get(i, 0.0) for i in positions.tolist()]) / self.window_hours
+
+    def candidates(self, recommender, rows):
+        positions = np.fromiter(self.gains, dtype=np.int64, count=len(self.gains))
+        gains = np.fromiter(self.gains.values(), dtype=float, count=len(self.gains))
+        pool = np.sort(positions[top_k_indices(gains, self.size)])
+        return [pool] * len(rows)
+
+
+class TopicalSource:
+    """Per profile class, the size posts closest to its topics: the ANN neighbours of its topic
+    embedding with a retriever, otherwise the newest posts containing any of its keywords."""
+    name = "topical"
+
+    def __init__(self, size=200):
+        self.size = size
+
+    def refresh(self, timestep_time):
+        pass
+
+    def candidates(self, recommender, rows):
+        if recommender.retriever:
+            return recommender.retriever.candidates(np.stack([recommender._class_vectors[row] for row in rows]),
+                                                    self.size)
+        recommender._sync_postings()
+        pools = []
+        for row in rows:
+            tails = [recommender._postings[k][-self.size:] for k in recommender._class_topics[row]]
+            pools.append(np.unique(np.concatenate(tails))[-self.size:] if tails else np.empty(0, dtype=np.int64))
+        return pools
+
+
+class UnseenSource:
+    """Per profile class, the size newest posts not yet shown to all of its online agents (walks the
+    recent order)."""
+    name = "unseen"
+
+    def __init__(self, recent, size=100):
+        self.recent = recent
+        self.size = size
+
+    def refresh(self, timestep_time):
+        pass
+
+    def candidates(self, recommender, rows):
+        order = self.recent.order
+        impressions = recommender.impressions
+        pools = []
+        for row in rows:
+            online = recommender._online.get(row, [])
+            end = len(order)
+            found, count = [], 0
+            while end > 0 and count < self.size:
+                block = order[max(0, end - 2 * self.size):end][::-1]
+                end -= len(block)
+                if impressions is not None and online:
+                    block = block[~recommender._was_shown(online, block).all(axis=0)]
+                found.append(block)
+                count += len(block)
+            pools.append(np.concatenate(found)[:self.size] if found else np.empty(0, dtype=np.int64))
+        return pools
+
+
+class FeedPipeline:
+    """Two-stage feeds: bounded candidate pools from cheap sources, merged, then reranked.
+
+    Each source keeps its own index and returns at most its size posts per profile class;
+    the pools are merged (deduplicated) and only those few hundred candidates are scored:
+
+        weight_recency * recency + weight_popularity * log1p(engagement)
+        + weight_trending * engagement velocity + weight_topic * topic affinity
+
+    each term normalized to [0, 1] over the candidates. So a class's feed costs about the
+    same however large the corpus grows. With span (a function of a stage name returning a
+    context manager, e.g. engine.telemetry.span), every stage is timed under it
+    ("candidates.<source>", "merge", "rerank").
+    """
+
+    def __init__(self, store, sources=None, weight_trending=0.3, pool_size=200, trending_window_hours=24.0,
+                 span=None):
+        self.store = store
+        self.weight_trending = weight_trending
+        self.span = span or (lambda stage: contextlib.nullcontext())
+        if sources is None:
+            recent = RecentSource(store, pool_size)
+            sources = [recent, TrendingSource(store, pool_size, trending_window_hours), TopicalSource(pool_size),
+                       UnseenSource(recent, pool_size // 2)]
+        self.sources = sources
+        self.trending = next((source for source in sources if isinstance(source, TrendingSource)), None)
+
+    def top_k(self, recommender, rows, timestep_time, depth=None):
+        """Per class row, the positions of its depth (default top_k) best candidates, best first."""
+        pools = []
+        for source in self.sources:
+            with self.span(f"candidates.{source.name}"):
+                source.refresh(timestep_time)
+                pools.append(source.candidates(recommender, rows))
+        with self.span("merge"):
+            merged = [np.unique(np.concatenate([pool[r] for pool in pools])) for r in range(len(rows))]
+        with self.span("rerank"):
+            return [self._rerank(recommender, row, positions, timestep_time, depth or recommender.top_k)
+                    for row, positions in zip(rows, merged)]
+
+    def _rerank(self, recommender, row, positions, timestep_time, depth):
+        hours_old = (epoch_micros(timestep_time) - self.store.created[positions]) / 1e6 / 3600.0
+        recency = np.exp(-np.log(2) * hours_old / recommender.recency_half_life_hours)
+        scores = (recommender.weight_recency * pool_normalize(recency)
+                  + recommender.weight_popularity * pool_normalize(np.log1p(pop_scores(self.store, positions))))
+        if self.weight_trending and self.trending:
+            scores += self.weight_trending * pool_normalize(self.trending.velocity(positions))
+        if recommender.weight_topic:
+            scores += recommender.weight_topic * recommender._candidate_topic(row, positions)
+        return positions[np.lexsort((positions, -scores))[:depth]]
+
+
+class FeedRecommender:
+    """Feeds for every online agent of a timestep, from one scoring pass over a PostStore.
+
+    The recommend_posts score is computed once for all posts. Personal terms are added as a
+    (profile classes x posts) matrix:
+    - weight_topic * the share of the class's topic weight whose keywords appear in the post
+      (the surrogate's topic overlap)
+    Agents of one profile class share a feed (the same list). With exclude_seen, every agent
+    is then shown the best posts of its class's ranking that it hasn't been shown before, as
+    recorded in impressions (an ImpressionStore; agents whose feeds come out the same still
+    share one list); the ranking is taken deeper for classes where that runs short. With
+    neither, every agent gets the recommend_posts feed.
+
+    class_key(agent) names the agent's profile class (e.g. engine.profile_classes.profile_class_key);
+    by default every agent is a class of its own.
+
+    agents, if given, are all the agents that may come online; their topic keywords are
+    indexed up front so new posts are tokenized once. With incremental, the global feed comes
+    from a RankingIndex kept up to date from the store's changes instead of rescoring every post.
+
+    With a retriever (embeddings.TopicRetriever), the topic term is instead the cosine
+    similarity of the post's embedding to the class's topic embedding, and each class only
+    scores a bounded pool: its n_candidates nearest posts (ANN) plus the n_candidates best by
+    the global score, so the cost per class doesn't grow with the corpus.
+
+    With a pipeline (FeedPipeline), personal feeds are instead built from its bounded
+    candidate pools and reranked there, without scoring the whole corpus at all.
+    """
+
+    def __init__(self, store, top_k=20, weight_recency=0.7, weight_popularity=0.3, recency_half_life_hours=5.0,
+                 weight_topic=0.0, exclude_seen=False, agents=(), incremental=False, retriever=None,
+                 n_candidates=200, pipeline=None, impressions=None, class_key=None):
+        self.store = store
+        self.class_key = class_key or (lambda agent: agent["id"])
+        self.top_k = top_k
+        self.weight_recency = weight_recency
+        self.weight_popularity = weight_popularity
+        self.recency_half_life_hours = recency_half_life_hours
+        self.weight_topic = weight_topic
+        self.exclude_seen = exclude_seen
+        self.retriever = retriever
+        self.n_candidates = n_candidates
+        self.pipeline = pipeline
+        self.impressions = None
+        if exclude_seen:
+            self.impressions = impressions if impressions is not None else ImpressionStore()
+        self._class_index = {}  # profile class key -> row
+        self._agent_rows = {}  # agent id -> row
+        self._class_topics = []  # row -> {keyword: weight / total weight}
+        self._class_vectors = []  # row -> topic embedding (with a retriever)
+        self._online = {}  # row -> ids of its agents online in the current feeds() call
+        self._postings = {}  # keyword -> positions of posts containing it (int64 array)
+        self._indexed = 0  # posts tokenized so far
+        self._ordinals = np.empty(0, dtype=np.int64)  # position -> ordinal in impressions
+        self.ranking = None
+        if incremental:
+            self.ranking = RankingIndex(store, weight_recency, weight_popularity, recency_half_life_hours)
+        for agent in agents if retriever is None else ():
+            self._add_keywords(self._topics(agent))
+
+    @property
+    def personalized(self):
+        return self.weight_topic > 0 or self.exclude_seen or self.pipeline is not None
+
+    def feed(self, timestep_time):
+        """The global (recommend_posts) feed."""
+        if self.ranking:
+            return self.ranking.recommend(timestep_time, self.top_k)
+        return self.store.recommend(timestep_time, self.top_k, self.weight_recency, self.weight_popularity,
+                                    self.recency_half_life_hours)
+
+    def feeds(self, agents, timestep_time):
+        """{agent id: feed} for agents; agents of the same profile class (and, with exclude_seen,
+        the same feed after leaving out what they were shown) share one list."""
+        if not self.personalized:
+            feed = self.feed(timestep_time)
+            return {agent["id"]: feed for agent in agents}
+        agent_rows = [self._class_row(agent) for agent in agents]
+        self._online = {}
+        for agent, row in zip(agents, agent_rows):
+            self._online.setdefault(row, []).append(agent["id"])
+        if not len(self.store):
+            empty = {row: [] for row in self._online}
+            return {agent["id"]: empty[row] for agent, row in zip(agents, agent_rows)}
+        feeds = {}
+        scores = None
+        pending = sorted(self._online)
+        depth = self.top_k if self.impressions is None else 2 * self.top_k  # room for posts already shown
+        shown = {}  # agent id -> positions of its feed
+        while pending:
+            if self.pipeline:
+                top = self.pipeline.top_k(self, pending, timestep_time, depth)
+            else:
+                if scores is None:
+                    scores = self.store.scores(timestep_time, self.weight_recency, self.weight_popularity,
+                                               self.recency_half_life_hours)
+                top = (self._retrieved_top_k(pending, scores, depth) if self.retriever
+                       else self._dense_top_k(pending, scores, depth))
+            deeper = []
+            for row, positions in zip(pending, top):
+                if self.impressions is None:
+                    feed = [self.store.posts[i] for i in positions.tolist()]
+                    feeds.update((agent_id, feed) for agent_id in self._online[row])
+                    continue
+                unseen = self._unseen(self._online[row], positions, full=len(positions) == depth)
+                if unseen is None:
+                    deeper.append(row)
+                    continue
+                shared = {}  # identical feeds of one class stay one list
+                for agent_id, agent_positions in unseen.items():
+                    key = agent_positions.tobytes()
+                    if key not in shared:
+                        shared[key] = [self.store.posts[i] for i in agent_positions.tolist()]
+                    feeds[agent_id] = shared[key]
+                shown.update(unseen)
+            pending, depth = deeper, depth * 4
+        for agent_id, positions in shown.items():
+            self.impressions.add(agent_id, self._impression_ordinals(positions))
+        return {agent["id"]: feeds[agent["id"]] for agent in agents}
+
+    def _unseen(self, agent_ids, positions, full):
+        """{agent id: the first top_k of positions it wasn't shown yet}, or None if that leaves one of
+        them short while positions is a full ranking (so a deeper one has more)."""
+        was_shown = self._was_shown(agent_ids, positions)
+        unseen = {}
+        for agent_id, seen in zip(agent_ids, was_shown):
+            unseen[agent_id] = positions[~seen][:self.top_k]
+            if full and len(unseen[agent_id]) < self.top_k:
+                return None
+        return unseen
+
+    def _impression_ordinals(self, positions):
+        """The impressions' ordinals (by post_id, stable across runs) of the posts at positions."""
+        if len(self._ordinals) < len(self.store):
+            released = self.store.posts[len(self._ordinals):]
+            self._ordinals = np.concatenate([self._ordinals,
+                                             self.impressions.ordinals([post["post_id"] for post in released])])
+        return self._ordinals[positions]
+
+    def _was_shown(self, agent_ids, positions):
+        """(agents x positions) boolean matrix from impressions."""
+        return self.impressions.mask(agent_ids, self._impression_ordinals(positions))
+
+    def _dense_top_k(self, rows, scores, depth):
+        """Per class row, the top depth positions over a (classes x posts) score matrix."""
+        scores = np.repeat(scores[None, :], len(rows), axis=0)
+        if self.weight_topic:
+            scores += self.weight_topic * self._topic_overlap(rows)
+        return rowwise_top_k(scores, depth)
+
+    def _retrieved_top_k(self, rows, scores, depth):
+        """Per class row, the top depth positions among its topical and global candidates."""
+        n = self.n_candidates + depth - self.top_k
+        pool = top_k_indices(scores, n)
+        queries = np.stack([self._class_vectors[row] for row in rows])
+        top = []
+        for row, query, nearest in zip(rows, queries, self.retriever.candidates(queries, n)):
+            positions = np.union1d(pool, nearest)
+            combined = scores[positions] + self.weight_topic * self.retriever.similarities(query, positions)
+            top.append(positions[np.lexsort((positions, -combined))[:depth]])
+        return top
+
+    @staticmethod
+    def _topics(agent):
+        topics = agent.get("topics") or {}
+        if not isinstance(topics, dict):
+            topics = {k: 1.0 for k in topics}
+        return {k.lower(): float(w) for k, w in topics.items()}
+
+    def _add_keywords(self, keywords):
+        new = {k for k in keywords if k not in self._postings}
+        for keyword in new:
+            self._postings[keyword] = np.empty(0, dtype=np.int64)
+        if new and self._indexed:  # a keyword first seen now: find it in the posts indexed before
+            self._add_postings(0, self._indexed, new)
+
+    def _class_row(self, agent):
+        row = self._agent_rows.get(agent["id"])
+        if row is not None:
+            return row
+        key = self.class_key(agent)
+        row = self._class_index.get(key)
+        if row is None:
+            row = self._class_index[key] = len(self._class_topics)
+            topics = self._topics(agent)
+            if self.retriever:
+                self._class_vectors.append(self.retriever.topic_vector(topics))
+            else:
+                self._add_keywords(topics)
+            total = sum(topics.values())
+            self._class_topics.append({k: w / total for k, w in topics.items()} if total > 0 else {})
+        self._agent_rows[agent["id"]] = row
+        return row
+
+    def _add_postings(self, start, end, keywords):
+        found = {}
+        for i in range(start, end):
+            for word in keywords & set(WORD_PATTERN.findall(post_text(self.store.posts[i]).lower())):
+                found.setdefault(word, []).append(i)
+        for word, positions in found.items():
+            self._postings[word] = np.concatenate([self._postings[word], np.array(positions, dtype=np.int64)])
+
+    def _sync_postings(self):
+        if self._indexed < len(self.store):
+            self._add_postings(self._indexed, len(self.store), self._postings.keys())
+            self._indexed = len(self.store)
+
+    def _topic_overlap(self, rows):
+        """(len(rows), posts) matrix: per class, the share of its topic weight found in each post.
+
+        Each keyword's weight is scattered onto the posts in its postings, so the cost is the
+        postings' length rather than posts x keywords.
+        """
+        self._sync_postings()
+        overlap = np.zeros((len(rows), len(self.store)))
+        for r, row in enumerate(rows):
+            for keyword in sorted(self._class_topics[row]):
+                overlap[r, self._postings[keyword]] += self._class_topics[row][keyword]
+        return overlap
+
+    def _candidate_topic(self, row, positions):
+        """Topic affinity of class row to the posts at positions (sorted): cosine similarity with a
+        retriever, otherwise the topic overlap."""
+        if self.retriever:
+            return self.retriever.similarities(self._class_vectors[row], positions)
+        self._sync_postings()
+        overlap = np.zeros(len(positions))
+        for keyword, weight in self._class_topics[row].items():
+            postings = self._postings[keyword]
+            if len(postings):
+                found = np.minimum(np.searchsorted(postings, positions), len(postings) - 1)
+                overlap += weight * (postings[found] == positions)
+        return overlap
@@ -0,0 +1,204 @@
+"""Which posts each agent has been shown, compact enough for 43k agents x tens of thousands of posts.
+
+Posts are identified by a dense ordinal the store hands out per post_id (ordinals()), in the
+order it first sees them. The post_id of every ordinal is saved with the store: PostStore
+positions restart from zero in every run, so a continued run maps its posts to ordinals by
+post_id rather than by position.
+
+An agent's set is stored roaring-style: ordinals are split by their high 16 bits into
+containers, and each container is either a sorted uint16 array (up to ARRAY_LIMIT entries,
+2 bytes each) or a 65536-bit bitmap (8 KB) once it is denser than that. A typical agent,
+shown a few hundred posts, costs a few hundred bytes; a dense bitset per agent would cost
+n_posts / 8 bytes each.
+
+Membership is a bitmap lookup or a binary search over at most ARRAY_LIMIT entries, and
+mask() answers it for a whole (agents x posts) block at once, for batched recommendation.
+save()/load() write and read the whole store as one .npz, atomically.
+"""
+import os
+import sys
+
+import numpy as np
+
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+ARRAY_LIMIT = 4096  # above this many entries a container becomes a bitmap (same 8 KB)
+BITMAP_WORDS = CONTAINER_SIZE // 64
+
+
+def _array_to_bitmap(values):
+    bitmap = np.zeros(BITMAP_WORDS, dtype=np.uint64)
+    values = values.astype(np.int64)
+    np.bitwise_or.at(bitmap, values >> 6, np.left_shift(np.uint64(1), (values & 63).astype(np.uint64)))
+    return bitmap
+
+
+def _bitmap_contains(bitmap, values):
+    values = values.astype(np.int64)
+    return (bitmap[values >> 6] >> (values & 63).astype(np.uint64)) & np.uint64(1) == 1
+
+
+def _bitmap_count(bitmap):
+    return int(np.unpackbits(bitmap.view(np.uint8)).sum())
+
+
+class ImpressionStore:
+    """agent id -> set of post ordinals, in roaring-style containers."""
+
+    def __init__(self):
+        self._agents = {}  # agent id -> {high bits: uint16 array (sorted) or uint64 bitmap}
+        self.post_ids = []  # ordinal -> post_id
+        self._ordinals = {}  # post_id -> ordinal
+
+    def ordinals(self, post_ids):
+        """int64 array: the ordinal of each post_id; post_ids not seen before get the next free ones."""
+        ordinals = np.empty(len(post_ids), dtype=np.int64)
+        for i, post_id in enumerate(post_ids):
+            ordinal = self._ordinals.get(post_id)
+            if ordinal is None:
+                ordinal = self._ordinals[post_id] = len(self.post_ids)
+                self.post_ids.append(post_id)
+            ordinals[i] = ordinal
+        return ordinals
+
+    def __len__(self):
+        """Impressions stored, over all agents."""
+        return sum(self.count(agent_id) for agent_id in self._agents)
+
+    @property
+    def num_agents(self):
+        return len(self._agents)
+
+    def count(self, agent_id):
+        containers = self._agents.get(agent_id, {})
+        return sum(len(c) if c.dtype == np.uint16 else _bitmap_count(c) for c in containers.values())
+
+    def add(self, agent_id, ordinals):
+        """Record that agent_id was shown the posts at ordinals."""
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if not len(ordinals):
+            return
+        containers = self._agents.setdefault(agent_id, {})
+        highs = ordinals >> CONTAINER_BITS
+        if highs.min() == highs.max():  # the usual case: a feed of recent posts
+            chunks = [ordinals]
+        else:
+            ordinals = np.sort(ordinals)
+            chunks = np.split(ordinals, np.flatnonzero(np.diff(ordinals >> CONTAINER_BITS)) + 1)
+        for chunk in chunks:
+            high = int(chunk[0] >> CONTAINER_BITS)
+            low = (chunk & (CONTAINER_SIZE - 1)).astype(np.uint16)
+            container = containers.get(high)
+            if container is None:
+                container = np.unique(low)
+            elif container.dtype == np.uint16:
+                container = np.unique(np.concatenate([container, low]))
+            else:
+                container |= _array_to_bitmap(low)
+            if container.dtype == np.uint16 and len(container) > ARRAY_LIMIT:
+                container = _array_to_bitmap(container)
+            containers[high] = container
+
+    def contains(self, agent_id, ordinal):
+        container = self._agents.get(agent_id, {}).get(ordinal >> CONTAINER_BITS)
+        if container is None:
+            return False
+        low = ordinal & (CONTAINER_SIZE - 1)
+        if container.dtype == np.uint16:
+            i = np.searchsorted(container, low)
+            return bool(i < len(container) and container[i] == low)
+        return bool(int(container[low >> 6]) >> (low & 63) & 1)
+
+    def contains_many(self, agent_id, ordinals):
+        """Boolean mask over ordinals (an int array): which of them agent_id was shown."""
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        found = np.zeros(len(ordinals), dtype=bool)
+        containers = self._agents.get(agent_id)
+        if not containers or not len(ordinals):
+            return found
+        highs = ordinals >> CONTAINER_BITS
+        lows = ordinals & (CONTAINER_SIZE - 1)
+        for high in np.unique(highs).tolist():
+            container = containers.get(high)
+            if container is None:
+                continue
+            selected = highs == high
+            if container.dtype == np.uint16:
+                i = np.minimum(np.searchsorted(container, lows[selected]), len(container) - 1)
+                found[selected] = container[i] == lows[selected]
+            else:
+                found[selected] = _bitmap_contains(container, lows[selected])
+        return found
+
+    def mask(self, agent_ids, ordinals):
+        """(len(agent_ids), len(ordinals)) boolean matrix: which agent was shown which post."""
+        return np.array([self.contains_many(agent_id, ordinals) for agent_id in agent_ids],
+                        dtype=bool).reshape(len(agent_ids), len(ordinals))
+
+    def memory_report(self):
+        """Bytes held, split into container payload and per-agent/per-container overhead."""
+        arrays = bitmaps = payload = overhead = impressions = 0
+        overhead += sys.getsizeof(self._agents)
+        for containers in self._agents.values():
+            overhead += sys.getsizeof(containers)
+            for container in containers.values():
+                overhead += sys.getsizeof(container) - container.nbytes
+                payload += container.nbytes
+                if container.dtype == np.uint16:
+                    arrays += 1
+                    impressions += len(container)
+                else:
+                    bitmaps += 1
+                    impressions += _bitmap_count(container)
+        total = payload + overhead
+        return {"agents": len(self._agents), "impressions": impressions, "array_containers": arrays,
+                "bitmap_containers": bitmaps, "payload_bytes": payload, "overhead_bytes": overhead,
+                "total_bytes": total, "bytes_per_impression": total / impressions if impressions else 0.0}
+
+    def save(self, path):
+        """Write the store to path (.npz), with the post_id of every ordinal, replacing it atomically."""
+        agent_ids = list(self._agents)
+        owners, highs, kinds, offsets = [], [], [], [0]
+        arrays, bitmaps = [], []
+        for a, agent_id in enumerate(agent_ids):
+            for high, container in self._agents[agent_id].items():
+                owners.append(a)
+                highs.append(high)
+                if container.dtype == np.uint16:
+                    kinds.append(0)
+                    arrays.append(container)
+                    offsets.append(offsets[-1] + len(container))
+                else:
+                    kinds.append(1)
+                    bitmaps.append(container)
+                    offsets.append(offsets[-1])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, agent_ids=np.array(agent_ids), post_ids=np.array(self.post_ids), owners=np.array(owners, dtype=np.int64),
+                     highs=np.array(highs, dtype=np.int64), kinds=np.array(kinds, dtype=np.uint8),
+                     offsets=np.array(offsets, dtype=np.int64),
+                     arrays=np.concatenate(arrays) if arrays else np.empty(0, dtype=np.uint16),
+                     bitmaps=np.stack(bitmaps) if bitmaps else np.empty((0, BITMAP_WORDS), dtype=np.uint64))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        store = cls()
+        with np.load(path) as data:
+            agent_ids = data["agent_ids"].tolist()
+            store.post_ids = data["post_ids"].tolist()
+            store._ordinals = {post_id: ordinal for ordinal, post_id in enumerate(store.post_ids)}
+            arrays, bitmaps, offsets = data["arrays"], data["bitmaps"], data["offsets"]
+            b = 0
+            for c, (owner, high, kind) in enumerate(zip(data["owners"].tolist(), data["highs"].tolist(),
+                                                        data["kinds"].tolist())):
+                containers = store._agents.setdefault(agent_ids[owner], {})
+                if kind == 0:
+                    containers[high] = arrays[offsets[c]:offsets[c + 1]].copy()
+                else:
+                    containers[high] = bitmaps[b].copy()
+                    b += 1
+        return store
@@ -0,0 +1,156 @@
+"""Released posts as NumPy columns, for scoring the For-You feed in one vectorized pass.
+
+recommend_posts (fyp.py) walks every post dict per call and re-parses its created_utc.
+A PostStore keeps, for the posts in release order, the engagement counters and the
+creation time (parsed once, as epoch microseconds) in arrays that grow by doubling, next
+to the post dicts themselves. The action reducer increments the counter columns in place
+(see engine.events.reduce_timestep), so scoring never reads the dicts.
+
+PostStore.recommend returns the same posts, in the same order, as recommend_posts, ties
+included: equal scores keep release order.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+COUNTER_FIELDS = ("num_likes", "num_comments", "num_shares", "num_dislikes")
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def epoch_micros(value):
+    """Microseconds since the epoch of a naive datetime or a created_utc string ("...Z" allowed)."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", ""))
+    return (value - EPOCH) // MICROSECOND
+
+
+def normalize(arr, epsilon=1e-8):
+    """Scale arr to [0, 1]; all zeros if it is (nearly) constant."""
+    min_v = arr.min()
+    max_v = arr.max()
+    if max_v - min_v < epsilon:
+        return np.zeros_like(arr)
+    return (arr - min_v) / (max_v - min_v)
+
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, highest first; ties go to the lower index (as a stable sort would).
+
+    argpartition finds the k-th highest score, so only the candidates at or above it are sorted.
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        candidates = np.arange(n)
+    else:
+        kth = scores[np.argpartition(scores, n - k)[n - k]]
+        candidates = np.flatnonzero(scores >= kth)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+class PostStore:
+    """Post dicts in release order plus their counters and creation times as columns.
+
+    posts and index (post_id -> position) may be shared with code that expects the plain
+    list; counters changed on the dicts behind the store's back need a sync(). Consumers that
+    keep their own index over the counters get the positions that changed through
+    track_changes() (see ranking_index.RankingIndex).
+    """
+
+    def __init__(self, posts=(), capacity=1024):
+        self.posts = []
+        self.index = {}
+        self._capacity = max(1, capacity)
+        self.counters = {field: np.zeros(self._capacity, dtype=np.int64) for field in COUNTER_FIELDS}
+        self.created = np.zeros(self._capacity, dtype=np.int64)
+        self._watchers = []  # one set of changed positions per track_changes() consumer
+        self.extend(posts)
+
+    def __len__(self):
+        return len(self.posts)
+
+    def _grow(self, size):
+        if size <= self._capacity:
+            return
+        while self._capacity < size:
+            self._capacity *= 2
+        for field, column in self.counters.items():
+            self.counters[field] = np.resize(column, self._capacity)
+        self.created = np.resize(self.created, self._capacity)
+
+    def add(self, post):
+        """Append a newly released post."""
+        i = len(self.posts)
+        self._grow(i + 1)
+        self.posts.append(post)
+        self.index[post["post_id"]] = i
+        for field, column in self.counters.items():
+            column[i] = post.get(field, 0) or 0
+        self.created[i] = epoch_micros(post["created_utc"])
+
+    def extend(self, posts):
+        for post in posts:
+            self.add(post)
+
+    def increment(self, positions, fields, counts):
+        """Add counts[j] to counter fields[j] of the post at positions[j] (arrays, or scalars for fields).
+
+        Only the columns change; the reducer updates the dicts itself.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        if self._watchers:
+            changed = positions.tolist()
+            for watcher in self._watchers:
+                watcher.update(changed)
+        if isinstance(fields, str):
+            np.add.at(self.counters[fields], positions, counts)
+            return
+        fields = np.asarray(fields)
+        for field in np.unique(fields).tolist():
+            if field in self.counters:
+                selected = fields == field
+                np.add.at(self.counters[field], positions[selected], counts[selected])
+
+    def sync(self, positions=None):
+        """Re-read the counters of the posts at positions (default: all) from their dicts."""
+        positions = range(len(self.posts)) if positions is None else positions
+        for i in positions:
+            for watcher in self._watchers:
+                watcher.add(i)
+            post = self.posts[i]
+            for field, column in self.counters.items():
+                column[i] = post.get(field, 0) or 0
+
+    def track_changes(self):
+        """A set the store adds the position of every counter change to, from now on; the caller
+        empties it as it catches up."""
+        watcher = set()
+        self._watchers.append(watcher)
+        return watcher
+
+    def column(self, field):
+        """The live part of a counter column (a view; don't keep it across add())."""
+        return self.counters[field][:len(self.posts)]
+
+    def scores(self, timestep_time, weight_recency=0.7, weight_popularity=0.3, recency_half_life_hours=5.0,
+               epsilon=1e-8):
+        """recommend_posts' score for every post, as an array in release order."""
+        n = len(self.posts)
+        pop_score = self.column("num_likes") * 2 + self.column("num_comments") * 1.5 + self.column("num_shares") * 2.5
+        raw_popularity = np.log1p(pop_score)
+        hours_old = (epoch_micros(timestep_time) - self.created[:n]) / 1e6 / 3600.0
+        raw_recency = np.exp(-np.log(2) * hours_old / recency_half_life_hours)
+        return (weight_recency * normalize(raw_recency, epsilon)
+                + weight_popularity * normalize(raw_popularity, epsilon))
+
+    def recommend(self, timestep_time, top_k=20, weight_recency=0.7, weight_popularity=0.3,
+                  recency_half_life_hours=5.0, epsilon=1e-8):
+        """Same feed as recommend_posts(store.posts, ...)."""
+        if not self.posts:
+            return []
+        scores = self.scores(timestep_time, weight_recency, weight_popularity, recency_half_life_hours, epsilon)
+        return [self.posts[i] for i in top_k_indices(scores, top_k).tolist()]
@@ -0,0 +1,141 @@
+"""Incremental top-k index over a PostStore, for feed refreshes that don't rescore every post.
+
+The recommend_posts score of a post is
+
+    weight_recency * norm(recency(created)) + weight_popularity * norm(log1p(pop_score))
+
+with both terms min-max normalized over all released posts. Both raw terms are monotone in
+one stored key: recency decays with age at the same rate for every post, so ranking by
+recency is ranking by creation time, whatever the current time; popularity is ranked by
+pop_score. The index keeps the posts sorted both ways:
+- newly released posts are merged into both orders
+- posts whose counters changed are moved in the popularity order only; creation keys never
+  change, so recency decay costs nothing between refreshes. The min and max each
+  normalization needs are the ends of the orders.
+- top k is found with the threshold algorithm: walk both orders from the top in growing
+  blocks, score the posts met exactly, and stop once the k-th best score beats the best
+  score any post not yet met could have (the next creation time's recency plus the next
+  pop_score's popularity). Typically a few blocks of k.
+
+The orders are sorted int64 arrays updated with searchsorted/insert/delete, one vectorized
+merge per refresh rather than a Python-level tree operation per moved post. pop_score * 2
+is an integer (4 likes + 3 comments + 5 shares), so (pop_score, position) packs into one key.
+
+The scores are computed with the same NumPy expressions as PostStore.scores, so the feed is
+exactly PostStore.recommend's (and recommend_posts'), ties included.
+"""
+import numpy as np
+
+from recommendation.post_store import epoch_micros
+
+POSITION_BITS = 32
+
+
+class RankingIndex:
+    """The recommend_posts feed of a PostStore, kept up to date from the store's changes.
+
+    refresh() (called by recommend) indexes newly added posts and re-files the posts whose
+    counters changed since (see PostStore.track_changes).
+    """
+
+    def __init__(self, store, weight_recency=0.7, weight_popularity=0.3, recency_half_life_hours=5.0,
+                 epsilon=1e-8):
+        self.store = store
+        self.weight_recency = weight_recency
+        self.weight_popularity = weight_popularity
+        self.recency_half_life_hours = recency_half_life_hours
+        self.epsilon = epsilon
+        self._changed = store.track_changes()
+        self._created = np.empty(0, dtype=np.int64)  # creation times, ascending
+        self._created_positions = np.empty(0, dtype=np.int64)  # the post at each of them
+        self._popularity = np.empty(0, dtype=np.int64)  # pop_score * 2 << POSITION_BITS | position, ascending
+        self._keys = np.empty(0, dtype=np.int64)  # position -> its key in _popularity
+        self.refresh()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _counters(self, positions):
+        return (self.store.counters[field][positions] for field in ("num_likes", "num_comments", "num_shares"))
+
+    def _pop_scores(self, positions):
+        likes, comments, shares = self._counters(positions)
+        return likes * 2 + comments * 1.5 + shares * 2.5
+
+    def _pop_keys(self, positions):
+        likes, comments, shares = self._counters(positions)
+        return (likes * 4 + comments * 3 + shares * 5) << POSITION_BITS | positions
+
+    @staticmethod
+    def _merge(keys, new_keys):
+        new_keys = np.sort(new_keys)
+        return np.insert(keys, np.searchsorted(keys, new_keys), new_keys)
+
+    def refresh(self):
+        """Index posts added to the store and re-file the posts whose counters changed."""
+        count = len(self._keys)
+        changed = np.fromiter(self._changed, dtype=np.int64)
+        self._changed.clear()
+        changed = changed[changed < count]  # posts added since the last refresh are indexed below
+        if len(changed):
+            new_keys = self._pop_keys(changed)
+            moved = new_keys != self._keys[changed]
+            changed, new_keys = changed[moved], new_keys[moved]
+            self._popularity = np.delete(self._popularity, np.searchsorted(self._popularity, self._keys[changed]))
+            self._popularity = self._merge(self._popularity, new_keys)
+            self._keys[changed] = new_keys
+
+        n = len(self.store)
+        if n > count:
+            added = np.arange(count, n, dtype=np.int64)
+            created = self.store.created[added]
+            order = np.argsort(created, kind="stable")  # ties stay in release order, after older posts
+            slots = np.searchsorted(self._created, created[order], side="right")
+            self._created = np.insert(self._created, slots, created[order])
+            self._created_positions = np.insert(self._created_positions, slots, added[order])
+            new_keys = self._pop_keys(added)
+            self._popularity = self._merge(self._popularity, new_keys)
+            self._keys = np.concatenate([self._keys, new_keys])
+
+    def _scores(self, timestep_time, created, pop_scores):
+        """Scores of posts with these creation times and pop_scores (arrays)."""
+        now = epoch_micros(timestep_time)
+        pop_ends = (self._popularity[[0, -1]] >> POSITION_BITS) / 2
+
+        def recency(c):
+            hours_old = (now - c) / 1e6 / 3600.0
+            return np.exp(-np.log(2) * hours_old / self.recency_half_life_hours)
+
+        def norm(arr, ends):  # post_store.normalize, with min and max taken from the ends of an order
+            min_v, max_v = ends.min(), ends.max()
+            if max_v - min_v < self.epsilon:
+                return np.zeros_like(arr)
+            return (arr - min_v) / (max_v - min_v)
+
+        return (self.weight_recency * norm(recency(created), recency(self._created[[0, -1]]))
+                + self.weight_popularity * norm(np.log1p(pop_scores), np.log1p(pop_ends)))
+
+    def recommend(self, timestep_time, top_k=20):
+        """Same feed as store.recommend(timestep_time, top_k, <the index's weights>)."""
+        self.refresh()
+        n = len(self._keys)
+        if n == 0 or top_k <= 0:
+            return []
+        if self.weight_recency < 0 or self.weight_popularity < 0:  # the scores are no longer monotone in the keys
+            return self.store.recommend(timestep_time, top_k, self.weight_recency, self.weight_popularity,
+                                        self.recency_half_life_hours, self.epsilon)
+        met = min(n, 8 * top_k)  # entries walked from the top of each order
+        while True:
+            positions = np.union1d(self._created_positions[n - met:],
+                                   self._popularity[n - met:] & ((1 << POSITION_BITS) - 1))
+            scores = self._scores(timestep_time, self.store.created[positions], self._pop_scores(positions))
+            if met == n:
+                break
+            if len(positions) >= top_k:
+                threshold = self._scores(timestep_time, self._created[n - met - 1:n - met],
+                                         (self._popularity[n - met - 1:n - met] >> POSITION_BITS) / 2)[0]
+                if np.partition(scores, len(scores) - top_k)[len(scores) - top_k] > threshold:
+                    break
+            met = min(n, met * 4)
+        order = np.lexsort((positions, -scores))[:top_k]
+        return [self.store.posts[i] for i in positions[order].tolist()]
@@ -0,0 +1,8 @@
+"""Post text and its words, as matched against agents' topic keywords."""
+import re
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def post_text(post):
+    return (post.get("title") or "") + (post.get("post_text") or "")